@@ -0,0 +1,129 @@
+"""
+asyncio mode of the unified server (tcp_server.py --async).
+
+Both ports are served from a single event loop instead of a thread per
+connection, so thousands of feed subscribers and order senders fit in one
+process. All sessions stream from the shared pre-encoded feed, and each
+subscriber's socket buffer is capped: when a client reads slower than the feed, its session waits
+on drain() instead of queueing unbounded data in memory. uvloop is used when
+it is installed.
+"""
+import asyncio
+from replay import SEND, replay_steps
+from tcp_server import (DEFAULT_BACKLOG, LINGER_TIMEOUT, OrderSession, consume_orders, market_rows,
+                        negotiated_protocol, session_segments, wants_stamps)
+from wire_protocol import HANDSHAKE_TIMEOUT, clock_record, parse_hello
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Per-connection cap on data queued in the event loop before we wait for the client
+WRITE_BUFFER_HIGH_WATER = 256 * 1024
+
+
+async def read_hello_async(reader, timeout):
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    except (asyncio.TimeoutError, ConnectionError):
+        return None
+    return parse_hello(line)
+
+
+async def handle_csv_client_async(reader, writer, feed, replay_config, handshake_timeout, market=None):
+    """
+    Streams the shared feed to one subscriber, same wire format and pacing as handle_csv_client.
+    """
+    print(f"CSV Client connected from {writer.get_extra_info('peername')}")
+    writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH_WATER)
+    hello = await read_hello_async(reader, handshake_timeout)
+    protocol = negotiated_protocol(hello)
+    stamps = wants_stamps(hello)
+    try:
+        segments = session_segments(feed, hello, protocol)
+    except ValueError as e:
+        print(f"Refusing CSV client: {e}")
+        await close_gracefully_async(reader, writer)
+        return
+    if market is not None:
+        market.session_started()
+    try:
+        pacer = replay_config.new_pacer(segments)
+        on_rows = market_rows(market) if market is not None else None
+        for step, value in replay_steps(segments, protocol, pacer, replay_config.max_batch_rows, on_rows=on_rows):
+            if step == SEND:
+                if stamps:
+                    writer.write(clock_record(protocol))
+                writer.write(value)
+                await writer.drain()  # Returns immediately unless the client has fallen behind
+            else:
+                await asyncio.sleep(max(value, 0))  # Also yields to other sessions between batches
+    except Exception as e:  # As handle_csv_client: one line, and only this session ends
+        print(f"Error sending to CSV client: {e}")
+        writer.close()
+        return
+    finally:
+        if market is not None:
+            market.session_finished()
+    await close_gracefully_async(reader, writer)
+
+
+async def close_gracefully_async(reader, writer, timeout=LINGER_TIMEOUT):
+    """asyncio counterpart of tcp_server.close_gracefully."""
+    try:
+        writer.write_eof()
+        await asyncio.wait_for(_discard_until_eof(reader), timeout)
+    except (asyncio.TimeoutError, ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _discard_until_eof(reader):
+    while await reader.read(4096):
+        pass
+
+
+async def handle_order_client_async(reader, writer, engine):
+    """
+    Receives orders on one connection, same wire format and execution reports as handle_order_client.
+    """
+    print(f"Order Client connected from {writer.get_extra_info('peername')}")
+    session = OrderSession(engine, writer.write)  # Reports are queued on the transport, never block the loop
+    buffer = b""
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            buffer = consume_orders(buffer + data, session)
+            await writer.drain()
+    except Exception as e:
+        print(f"Error receiving order: {e}")
+    finally:
+        engine.cancel_all(session)
+        writer.close()
+
+
+async def serve(host, csv_port, order_port, feed, replay_config, engine,
+                handshake_timeout=HANDSHAKE_TIMEOUT, backlog=DEFAULT_BACKLOG, market=None):
+    csv_server = await asyncio.start_server(
+        lambda r, w: handle_csv_client_async(r, w, feed, replay_config, handshake_timeout, market),
+        host, csv_port, backlog=backlog, reuse_address=True)
+    print(f"CSV Stream Server listening on {host}:{csv_port}")
+    order_server = await asyncio.start_server(
+        lambda r, w: handle_order_client_async(r, w, engine), host, order_port, backlog=backlog, reuse_address=True)
+    print(f"Order Server listening on {host}:{order_port}")
+
+    async with csv_server, order_server:
+        await asyncio.gather(csv_server.serve_forever(), order_server.serve_forever())
+
+
+def run_async_server(host, csv_port, order_port, feed, replay_config, engine,
+                     handshake_timeout=HANDSHAKE_TIMEOUT, backlog=DEFAULT_BACKLOG, market=None):
+    main = serve(host, csv_port, order_port, feed, replay_config, engine, handshake_timeout, backlog, market)
+    if uvloop is not None:
+        uvloop.run(main)
+    else:
+        asyncio.run(main)
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Offline backtester.
+
+Replays one or more feed CSVs without the TCP server. The file is loaded into
+columnar NumPy arrays, all per-symbol moving averages, volume signals, sentiment
+and trade signals are computed in vectorized form, and only the capital/portfolio
+accounting (which depends on the order of fills) runs sequentially. The output
+ledger has the same columns and values as the streaming clients'
+trading_with_sentiment.csv.
+"""
+import argparse
+import csv
+import os
+import time
+from datetime import datetime
+import numpy as np
+from model_inference import BUY_THRESHOLD, N_FEATURES, SELL_THRESHOLD
+from order_book import BOOK_FEATURES, BOOK_IMBALANCE, BookBuilder
+from journal import LEDGER_FIELDS, TIMESTAMP_FORMAT
+from portfolio import PortfolioLedger
+from tick_store import load_feed as load_tick_stores
+from tree_model import default_model_path, load_model
+
+WAIT, BUY, SELL = 0, 1, 2
+SIGNAL_NAMES = np.array(["WAIT", "BUY", "SELL"])
+
+# Volume signal encoded the way feature_store.volume_factor feeds it to the model
+VOLUME_LOW, VOLUME_NORMAL, VOLUME_HIGH = -25, 0, 25
+
+
+def load_feed(files):
+    """
+    Read feed CSV file(s) into columnar arrays, concatenated in the order given
+    (the same order tcp_server streams them). Tick store directories are
+    mapped instead of parsed; they can't be mixed with CSV files.
+    """
+    stores = [f for f in files if os.path.isdir(f)]
+    if stores:
+        if len(stores) != len(files):
+            raise ValueError("Pass either feed CSV files or tick store directories, not both")
+        return load_tick_stores(stores)
+    symbols, prices, quantities, sides, news = [], [], [], [], []
+    order_ids, exchanges, actions = [], [], []  # Order events, for the L2 book inputs
+    for f in files:
+        with open(f, 'r', newline='') as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, [])
+            if not header:
+                continue
+            i_symbol, i_price, i_quantity = header.index('Symbol'), header.index('Price'), header.index('Quantity')
+            i_side = header.index('Side') if 'Side' in header else None
+            i_news = header.index('News') if 'News' in header else None
+            i_order_id = header.index('OrderID') if 'OrderID' in header else None
+            i_exchange = header.index('Exchange') if 'Exchange' in header else None
+            i_action = header.index('Action') if 'Action' in header else None
+            for row in reader:
+                symbols.append(row[i_symbol])
+                prices.append(row[i_price])
+                quantities.append(row[i_quantity])
+                sides.append(row[i_side] if i_side is not None else 'B')
+                news.append(row[i_news] if i_news is not None else '50')
+                order_ids.append(row[i_order_id] if i_order_id is not None else '')
+                exchanges.append(row[i_exchange] if i_exchange is not None else '')
+                actions.append(row[i_action] if i_action is not None else 'A')
+    names, codes = np.unique(np.array(symbols), return_inverse=True)
+    return {
+        'symbol_names': names,
+        'symbol': codes.astype(np.int64),
+        'price': np.array(prices, dtype=np.float64),
+        'quantity': np.array(quantities, dtype=np.int64),
+        'side': np.array(sides),
+        'news': np.array(news),
+        'order_id': order_ids,
+        'exchange': exchanges,
+        'action': actions,
+    }
+
+
+def round2(values):
+    """
+    Vectorized equivalent of Python's round(x, 2).
+    np.round can disagree with round() right at a half-cent tie, so those
+    few values are rounded by Python instead.
+    """
+    rounded = np.round(values, 2)
+    cents = np.abs(values * 100)
+    ties = np.nonzero(np.abs(cents - np.floor(cents) - 0.5) < 1e-6)[0]
+    if len(ties):
+        rounded[ties] = [round(v, 2) for v in values[ties].tolist()]
+    return rounded
+
+
+def _group_starts(sorted_codes):
+    """Index of the first row of each row's group, for an array sorted by group."""
+    n = len(sorted_codes)
+    boundary = np.ones(n, dtype=bool)
+    boundary[1:] = sorted_codes[1:] != sorted_codes[:-1]
+    return np.maximum.accumulate(np.where(boundary, np.arange(n), 0))
+
+
+def rolling_mean(values, sorted_codes, window_size):
+    """
+    Per-group moving average over the last `window_size` values, NaN until a
+    group has a full window. `values` must already be sorted by group.
+    The window is summed oldest first, exactly like sum(history[-window_size:]).
+    """
+    n = len(values)
+    out = np.full(n, np.nan)
+    if n == 0:
+        return out
+    starts = _group_starts(sorted_codes)
+    idx = np.nonzero(np.arange(n) - starts >= window_size - 1)[0]
+    total = values[idx - (window_size - 1)]
+    for lag in range(window_size - 2, -1, -1):
+        total = total + values[idx - lag]
+    out[idx] = round2(total / window_size)
+    return out
+
+
+def _last_in_group(mask, starts):
+    """For each row, the index of the latest row <= it in the same group where mask is set, or -1."""
+    last = np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+    return np.where(last >= starts, last, -1)
+
+
+def _news_values(news):
+    """Vectorized news parsing: (sentiment news value, model news feature)."""
+    labels, inverse = np.unique(news, return_inverse=True)
+    sentiment_news = []
+    feature_news = []
+    for label in labels.tolist():
+        try:
+            news_value = int(label)
+        except ValueError:
+            news_value = 50  # Default to neutral if conversion fails
+        news_value = 0 if news_value == 100 else news_value
+        news_value = 100 if news_value == 0 else news_value
+        sentiment_news.append(news_value)
+        try:
+            feature_news.append(float(label))
+        except ValueError:
+            feature_news.append(np.nan)
+    return np.array(sentiment_news)[inverse], np.array(feature_news)[inverse]
+
+
+def book_features(feed):
+    """
+    BOOK_FEATURES for every tick, as the clients' BookBuilder sees them right
+    after applying that tick. The books are path dependent, so this is one
+    sequential pass rather than a vectorized one.
+    """
+    books = BookBuilder()
+    names = feed['symbol_names']
+    out = np.zeros((len(feed['symbol']), len(BOOK_FEATURES)))
+    for i, (code, order_id, exchange, action, side, price, quantity) in enumerate(zip(
+            feed['symbol'].tolist(), feed['order_id'], feed['exchange'], feed['action'],
+            feed['side'].tolist(), feed['price'].tolist(), feed['quantity'].tolist())):
+        symbol = names[code]
+        books.update({"Symbol": symbol, "OrderID": order_id, "Exchange": exchange, "Action": action,
+                      "Side": side, "Price": price, "Quantity": quantity})
+        out[i] = books.features(symbol)
+    return out
+
+
+def compute_indicators(feed, window_size=5, book_weight=0, with_book=False, high_volume=1.5, low_volume=0.5,
+                       book=None):
+    """
+    Vectorized version of the per-tick indicator block in FinanceClient.run:
+    price/quantity/buy/sell moving averages, volume signal, 3-tick trend and
+    sentiment. Missing moving averages are NaN. Order book inputs are only
+    computed when the sentiment (book_weight) or the model (with_book) uses them,
+    unless they are passed in already computed (book). Volume is HIGH above
+    high_volume x its MA and LOW below low_volume x, as in feature_store.volume_signal.
+    """
+    codes = feed['symbol']
+    price = feed['price']
+    quantity = feed['quantity']
+    n = len(codes)
+
+    order = np.argsort(codes, kind='stable')
+    s_codes = codes[order]
+    s_price = price[order]
+    s_quantity = quantity[order]
+    s_side = feed['side'][order]
+    starts = _group_starts(s_codes)
+
+    s_price_ma = rolling_mean(s_price, s_codes, window_size)
+    s_quantity_ma = rolling_mean(s_quantity, s_codes, window_size)
+
+    # Buy/sell volume MAs only advance on rows of that side and otherwise carry forward
+    side_ma = {}
+    for side in ("B", "S"):
+        mask = s_side == side
+        sub = np.nonzero(mask)[0]
+        ma_at_row = np.full(n, np.nan)
+        ma_at_row[sub] = rolling_mean(s_quantity[sub], s_codes[sub], window_size)
+        last = _last_in_group(mask, starts)
+        side_ma[side] = np.where(last >= 0, ma_at_row[np.maximum(last, 0)], np.nan)
+
+    # 3-tick trend
+    s_trend = np.zeros(n, dtype=np.int64)
+    pos = np.arange(n) - starts
+    idx = np.nonzero(pos >= 2)[0]
+    p0, p1, p2 = s_price[idx - 2], s_price[idx - 1], s_price[idx]
+    s_trend[idx] = np.where((p0 < p1) & (p1 < p2), 1, np.where((p0 > p1) & (p1 > p2), -1, 0))
+
+    def unsort(sorted_values):
+        out = np.empty_like(sorted_values)
+        out[order] = sorted_values
+        return out
+
+    price_ma = unsort(s_price_ma)
+    quantity_ma = unsort(s_quantity_ma)
+    buy_volume_ma = unsort(side_ma["B"])
+    sell_volume_ma = unsort(side_ma["S"])
+    trend = unsort(s_trend)
+
+    has_quantity_ma = ~np.isnan(quantity_ma)
+    volume_signal = np.full(n, VOLUME_NORMAL, dtype=np.int64)
+    volume_signal[has_quantity_ma & (quantity > quantity_ma * high_volume)] = VOLUME_HIGH
+    volume_signal[has_quantity_ma & (quantity < quantity_ma * low_volume)] = VOLUME_LOW
+
+    sentiment_news, feature_news = _news_values(feed['news'])
+
+    # Sentiment, summed in the same order as feature_store.sentiment
+    has_price_ma = ~np.isnan(price_ma)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_momentum = ((price / price_ma) - 1) * 100
+        use_ratio = ~np.isnan(buy_volume_ma) & ~np.isnan(sell_volume_ma) & (sell_volume_ma != 0)
+        volume_ratio_factor = np.where(use_ratio, (buy_volume_ma / sell_volume_ma - 1) * 25, 0.0)
+    raw = price_momentum + volume_signal + trend * 25 + (sentiment_news - 50) / 2 + volume_ratio_factor
+    if book is None and (book_weight or with_book):
+        book = book_features(feed)
+    if book_weight:
+        raw = raw + book[:, BOOK_IMBALANCE] * book_weight
+    sentiment = np.where(has_price_ma, round2(np.clip(raw, -100, 100)), 0.0)
+
+    return {
+        'price_ma': price_ma,
+        'quantity_ma': quantity_ma,
+        'buy_volume_ma': buy_volume_ma,
+        'sell_volume_ma': sell_volume_ma,
+        'volume_signal': volume_signal,
+        'trend': trend,
+        'news_feature': feature_news,
+        'sentiment': sentiment,
+        'book': book,
+        # Rows where feature_store.sentiment returns an int rather than a float
+        'sentiment_is_int': ~has_price_ma | (raw >= 100) | (raw <= -100),
+    }
+
+
+def ma_signals(feed, indicators):
+    """The moving-average rule from trading_client.FinanceClient.run."""
+    price = feed['price']
+    price_ma = indicators['price_ma']
+    volume_signal = indicators['volume_signal']
+    signals = np.full(len(price), WAIT, dtype=np.int8)
+    signals[(price > price_ma) & (volume_signal != VOLUME_LOW)] = BUY
+    signals[(price < price_ma) & (volume_signal != VOLUME_HIGH)] = SELL
+    return signals
+
+
+def model_features(feed, indicators):
+    """Feature matrix matching feature_store.model_inputs (what trade_xgboost scores), one row per tick."""
+    columns = [
+        feed['price'],
+        np.nan_to_num(indicators['price_ma'], nan=0.0),
+        indicators['volume_signal'],
+        indicators['news_feature'],
+        np.nan_to_num(indicators['buy_volume_ma'], nan=0.0),
+        np.nan_to_num(indicators['sell_volume_ma'], nan=0.0),
+    ]
+    if indicators['book'] is not None:
+        columns.extend(indicators['book'].T)
+    return np.column_stack(columns)
+
+
+def model_probabilities(feed, indicators, model):
+    """The model's probability of upward movement for every tick, scored in one batch."""
+    return model.inplace_predict(model_features(feed, indicators).astype(np.float32), validate_features=False)
+
+
+def threshold_signals(probabilities, buy_threshold=BUY_THRESHOLD, sell_threshold=SELL_THRESHOLD):
+    signals = np.full(len(probabilities), WAIT, dtype=np.int8)
+    signals[probabilities > buy_threshold] = BUY
+    signals[probabilities < sell_threshold] = SELL
+    return signals
+
+
+def xgboost_signals(feed, indicators, model):
+    """The XGBoost rule from trade_xgboost.FinanceClient.decide_trade_with_model, scored in one batch."""
+    return threshold_signals(model_probabilities(feed, indicators, model))
+
+
+def simulate(feed, indicators, signals, initial_capital, capital_floor=0.1, capital_cap=0.5):
+    """
+    Sequential capital/portfolio accounting from FinanceClient.run.
+
+    Only ticks with a BUY/SELL signal touch the loop; WAIT rows carry the
+    previous capital and per-symbol position forward.
+    Returns per-row (trade_quantity, portfolio, capital) plus final state,
+    including the PortfolioLedger (keyed by symbol code) marked at each
+    symbol's last price. A trade risks capital_floor + 0.4 x its sentiment
+    weight of the capital, at most capital_cap (10% to 50% in the clients).
+    """
+    codes = feed['symbol']
+    n = len(codes)
+    active = np.nonzero(signals != WAIT)[0]
+
+    ledger = PortfolioLedger(initial_capital)
+    fill = ledger.fill
+    position = ledger.position
+    trade_quantity = np.zeros(n, dtype=np.int64)
+    position_after = np.zeros(n, dtype=np.int64)
+
+    # The parts of calculate_trade_quantity that don't depend on capital
+    price = feed['price'][active]
+    sentiment_weight = np.abs(indicators['sentiment'][active]) / 100
+    max_capital_percent = np.minimum(capital_cap, capital_floor + (0.4 * sentiment_weight))
+    min_quantity = np.minimum(1, (10000 / price).astype(np.int64))
+
+    a_codes = codes[active].tolist()
+    a_prices = price.tolist()
+    a_weight = sentiment_weight.tolist()
+    a_percent = max_capital_percent.tolist()
+    a_min = min_quantity.tolist()
+    a_buy = (signals[active] == BUY).tolist()
+    a_quantity = [0] * len(active)
+    a_position = [0] * len(active)
+    a_capital = [0.0] * len(active)
+    first_fill = len(active)
+    for i in range(len(active)):
+        code = a_codes[i]
+        price = a_prices[i]
+        quantity = int(int(ledger.cash * a_percent[i] / price) * a_weight[i])
+        if quantity < a_min[i]:
+            quantity = a_min[i]
+        if a_buy[i]:
+            if ledger.cash < price * quantity and quantity < 10000:
+                quantity = 10000
+            if quantity > 0:
+                cost = price * quantity
+                if cost <= ledger.cash:
+                    fill(code, quantity, price)
+                    if first_fill > i:
+                        first_fill = i
+        else:
+            held = position(code)
+            if quantity > held:
+                quantity = held
+            if quantity > 0:
+                fill(code, -quantity, price)
+                if first_fill > i:
+                    first_fill = i
+        a_quantity[i] = quantity
+        a_position[i] = position(code)
+        a_capital[i] = ledger.cash
+
+    trade_quantity[active] = a_quantity
+    position_after[active] = a_position
+
+    # Capital after each active row, with the untouched initial capital kept as
+    # given (the streaming ledger prints an int capital until the first fill)
+    capital_steps = np.empty(len(active) + 1, dtype=object)
+    capital_steps[1:] = round2(np.array(a_capital, dtype=np.float64)).tolist()
+    capital_steps[:first_fill + 1] = round(initial_capital, 2)
+
+    # Carry capital forward globally and positions forward per symbol
+    is_active = np.zeros(n, dtype=bool)
+    is_active[active] = True
+    fill_number = np.cumsum(is_active)  # 0 before the first active row
+    capital = capital_steps[fill_number]
+
+    order = np.argsort(codes, kind='stable')
+    s_last = _last_in_group(is_active[order], _group_starts(codes[order]))
+    s_portfolio = np.where(s_last >= 0, position_after[order][np.maximum(s_last, 0)], 0)
+    portfolio = np.empty(n, dtype=np.int64)
+    portfolio[order] = s_portfolio
+
+    # Mark every symbol once at its last price in the feed
+    last_price = np.zeros(len(feed['symbol_names']))
+    last_price[codes] = feed['price']  # Later rows overwrite earlier ones
+    for code, price in enumerate(last_price.tolist()):
+        ledger.mark(code, price)
+    ledger.revalue()  # Drop the running totals' rounding once, at the end
+
+    return {
+        'trade_quantity': trade_quantity,
+        'portfolio': portfolio,
+        'capital': capital,
+        'available_capital': ledger.cash,
+        'positions': {name: position(code) for code, name in enumerate(feed['symbol_names'].tolist())},
+        'ledger': ledger,
+    }
+
+
+def nav_series(feed, result):
+    """
+    Portfolio value after every tick: capital plus each position at its
+    symbol's latest price. A tick only changes its own symbol's position and
+    price, so the market value is a cumulative sum of per-tick changes.
+    """
+    codes = feed['symbol']
+    price = feed['price']
+    position = result['portfolio']
+    order = np.argsort(codes, kind='stable')
+    s_value = position[order] * price[order]
+    s_previous = np.zeros(len(codes))
+    if len(codes):
+        same_symbol = codes[order][1:] == codes[order][:-1]
+        s_previous[1:] = np.where(same_symbol, s_value[:-1], 0.0)
+    change = np.empty(len(codes))
+    change[order] = s_value - s_previous
+    return result['capital'].astype(np.float64) + np.cumsum(change)
+
+
+def max_drawdown(nav):
+    """Largest fall from a running peak, as a fraction of that peak."""
+    if not len(nav):
+        return 0.0
+    peak = np.maximum.accumulate(nav)
+    return float(np.max((peak - nav) / peak))
+
+
+def portfolio_value(feed, result):
+    """Remaining positions marked at each symbol's last price in the feed."""
+    return result['ledger'].nav()
+
+
+def write_ledger(path, feed, indicators, signals, result, timestamp=None):
+    """Write the trading_with_sentiment.csv ledger in the streaming clients' format."""
+    if timestamp is None:
+        timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+    n = len(feed['symbol'])
+    sentiment = indicators['sentiment'].tolist()
+    for i in np.nonzero(indicators['sentiment_is_int'])[0].tolist():
+        sentiment[i] = int(sentiment[i])
+    price_ma = indicators['price_ma'].tolist()
+    price_ma = ['Calculating...' if ma != ma else ma for ma in price_ma]
+    columns = (
+        [timestamp] * n,
+        feed['symbol_names'][feed['symbol']].tolist(),
+        feed['price'].tolist(),
+        price_ma,
+        feed['quantity'].tolist(),
+        sentiment,
+        SIGNAL_NAMES[signals].tolist(),
+        result['trade_quantity'].tolist(),
+        result['portfolio'].tolist(),
+        result['capital'].tolist(),
+    )
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(LEDGER_FIELDS)
+        writer.writerows(zip(*columns))
+
+
+def run_backtest(files, strategy="ma", window_size=5, initial_capital=1000000,
+                 model_path=None, output_file='trading_with_sentiment.csv', book_weight=0):
+    model = None
+    if strategy == "xgboost":
+        model = load_model(model_path or default_model_path())
+    # Same rule as trade_xgboost: order book inputs only for a model trained with them
+    with_book = model is not None and model.num_features() == N_FEATURES + len(BOOK_FEATURES)
+    load_start = time.perf_counter()
+    feed = load_feed(files)
+    start = time.perf_counter()
+    indicators = compute_indicators(feed, window_size, book_weight, with_book)
+    if model is not None:
+        signals = xgboost_signals(feed, indicators, model)
+    else:
+        signals = ma_signals(feed, indicators)
+    result = simulate(feed, indicators, signals, initial_capital)
+    elapsed = time.perf_counter() - start
+
+    if output_file:
+        write_ledger(output_file, feed, indicators, signals, result)
+        print(f"Data saved to: {output_file}")
+
+    ticks = len(feed['symbol'])
+    total_portfolio_value = portfolio_value(feed, result)
+    print("=" * 70)
+    print(f"Strategy: {strategy}")
+    print(f"Ticks: {ticks:,} (load {start - load_start:.3f}s, backtest {elapsed:.3f}s, "
+          f"{ticks / elapsed if elapsed > 0 else float('inf'):,.0f} ticks/s)")
+    print(f"Available Capital: ${result['available_capital']:,.2f}")
+    print(f"Total Portfolio Value: ${total_portfolio_value:,.2f}")
+    print(f"Profit/Loss: ${total_portfolio_value - initial_capital:,.2f}")
+    ledger = result['ledger']
+    print(f"Gross Exposure: ${ledger.gross_exposure:,.2f}")
+    print(f"Realized Profit/Loss: ${ledger.realized:,.2f}, Unrealized: ${ledger.unrealized():,.2f}")
+    print("=" * 70)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay feed CSV(s) through a strategy without sockets")
+    parser.add_argument("--files", nargs='+', required=True, help="CSV file(s) or tick store directories to replay")
+    parser.add_argument("--strategy", choices=["ma", "xgboost"], default="ma", help="Moving-average rule or XGBoost model")
+    parser.add_argument("--window-size", type=int, default=5, help="Moving average window")
+    parser.add_argument("--initial-capital", type=int, default=1000000, help="Starting capital")
+    parser.add_argument("--model", help="Model file for the xgboost strategy: an exported .json/.ubj or a pickle "
+                                        "(default: xgb_model.json if present, else xgb_model.pkl)")
+    parser.add_argument("--output", default='trading_with_sentiment.csv', help="Ledger output file ('' to skip)")
+    parser.add_argument("--book-weight", type=float, default=0,
+                        help="Sentiment points for a fully one-sided order book, as in the clients")
+    args = parser.parse_args()
+    run_backtest(args.files, args.strategy, args.window_size, args.initial_capital, args.model, args.output,
+                 args.book_weight)
+
+# python3 backtest.py --files finance/finance.csv --strategy xgboost
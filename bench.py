@@ -0,0 +1,468 @@
+"""
+Benchmark suite for the feed server, the trading clients, model inference
+and the clients' per-symbol history.
+
+    python bench.py                                  # every suite
+    python bench.py --suites inference memory --quick
+    python bench.py --compare                        # results side by side, one column per commit
+
+Suites:
+- server: tcp_server fan-out throughput (rows/s summed over all clients) at
+  --max-speed, for each client count in --clients. The clients only drain
+  their sockets, so this measures the server.
+- clients: ticks/s of trading_client.py and trade_xgboost.py against a local
+  server at --max-speed, timed around FinanceClient.run() (connect to final
+  summary) in a fresh process.
+- sharded: ticks/s of sharded_runtime.py with each --shards worker count,
+  for both strategies, against a local server at --max-speed. Each worker
+  subscribes to its own shard of the symbols, so on a machine with enough
+  cores the rate should grow with the workers until the server is the limit.
+- inference: decide_trade_with_model's scoring path (ModelScorer.score_one)
+  per call, ModelScorer.score_batch per row at several batch sizes, and the
+  old DMatrix-per-tick predict for reference. The xgboost Booster is timed
+  as decide_*, and the NumPy evaluator on the exported --tree-model (when
+  there is one) as tree_decide_*.
+- memory: traced memory of the clients' SymbolState history and the
+  PortfolioLedger over --memory-ticks ticks (10M by default) spread over
+  --symbols symbols. It should stay flat once every symbol has been seen.
+
+The feed is --feed-rows rows built from --files by repeating them in order
+(OrderIDs are offset on every pass so they stay unique), and every random
+input is drawn from --seed, so two runs on the same machine measure the
+same work. Each result is appended to --output as one JSON line with its
+suite, name, headline value and unit, plus the commit, Python, NumPy and
+XGBoost versions and the machine it ran on.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from latency import LatencyHistogram
+from wire_protocol import PROTOCOLS, send_hello
+
+SUITES = ("server", "clients", "sharded", "inference", "memory")
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVER_START_TIMEOUT = 30
+ORDER_ID_STRIDE = 1_000_000  # OrderID offset added on each pass over the source files
+
+
+def environment():
+    """Where and on what a result was measured."""
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], cwd=HERE, capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    try:
+        import xgboost
+        xgboost_version = xgboost.__version__
+    except ImportError:
+        xgboost_version = None
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or None,
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "xgboost": xgboost_version,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def build_feed(files, rows, path):
+    """Write `rows` rows of the source CSVs, cycling through them, to path."""
+    source = []
+    header = None
+    for name in files:
+        with open(name, newline='') as f:
+            reader = csv.reader(f)
+            file_header = next(reader)
+            if header is None:
+                header = file_header
+            source.extend(reader)
+    if not source:
+        raise ValueError("The feed files have no rows")
+    order_id = header.index("OrderID")
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(rows):
+            passes, index = divmod(i, len(source))
+            row = source[index]
+            if passes:
+                row = list(row)
+                row[order_id] = str(int(row[order_id]) + passes * ORDER_ID_STRIDE)
+            writer.writerow(row)
+    return path
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def feed_server(feed_path, workdir, *extra):
+    """A tcp_server.py at --max-speed on free ports; yields (csv_port, order_port)."""
+    csv_port, order_port = free_port(), free_port()
+    log_path = os.path.join(workdir, f"server-{csv_port}.log")
+    with open(log_path, "w") as log:
+        server = subprocess.Popen([sys.executable, "-u", os.path.join(HERE, "tcp_server.py"), "--files", feed_path,
+                                   "--csv-port", str(csv_port), "--order-port", str(order_port), "--max-speed", *extra],
+                                  cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            with open(log_path) as log:
+                output = log.read()
+            if "CSV Stream Server listening" in output and "Order Server listening" in output:
+                break
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"tcp_server.py did not start:\n{output}")
+            time.sleep(0.05)
+        yield csv_port, order_port
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def drain(port, protocol, received, index):
+    with socket.create_connection(("127.0.0.1", port)) as sock:
+        send_hello(sock, protocol)
+        total = 0
+        while True:
+            data = sock.recv(1 << 20)
+            if not data:
+                break
+            total += len(data)
+    received[index] = total
+
+
+def bench_server(args, feed_path, workdir):
+    results = []
+    for protocol in args.protocols:
+        for n_clients in args.clients:
+            with feed_server(feed_path, workdir, "--no-market-orders") as (csv_port, _):
+                received = [0] * n_clients
+                threads = [threading.Thread(target=drain, args=(csv_port, protocol, received, i))
+                           for i in range(n_clients)]
+                start = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start
+            rows = args.feed_rows * n_clients
+            results.append({"suite": "server", "name": f"fanout_{protocol}_{n_clients}", "value": rows / elapsed,
+                            "unit": "rows/s", "clients": n_clients, "protocol": protocol, "rows": rows,
+                            "seconds": elapsed, "bytes_per_s": sum(received) / elapsed})
+    return results
+
+
+def run_client(strategy, csv_port, order_port, protocol, workdir, results):
+    """Child process: run one client quietly against the benchmark server and report its throughput."""
+    os.chdir(workdir)  # trade_xgboost.py loads its model from the working directory
+    if strategy == "xgboost":
+        from trade_xgboost import FinanceClient
+    else:
+        from trading_client import FinanceClient
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        client = FinanceClient("127.0.0.1", csv_port, window_size=5, initial_capital=1000000,
+                               order_host="127.0.0.1", order_port=order_port, protocol=protocol,
+                               output_file=os.path.join(workdir, f"ledger-{strategy}-{protocol}.csv"), console="quiet")
+        start = time.perf_counter()
+        client.run()
+        elapsed = time.perf_counter() - start
+    results.put((client.summary.ticks, elapsed))
+
+
+def bench_clients(args, feed_path, workdir):
+    shutil.copy(args.model, os.path.join(workdir, "xgb_model.pkl"))
+    if os.path.exists(args.tree_model):
+        shutil.copy(args.tree_model, os.path.join(workdir, "xgb_model.json"))  # What the client then scores with
+    results = []
+    for strategy in ("ma", "xgboost"):
+        for protocol in args.protocols:
+            with feed_server(feed_path, workdir) as (csv_port, order_port):
+                queue = multiprocessing.Queue()
+                child = multiprocessing.Process(target=run_client,
+                                                args=(strategy, csv_port, order_port, protocol, workdir, queue))
+                child.start()
+                ticks, elapsed = queue.get()
+                child.join()
+            results.append({"suite": "clients", "name": f"{strategy}_{protocol}", "value": ticks / elapsed,
+                            "unit": "ticks/s", "strategy": strategy, "protocol": protocol, "ticks": ticks,
+                            "seconds": elapsed})
+    return results
+
+
+def run_sharded_runtime(strategy, workers, csv_port, order_port, protocol, workdir, results):
+    """Child process: run sharded_runtime quietly against the benchmark server and report its throughput."""
+    os.chdir(workdir)
+    from sharded_runtime import argument_parser, run_sharded
+    args = argument_parser().parse_args([
+        "--workers", str(workers), "--strategy", strategy, "--csv-port", str(csv_port), "--order-port", str(order_port),
+        "--protocol", protocol, "--output", os.path.join(workdir, f"ledger-sharded-{strategy}-{protocol}.csv"),
+        "--console", "quiet"])
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # Inherited by the workers
+        results.put(run_sharded(args))
+
+
+def bench_sharded(args, feed_path, workdir):
+    shutil.copy(args.model, os.path.join(workdir, "xgb_model.pkl"))
+    if os.path.exists(args.tree_model):
+        shutil.copy(args.tree_model, os.path.join(workdir, "xgb_model.json"))
+    results = []
+    for strategy in ("ma", "xgboost"):
+        for protocol in args.protocols:
+            single = None
+            for workers in args.shards:
+                with feed_server(feed_path, workdir) as (csv_port, order_port):
+                    queue = multiprocessing.Queue()
+                    child = multiprocessing.Process(target=run_sharded_runtime, args=(
+                        strategy, workers, csv_port, order_port, protocol, workdir, queue))
+                    child.start()
+                    ticks, elapsed = queue.get()
+                    child.join()
+                rate = ticks / elapsed
+                if workers == 1:
+                    single = rate
+                results.append({"suite": "sharded", "name": f"{strategy}_{protocol}_{workers}", "value": rate,
+                                "unit": "ticks/s", "strategy": strategy, "protocol": protocol, "workers": workers,
+                                "ticks": ticks, "seconds": elapsed,
+                                "speedup": rate / single if single else None})
+    return results
+
+
+def feature_rows(n, seed, n_features):
+    """Feature rows in the ranges the live client produces."""
+    rng = np.random.default_rng(seed)
+    prices = rng.uniform(10, 500, n)
+    rows = np.zeros((n, n_features), dtype=np.float32)
+    rows[:, 0] = prices
+    rows[:, 1] = prices + rng.normal(0, 5, n)
+    rows[:, 2] = rng.choice([-25, 0, 25], n)
+    rows[:, 3] = rng.choice([0, 50, 100], n)
+    rows[:, 4] = rng.uniform(100, 1000, n)
+    rows[:, 5] = rng.uniform(100, 1000, n)
+    if n_features > 6:
+        rows[:, 6:] = rng.uniform(0, 1, (n, n_features - 6))
+    return rows
+
+
+def latency_result(name, histogram, **extra):
+    summary = histogram.summary()
+    result = {"suite": "inference", "name": name, "value": summary["p50_us"], "unit": "us (p50)"}
+    result.update(summary)
+    result.update(extra)
+    return result
+
+
+def score_latencies(model, lists, batch_sizes, prefix=""):
+    """ModelScorer.score_one per call and score_batch per row, as decide_trade_with_model uses them."""
+    from model_inference import ModelScorer, signal_from_probability
+
+    clock = time.perf_counter_ns
+    results = []
+    scorer = ModelScorer(model, max_batch=max(batch_sizes), n_features=model.num_features())
+    single = LatencyHistogram("single")
+    for features in lists[:100]:
+        signal_from_probability(scorer.score_one(features))  # Warm up
+    for features in lists:
+        start = clock()
+        signal_from_probability(scorer.score_one(features))
+        single.record(clock() - start)
+    results.append(latency_result(f"{prefix}decide_single", single, rows=len(lists)))
+
+    for batch_size in batch_sizes:
+        per_row = LatencyHistogram(f"batch_{batch_size}")
+        for offset in range(0, len(lists) - batch_size + 1, batch_size):
+            batch = lists[offset:offset + batch_size]
+            start = clock()
+            for probability in scorer.score_batch(batch):
+                signal_from_probability(probability)
+            per_row.record((clock() - start) // batch_size)
+        results.append(latency_result(f"{prefix}decide_batch_{batch_size}", per_row, batch_size=batch_size,
+                                      note="per row"))
+    return results
+
+
+def bench_inference(args):
+    import joblib
+    import xgboost as xgb
+    from model_inference import signal_from_probability
+    from tree_model import TreeModel
+
+    model = joblib.load(args.model)
+    rows = feature_rows(args.inference_rows, args.seed, model.num_features())
+    lists = rows.tolist()  # The client passes plain lists
+    clock = time.perf_counter_ns
+    results = score_latencies(model, lists, args.batch_sizes)
+    if os.path.exists(args.tree_model):
+        results.extend(score_latencies(TreeModel.load(args.tree_model), lists, args.batch_sizes, prefix="tree_"))
+
+    dmatrix = LatencyHistogram("dmatrix")
+    for features in lists[:args.dmatrix_rows]:
+        start = clock()
+        signal_from_probability(float(model.predict(xgb.DMatrix(np.array([features])))[0]))
+        dmatrix.record(clock() - start)
+    results.append(latency_result("dmatrix_single", dmatrix, rows=min(len(lists), args.dmatrix_rows)))
+    return results
+
+
+def run_memory(ticks, n_symbols, seed, checkpoints, results):
+    """Child process: feed ticks through SymbolState and PortfolioLedger, tracing memory at each checkpoint."""
+    from portfolio import PortfolioLedger
+    from rolling_state import SymbolState
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    symbol_state = defaultdict(lambda: SymbolState(5))
+    ledger = PortfolioLedger(1000000)
+    symbols = [f"S{i:05d}" for i in range(n_symbols)]
+    prices = [100.0] * n_symbols
+    rng = np.random.default_rng(seed)
+    chunk = max(1, ticks // checkpoints)
+    points = []
+    done = 0
+    start = time.perf_counter()
+    while done < ticks:
+        n = min(chunk, ticks - done)
+        ids = rng.integers(0, n_symbols, n).tolist()
+        moves = rng.normal(0, 0.05, n).tolist()
+        quantities = rng.integers(1, 1000, n).tolist()
+        sides = rng.choice(["B", "S"], n).tolist()
+        for symbol_id, move, quantity, side in zip(ids, moves, quantities, sides):
+            price = prices[symbol_id] = max(0.01, round(prices[symbol_id] + move, 2))
+            symbol = symbols[symbol_id]
+            symbol_state[symbol].update(price, quantity, side)
+            ledger.mark(symbol, price)
+        del ids, moves, quantities, sides
+        done += n
+        points.append((done, tracemalloc.get_traced_memory()[0] - base))
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    results.put((points, elapsed))
+
+
+def bench_memory(args):
+    queue = multiprocessing.Queue()
+    child = multiprocessing.Process(target=run_memory,
+                                    args=(args.memory_ticks, args.symbols, args.seed, args.checkpoints, queue))
+    child.start()
+    points, elapsed = queue.get()
+    child.join()
+    # Growth after the first checkpoint, by when every symbol has normally been seen
+    first, last = points[0][1], points[-1][1]
+    return [{"suite": "memory", "name": f"history_{args.symbols}_symbols", "value": last - first, "unit": "bytes grown",
+             "ticks": args.memory_ticks, "symbols": args.symbols, "bytes": last,
+             "bytes_per_symbol": last / args.symbols, "points": points, "seconds": elapsed}]
+
+
+def print_results(results):
+    for result in results:
+        print(f"{result['suite']:<10} {result['name']:<28} {result['value']:>16,.1f} {result['unit']}")
+
+
+def compare(path, last=5):
+    """Print the headline value of every benchmark for the last `last` commits in the results file."""
+    table = defaultdict(dict)
+    units = {}
+    commits = []
+    with open(path) as f:
+        for line in f:
+            result = json.loads(line)
+            key = (result["suite"], result["name"])
+            commit = (result.get("commit") or "?") + ("+" if result.get("dirty") else "")
+            if commit not in commits:
+                commits.append(commit)
+            table[key][commit] = result["value"]  # The latest run of a commit wins
+            units[key] = result["unit"]
+    commits = commits[-last:]
+    print(f"{'benchmark':<40} " + " ".join(f"{commit:>14}" for commit in commits) + "  unit")
+    for key in sorted(table):
+        values = table[key]
+        cells = " ".join(f"{values[c]:>14,.1f}" if c in values else f"{'-':>14}" for c in commits)
+        print(f"{key[0] + '/' + key[1]:<40} {cells}  {units[key]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the server, the clients, model inference and memory")
+    parser.add_argument("--suites", nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument("--output", default="bench_results.jsonl", help="Results file (one JSON object per line)")
+    parser.add_argument("--compare", action="store_true", help="Compare the runs in --output instead of benchmarking")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes for a fast smoke run")
+    parser.add_argument("--files", nargs='+', default=[os.path.join(HERE, "finance", "finance.csv")],
+                        help="CSV file(s) the benchmark feed is built from")
+    parser.add_argument("--feed-rows", type=int, default=200_000, help="Rows in the benchmark feed")
+    parser.add_argument("--clients", type=int, nargs='+', default=[1, 4, 16, 64], help="Client counts for fan-out")
+    parser.add_argument("--shards", type=int, nargs='+', default=[1, 2, 4], help="Worker counts for the sharded suite")
+    parser.add_argument("--protocols", nargs='+', choices=PROTOCOLS, default=list(PROTOCOLS))
+    parser.add_argument("--model", default=os.path.join(HERE, "xgb_model.pkl"))
+    parser.add_argument("--tree-model", default=os.path.join(HERE, "xgb_model.json"),
+                        help="Exported model for the NumPy evaluator (skipped if missing)")
+    parser.add_argument("--inference-rows", type=int, default=50_000, help="Feature rows scored per inference test")
+    parser.add_argument("--dmatrix-rows", type=int, default=2_000, help="Rows for the slower DMatrix reference")
+    parser.add_argument("--batch-sizes", type=int, nargs='+', default=[8, 64, 256])
+    parser.add_argument("--memory-ticks", type=int, default=10_000_000)
+    parser.add_argument("--symbols", type=int, default=1_000, help="Symbols in the memory test")
+    parser.add_argument("--checkpoints", type=int, default=10, help="Memory measurements over the memory test")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.output)
+        sys.exit(0)
+    if args.quick:
+        args.feed_rows = min(args.feed_rows, 20_000)
+        args.clients = [n for n in args.clients if n <= 4] or [1]
+        args.inference_rows = min(args.inference_rows, 5_000)
+        args.dmatrix_rows = min(args.dmatrix_rows, 500)
+        args.memory_ticks = min(args.memory_ticks, 1_000_000)
+
+    run = {"run": datetime.now().isoformat(timespec="seconds"), **environment()}
+    print(f"Benchmarking commit {run['commit']}{' (uncommitted changes)' if run['dirty'] else ''} "
+          f"on {run['platform']}, {run['cpus']} CPUs")
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    results = []
+    try:
+        feed_path = None
+        if {"server", "clients", "sharded"} & set(args.suites):
+            feed_path = build_feed(args.files, args.feed_rows, os.path.join(workdir, "feed.csv"))
+        for suite in args.suites:
+            print(f"Running {suite}...")
+            if suite == "server":
+                suite_results = bench_server(args, feed_path, workdir)
+            elif suite == "clients":
+                suite_results = bench_clients(args, feed_path, workdir)
+            elif suite == "sharded":
+                suite_results = bench_sharded(args, feed_path, workdir)
+            elif suite == "inference":
+                suite_results = bench_inference(args)
+            else:
+                suite_results = bench_memory(args)
+            print_results(suite_results)
+            with open(args.output, "a") as f:
+                for result in suite_results:
+                    f.write(json.dumps({**result, **run}) + "\n")
+            results.extend(suite_results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"{len(results)} results appended to {args.output}")
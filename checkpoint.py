@@ -0,0 +1,382 @@
+"""
+Checkpoints of a trading client's strategy state, for a warm restart.
+
+A checkpoint holds what the strategy has built up from the feed:
+
+- every symbol's rolling windows and last three prices (SymbolState),
+- the simulated ledger (cash, positions, running totals) and the executed one,
+- the live orders of the L2 books.
+
+Features aren't stored; the feature store recomputes them from the restored
+inputs on each symbol's next tick. Orders still queued in the gateway and
+ticks waiting in a micro-batch are not part of the state (snapshots are
+only taken between batches).
+
+File layout: CHECKPOINT_MAGIC, the length and CRC32 of the rest (HEADER),
+then sections of (SECTION header, data padded to 8 bytes). A section is one
+array: the per-symbol columns (window buffers, positions, orders) are flat
+arrays across all symbols, symbol names are one newline-joined UTF-8
+section, and the scalars are a small JSON 'meta' section. Arrays are in native byte order; a checkpoint is for restarting on
+the same machine.
+
+Checkpointer.save() packs the state on the trading thread (about 3ms per
+thousand symbols) and hands the bytes to a writer thread, which writes a temp file, fsyncs it and renames it over the
+checkpoint, so the file on disk is always a complete snapshot. A snapshot
+that comes due while the previous one is still being written is skipped.
+restore() memory-maps the file, checks it is whole and was saved with the
+client's window size (otherwise it raises CheckpointError before the client
+is touched) and rebuilds the state from it.
+
+    python trading_client.py --checkpoint client.ckpt             # snapshot every second
+    python trading_client.py --checkpoint client.ckpt --resume    # after a restart
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from portfolio import Position
+
+CHECKPOINT_MAGIC = b"CLCKPT02"
+HEADER = struct.Struct("<QI")  # length and CRC32 of the sections that follow
+SECTION = struct.Struct("<24scQ")  # name (NUL padded), array typecode, item count
+DEFAULT_CHECKPOINT_INTERVAL = 1.0
+NAN = float("nan")
+
+
+class CheckpointError(ValueError):
+    """A checkpoint file that can't be restored: empty, truncated, corrupt, not a checkpoint or another window size."""
+
+
+WINDOWS = ("prices", "quantities", "buy_volumes", "sell_volumes")  # SymbolState's RollingWindows, in file order
+
+
+def _optional(value):
+    return NAN if value is None else value
+
+
+def _present(value):
+    return None if math.isnan(value) else value
+
+
+class _Writer:
+    """Collects sections for one checkpoint."""
+
+    def __init__(self):
+        self.parts = []
+
+    def add(self, name, values):
+        data = values.tobytes()
+        self.parts.append(SECTION.pack(name.encode("ascii"), values.typecode.encode("ascii"), len(values)))
+        self.parts.append(data)
+        self.parts.append(b"\0" * (-len(data) % 8))
+
+    def add_text(self, name, text):
+        self.add(name, array("B", text.encode("utf-8")))
+
+    def getvalue(self):
+        body = b"".join(self.parts)
+        return CHECKPOINT_MAGIC + HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def read_sections(view):
+    """
+    {name: (typecode, memoryview of the raw bytes)} of a checkpoint's
+    sections. Raises CheckpointError unless the checkpoint is whole.
+    """
+    if len(view) == 0:
+        raise CheckpointError("empty file")
+    start = len(CHECKPOINT_MAGIC) + HEADER.size
+    if len(view) < start or bytes(view[:len(CHECKPOINT_MAGIC)]) != CHECKPOINT_MAGIC:
+        raise CheckpointError("not a client checkpoint")
+    length, crc = HEADER.unpack_from(view, len(CHECKPOINT_MAGIC))
+    if len(view) - start != length:
+        raise CheckpointError(f"truncated ({len(view) - start:,} of {length:,} bytes)")
+    if zlib.crc32(view[start:]) != crc:
+        raise CheckpointError("checksum mismatch")
+    sections = {}
+    offset = start
+    try:
+        while offset < len(view):
+            name, typecode, count = SECTION.unpack_from(view, offset)
+            offset += SECTION.size
+            typecode = typecode.decode("ascii")
+            size = count * array(typecode).itemsize
+            sections[name.rstrip(b"\0").decode("ascii")] = (typecode, view[offset:offset + size])
+            offset += size + (-size % 8)
+    except (struct.error, ValueError) as e:
+        raise CheckpointError(f"bad section: {e}")
+    if offset != len(view):
+        raise CheckpointError("bad section sizes")
+    return sections
+
+
+def _ledger_sections(writer, prefix, ledger, symbol_id):
+    ids, quantities, last_prices, costs, realized = array("I"), array("q"), array("d"), array("d"), array("d")
+    for symbol, position in ledger.positions.items():
+        ids.append(symbol_id(symbol))
+        quantities.append(position.quantity)
+        last_prices.append(_optional(position.last_price))
+        costs.append(position.cost)
+        realized.append(position.realized)
+    for name, values in (("symbol", ids), ("quantity", quantities), ("last_price", last_prices), ("cost", costs),
+                         ("realized", realized)):
+        writer.add(f"{prefix}.{name}", values)
+    return {'cash': ledger.cash, 'market_value': ledger.market_value, 'gross_exposure': ledger.gross_exposure,
+            'cost_basis': ledger.cost_basis, 'realized': ledger.realized, 'fills': ledger.fills}
+
+
+def snapshot(client):
+    """The client's strategy state as checkpoint bytes."""
+    symbols = {}
+
+    def symbol_id(name):
+        sid = symbols.get(name)
+        if sid is None:
+            sid = symbols[name] = len(symbols)
+        return sid
+
+    writer = _Writer()
+    ids, ticks, recent = array("I"), array("q"), array("d")
+    buffers = {name: None for name in WINDOWS}
+    heads, counts, price_sums, volume_sums = array("I"), array("I"), array("d"), array("q")
+    for symbol, state in client.symbol_state.items():
+        ids.append(symbol_id(symbol))
+        ticks.append(state.ticks)
+        recent.extend(_optional(price) for price in state.recent_prices())
+        for name in WINDOWS:
+            values, head, count, total = getattr(state, name).dump()
+            if buffers[name] is None:
+                buffers[name] = array(values.typecode)
+            buffers[name].extend(values)
+            heads.append(head)
+            counts.append(count)
+            if name == "prices":
+                price_sums.append(total)
+            else:
+                volume_sums.append(total)
+    writer.add("state.symbol", ids)
+    writer.add("state.ticks", ticks)
+    writer.add("state.recent", recent)
+    for name in WINDOWS:
+        writer.add(f"state.{name}", buffers[name] if buffers[name] is not None else array("d"))
+    writer.add("state.heads", heads)
+    writer.add("state.counts", counts)
+    writer.add("state.price_sums", price_sums)
+    writer.add("state.volume_sums", volume_sums)
+
+    ledger = _ledger_sections(writer, "ledger", client.ledger, symbol_id)
+    executions = _ledger_sections(writer, "executions", client.executions.ledger, symbol_id)
+
+    book_ids, order_books, order_ids, order_bids, order_prices, order_quantities = (
+        array("I"), array("I"), array("q"), array("B"), array("d"), array("q"))
+    exchanges = []
+    for index, ((symbol, exchange), book) in enumerate(client.books.books.items()):
+        book_ids.append(symbol_id(symbol))
+        exchanges.append(exchange)  # "1" from JSON feeds, 1 from binary ones; kept as is so keys still match
+        for order_id, (is_bid, price, quantity) in book.orders.items():
+            order_books.append(index)
+            order_ids.append(order_id)
+            order_bids.append(is_bid)
+            order_prices.append(price)
+            order_quantities.append(quantity)
+    for name, values in (("books.symbol", book_ids), ("orders.book", order_books), ("orders.id", order_ids),
+                         ("orders.is_bid", order_bids), ("orders.price", order_prices),
+                         ("orders.quantity", order_quantities)):
+        writer.add(name, values)
+
+    meta = {
+        'created': time.time(),
+        'window_size': client.window_size,
+        'initial_capital': client.ledger.initial_capital,
+        'ledger': ledger,
+        'executions': executions,
+        'acked': client.executions.acked,
+        'rejected': client.executions.rejected,
+        'fills': client.executions.fills,
+        'book_exchanges': exchanges,
+        'book_updates': client.books.updates,
+    }
+    writer.add_text("symbols", "\n".join(symbols))
+    writer.add_text("meta", json.dumps(meta))
+    return writer.getvalue()
+
+
+def _restore_ledger(ledger, sections, prefix, totals, symbols):
+    columns = [_column(sections, f"{prefix}.{name}")
+               for name in ("symbol", "quantity", "last_price", "cost", "realized")]
+    ledger.positions = {}
+    for sid, quantity, last_price, cost, realized in zip(*columns):
+        position = ledger.positions[symbols[sid]] = Position()
+        position.quantity = quantity
+        position.last_price = _present(last_price)
+        position.cost = cost
+        position.realized = realized
+    ledger.cash = totals['cash']
+    ledger.market_value = totals['market_value']
+    ledger.gross_exposure = totals['gross_exposure']
+    ledger.cost_basis = totals['cost_basis']
+    ledger.realized = totals['realized']
+    ledger.fills = totals['fills']
+
+
+def _column(sections, name):
+    typecode, data = sections[name]
+    values = array(typecode)
+    values.frombytes(data)
+    return values
+
+
+def restore(client, path):
+    """
+    Load a checkpoint into a freshly constructed client; returns the number
+    of symbols restored. Raises CheckpointError if the file can't be used.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise CheckpointError(f"{path}: empty file")  # mmap can't map an empty file
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _restore(client, path, mapped)
+    finally:
+        try:
+            mapped.close()
+        except BufferError:
+            pass  # A failed restore's traceback still holds views of it; the map goes with them
+
+
+def _restore(client, path, mapped):
+    try:
+        sections = read_sections(memoryview(mapped))
+        meta = json.loads(bytes(sections["meta"][1]))
+    except CheckpointError as e:
+        raise CheckpointError(f"{path}: {e}")
+    except (KeyError, ValueError) as e:
+        raise CheckpointError(f"{path}: bad metadata: {e}")
+    if meta['window_size'] != client.window_size:
+        raise CheckpointError(f"{path} was saved with window size {meta['window_size']}, not {client.window_size}")
+    symbols = bytes(sections["symbols"][1]).decode("utf-8").split("\n")
+
+    window = client.window_size
+    ids = _column(sections, "state.symbol")
+    ticks = _column(sections, "state.ticks")
+    recent = _column(sections, "state.recent")
+    buffers = {name: sections[f"state.{name}"][1] for name in WINDOWS}
+    heads = _column(sections, "state.heads")
+    counts = _column(sections, "state.counts")
+    price_sums = _column(sections, "state.price_sums")
+    volume_sums = _column(sections, "state.volume_sums")
+    client.symbol_state.clear()
+    for i, sid in enumerate(ids):
+        state = client.symbol_state[symbols[sid]]
+        state.ticks = ticks[i]
+        state.restore_recent_prices(*(_present(price) for price in recent[i * 3:i * 3 + 3]))
+        for j, name in enumerate(WINDOWS):
+            rolling = getattr(state, name)
+            size = rolling.dump()[0].itemsize * window
+            total = price_sums[i] if j == 0 else volume_sums[i * 3 + j - 1]
+            rolling.load(buffers[name][i * size:(i + 1) * size], heads[i * 4 + j], counts[i * 4 + j], total)
+
+    _restore_ledger(client.ledger, sections, "ledger", meta['ledger'], symbols)
+    _restore_ledger(client.executions.ledger, sections, "executions", meta['executions'], symbols)
+    client.executions.acked = meta['acked']
+    client.executions.rejected = meta['rejected']
+    client.executions.fills = meta['fills']
+
+    books = client.books
+    book_list = [books.book(symbols[sid], exchange) for sid, exchange in zip(_column(sections, "books.symbol"),
+                                                                             meta['book_exchanges'])]
+    for index, order_id, is_bid, price, quantity in zip(*(_column(sections, name) for name in (
+            "orders.book", "orders.id", "orders.is_bid", "orders.price", "orders.quantity"))):
+        book_list[index].apply(order_id, "A", bool(is_bid), price, quantity)
+    books.updates = meta['book_updates']
+    return len(ids)
+
+
+def write_atomic(path, data):
+    """Write data to path via a temp file, fsync and rename, so path is always whole."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    # Make the rename itself durable
+    directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+class Checkpointer:
+    """Periodic snapshots of one client, written by a background thread."""
+
+    def __init__(self, path, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.saved = 0
+        self.skipped = 0  # Snapshots due while the previous one was still being written
+        self.pack_seconds = 0.0  # Trading-thread time of the last snapshot
+        self._due = time.monotonic() + interval
+        self._data = None
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def due(self):
+        return time.monotonic() >= self._due
+
+    def save(self, client, wait=False):
+        """Snapshot the client now. Returns False if skipped because the writer is still busy (and not wait)."""
+        self._due = time.monotonic() + self.interval
+        if not self._idle.is_set():
+            if not wait:
+                self.skipped += 1
+                return False
+            self._idle.wait()
+        start = time.perf_counter()
+        data = snapshot(client)
+        self.pack_seconds = time.perf_counter() - start
+        self._idle.clear()
+        self._data = data
+        self._wake.set()
+        if wait:
+            self._idle.wait()
+        return True
+
+    def close(self, client=None):
+        """Write a last snapshot of client (if given) and stop the writer."""
+        if client is not None:
+            self.save(client, wait=True)
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            data, self._data = self._data, None
+            if data is not None:
+                try:
+                    write_atomic(self.path, data)
+                    self.saved += 1
+                except OSError as e:
+                    print(f"Could not write checkpoint {self.path}: {e}")
+                finally:
+                    self._idle.set()
+            if not self._running:
+                return
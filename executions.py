@@ -0,0 +1,50 @@
+"""
+Client side of the order port's execution reports.
+
+For every order the server sends back a FILL per execution, then an ACK
+(its status and what is left on the book); resting orders can be filled
+later by other orders. The order gateway receives the reports and
+ExecutionTracker keeps the positions and cash that actually resulted from them,
+in a PortfolioLedger that starts from zero cash.
+"""
+from portfolio import PortfolioLedger
+
+
+class ExecutionTracker:
+    def __init__(self, verbose=True):
+        self.verbose = verbose  # Print every fill
+        self.ledger = PortfolioLedger()
+        self.acked = 0
+        self.rejected = 0
+        self.fills = 0
+
+    def apply_all(self, reports):
+        for report in reports:
+            self.apply(report)
+
+    def apply(self, report):
+        kind = report.get("Type")
+        if kind == "FILL":
+            quantity = int(report["Quantity"])
+            if report.get("Side") == "S":
+                quantity = -quantity
+            self.ledger.fill(report["Symbol"], quantity, float(report["Price"]))
+            self.fills += 1
+            if self.verbose:
+                print(f"Filled: {report['Side']} {abs(quantity):,} {report['Symbol']} @ ${float(report['Price']):,.2f}")
+        elif kind == "ACK":
+            if report.get("Status") == "R":
+                self.rejected += 1
+                print("Order rejected:", report)
+            else:
+                self.acked += 1
+
+    def mark(self, symbol, price):
+        self.ledger.mark(symbol, price)
+
+    def position(self, symbol):
+        return self.ledger.position(symbol)
+
+    def profit_loss(self):
+        """Cash from fills plus filled positions at their last marked price (or fill price if never marked)."""
+        return self.ledger.nav()
@@ -0,0 +1,202 @@
+"""
+Per-symbol feature store shared by the sentiment rule and the model.
+
+Every feature is registered once in a FeatureGraph, with the names of the
+features or raw inputs it is computed from. Each symbol keeps a
+FeatureValues holding its inputs and the features computed from them:
+
+- A tick sets the raw inputs (price, moving averages, news, ...). An input
+  whose value actually changed marks every feature downstream of it stale;
+  an unchanged one (the news of a quiet symbol, the sell volume MA on a buy
+  tick) leaves them cached.
+- A feature is computed when it is first read after going stale, so one
+  that no strategy reads costs nothing per tick, and one read by both the
+  sentiment and the model vector (the volume factor, the parsed news) is
+  computed once.
+
+client_features() registers what the trading clients use. Adding a feature
+is one more add() with its inputs; the sentiment and the model pick it up by
+reading it.
+"""
+from operator import itemgetter
+from order_book import BOOK_FEATURES, BOOK_IMBALANCE
+
+INPUTS = ["price", "quantity", "price_ma", "quantity_ma", "buy_volume_ma", "sell_volume_ma", "trend", "news", "book"]
+
+_UNSET = object()
+
+
+class FeatureGraph:
+    """Feature definitions: inputs and the functions that compute features from them."""
+
+    def __init__(self, inputs=INPUTS):
+        self.inputs = list(inputs)
+        self.functions = {}  # feature -> (function, names of its inputs)
+        self.downstream = {name: set() for name in self.inputs}  # name -> features computed from it, at any depth
+        # feature -> (feature, function, inputs getter) for it and every feature it depends on, in the order to
+        # compute them. The getter reads the inputs from a values dict as the function's argument tuple.
+        self.plans = {}
+
+    def add(self, name, inputs, function):
+        """Register function(*inputs) as feature `name`. Its inputs must already be registered."""
+        if name in self.downstream:
+            raise ValueError(f"Feature {name} is already registered")
+        for source in inputs:
+            if source not in self.downstream:
+                raise KeyError(f"Feature {name} depends on unknown feature {source}")
+        inputs = tuple(inputs)
+        self.functions[name] = (function, inputs)
+        self.downstream[name] = set()
+        for upstream, dependents in self.downstream.items():
+            if upstream in inputs or dependents & set(inputs):
+                dependents.add(name)
+        # Features are registered after their inputs, so registration order is a valid computing order
+        plan = []
+        for source in inputs:
+            for step in self.plans.get(source, ()):
+                if step not in plan:
+                    plan.append(step)
+        getter = itemgetter(*inputs) if len(inputs) > 1 else lambda values: (values[inputs[0]],)
+        self.plans[name] = tuple(plan) + ((name, function, getter),)
+
+    def values(self):
+        return FeatureValues(self)
+
+
+class FeatureValues:
+    """One symbol's inputs and cached features."""
+    __slots__ = ("graph", "_values", "_stale")
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._values = {}
+        self._stale = set(graph.functions)
+
+    def update(self, **inputs):
+        """Set raw inputs; the features downstream of any that changed go stale."""
+        values = self._values
+        stale = self._stale
+        downstream = self.graph.downstream
+        for name, value in inputs.items():
+            if values.get(name, _UNSET) != value:
+                values[name] = value
+                stale |= downstream[name]
+
+    def get(self, name):
+        stale = self._stale
+        values = self._values
+        if name in stale:
+            for feature, function, arguments in self.graph.plans[name]:
+                if feature in stale:
+                    values[feature] = function(*arguments(values))
+                    stale.discard(feature)
+        return values[name]
+
+
+def volume_signal(high_volume=1.5, low_volume=0.5):
+    def signal(quantity, quantity_ma):
+        if quantity_ma is None:
+            return "NORMAL"
+        if quantity > (quantity_ma * high_volume):
+            return "HIGH"
+        elif quantity < (quantity_ma * low_volume):
+            return "LOW"
+        return "NORMAL"
+    return signal
+
+
+def volume_factor(signal):
+    """-25 to 25; also the model's volume input."""
+    if signal == "HIGH":
+        return 25
+    elif signal == "LOW":
+        return -25
+    return 0
+
+
+def price_momentum(price, price_ma):
+    """Percent above/below the MA."""
+    if price_ma is None:
+        return None
+    return ((price / price_ma) - 1) * 100
+
+
+def trend_factor(trend):
+    if trend > 0:
+        return 25  # Consistently rising
+    elif trend < 0:
+        return -25  # Consistently falling
+    return 0
+
+
+def news_factor(news):
+    """Map the news value (0, 50, 100) to a news factor between -25 and +25."""
+    try:
+        news_value = int(news)
+    except ValueError:
+        news_value = 50  # Default to neutral if conversion fails
+
+    # (Optional: adjust the news_value mapping as needed)
+    news_value = 0 if news_value == 100 else news_value
+    news_value = 100 if news_value == 0 else news_value
+    return (news_value - 50) / 2
+
+
+def volume_ratio_factor(buy_volume_ma, sell_volume_ma):
+    if buy_volume_ma is not None and sell_volume_ma is not None and sell_volume_ma != 0:
+        ratio = buy_volume_ma / sell_volume_ma
+        # Map the ratio such that a ratio > 1 adds a positive adjustment and < 1 adds a negative one.
+        return (ratio - 1) * 25  # Scaling factor can be adjusted as needed
+    return 0
+
+
+def book_factor(book_weight):
+    """Order book imbalance (-book_weight to +book_weight)."""
+    def factor(book):
+        if book is not None and book_weight:
+            return book[BOOK_IMBALANCE] * book_weight
+        return 0
+    return factor
+
+
+def sentiment(momentum, volume, trend, news, volume_ratio, book):
+    """Market sentiment on a scale from -100 to 100."""
+    if momentum is None:
+        return 0  # Neutral when not enough data
+    # Combine factors (ensure overall sentiment is within [-100, 100])
+    return round(min(100, max(-100, momentum + volume + trend + news + volume_ratio + book)), 2)
+
+
+def model_inputs(price, price_ma, volume, news, buy_volume_ma, sell_volume_ma):
+    """The model's feature vector; must match the feature engineering used during training (backtest.model_features)."""
+    return [
+        price,
+        price_ma if price_ma is not None else 0,
+        volume,
+        float(news),
+        buy_volume_ma if buy_volume_ma is not None else 0,
+        sell_volume_ma if sell_volume_ma is not None else 0
+    ]
+
+
+def model_inputs_with_book(inputs, book):
+    """The feature vector of a model trained with the order book inputs (BOOK_FEATURES)."""
+    return inputs + (book if book is not None else [0.0] * len(BOOK_FEATURES))
+
+
+def client_features(book_weight=0, high_volume=1.5, low_volume=0.5):
+    """The features trading_client.py and trade_xgboost.py read."""
+    graph = FeatureGraph()
+    graph.add("volume_signal", ["quantity", "quantity_ma"], volume_signal(high_volume, low_volume))
+    graph.add("volume_factor", ["volume_signal"], volume_factor)
+    graph.add("price_momentum", ["price", "price_ma"], price_momentum)
+    graph.add("trend_factor", ["trend"], trend_factor)
+    graph.add("news_factor", ["news"], news_factor)
+    graph.add("volume_ratio_factor", ["buy_volume_ma", "sell_volume_ma"], volume_ratio_factor)
+    graph.add("book_factor", ["book"], book_factor(book_weight))
+    graph.add("sentiment", ["price_momentum", "volume_factor", "trend_factor", "news_factor", "volume_ratio_factor",
+                            "book_factor"], sentiment)
+    graph.add("model_inputs", ["price", "price_ma", "volume_factor", "news", "buy_volume_ma", "sell_volume_ma"],
+              model_inputs)
+    graph.add("model_inputs_with_book", ["model_inputs", "book"], model_inputs_with_book)
+    return graph
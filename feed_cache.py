@@ -0,0 +1,389 @@
+"""
+Shared, pre-encoded feed for tcp_server.
+
+Each CSV file is parsed and encoded once, in both wire formats, into one
+immutable buffer. Client sessions are just cursors into it and send
+memoryview slices, so 100 subscribers cost one parse, one encode and one
+copy of the feed in RAM.
+
+The encoded feed is also written to a cache file next to each CSV
+(<file>.feedcache) and memory-mapped on later starts. The cache is rebuilt
+whenever the CSV's size or modification time changes.
+
+A tick store directory (see tick_store.py) can stand in for a CSV file. Its
+rows are encoded from the memory-mapped columns (the binary records in one
+NumPy pass), cached the same way, and re-encoded when rows are appended.
+They carry no Description.
+
+A CSV row that doesn't fit the binary record (a Quantity of 2**32 or more,
+an Exchange or News over 255, a Price that isn't a number) leaves the file
+without binary rows: it is still served to JSON clients, and binary clients
+are refused with binary_error (see tcp_server.session_segments).
+
+Pre-encoded rows carry the time the feed was encoded in their 'date' field
+(JSON) or timestamp (binary), not the time they were sent.
+"""
+import csv
+from array import array
+import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+from tick_store import TickStore
+from wire_protocol import PROTOCOL_BINARY, RECORD, RECORD_SYMBOL, RECORD_SIZE, RECORD_TICK, SYMBOL, BinaryEncoder
+
+CACHE_SUFFIX = ".feedcache"
+CACHE_MAGIC = b"FEEDCCH2"
+# magic, source mtime (ns), source size, rows, JSON payload bytes, binary symbol table bytes, binary error bytes
+CACHE_HEADER = struct.Struct("<8sqqQQQQ")
+
+# wire_protocol.RECORD and SYMBOL as NumPy records, for encoding a tick store and filtering rows in one pass
+RECORD_DTYPE = np.dtype([("kind", "u1"), ("symbol", "<u4"), ("order_id", "<u8"), ("quantity", "<u4"),
+                         ("price", "<f8"), ("side", "S1"), ("action", "S1"), ("exchange", "u1"), ("news", "u1"),
+                         ("ts", "<f8")])
+SYMBOL_DTYPE = np.dtype([("kind", "u1"), ("symbol", "<u4"), ("name", "S32")])
+assert RECORD_DTYPE.itemsize == RECORD.size and SYMBOL_DTYPE.itemsize == SYMBOL.size
+
+MAX_FILTERED_SEGMENTS = 256  # Distinct subscriptions whose rows SharedFeed keeps
+
+
+class FeedSegment:
+    """
+    The encoded rows of one CSV file.
+
+    json_offsets[i]:json_offsets[i + 1] is row i in json_data. Binary rows are
+    fixed-size records in binary_data, preceded on the wire by binary_symbols,
+    the file's symbol table. binary_error says why the file has no binary
+    rows, if a row couldn't be encoded.
+    """
+    __slots__ = ("source", "mtime_ns", "size", "rows", "json_data", "json_offsets",
+                 "binary_symbols", "binary_data", "binary_error", "_mmap", "_columns", "_orders", "_buckets")
+
+    def __init__(self, source, mtime_ns, size, rows, json_data, json_offsets,
+                 binary_symbols, binary_data, mapped=None, binary_error=None):
+        self.source = source
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.rows = rows
+        self.json_data = json_data
+        self.json_offsets = json_offsets
+        self.binary_symbols = binary_symbols
+        self.binary_data = binary_data
+        self.binary_error = binary_error
+        self._mmap = mapped
+        self._columns = {}
+        self._orders = None
+        self._buckets = None
+
+    def is_stale(self):
+        try:
+            st = os.stat(self.source)
+        except OSError:
+            return True
+        return st.st_mtime_ns != self.mtime_ns or st.st_size != self.size
+
+    def column(self, name):
+        """
+        Raw values of one CSV column, in row order. Only the columns a replay
+        mode actually needs (e.g. a timestamp column) are read, once per segment.
+        """
+        values = self._columns.get(name)
+        if values is None and os.path.isdir(self.source):
+            values = self._columns[name] = TickStore(self.source).csv_column(name)
+        if values is None:
+            with open(self.source, 'r') as csvfile:
+                reader = csv.DictReader(csvfile)
+                if name not in (reader.fieldnames or []):
+                    raise KeyError(f"{self.source} has no '{name}' column")
+                values = [row[name] for row in reader]
+            self._columns[name] = values
+        return values
+
+    def orders(self, start, stop):
+        """(symbol, order id, side, price, quantity) of rows [start, stop), for the matching engine."""
+        orders = self._orders
+        if orders is None:
+            try:
+                orders = list(zip(self.column("Symbol"),
+                                  (int(v) for v in self.column("OrderID")),
+                                  self.column("Side"),
+                                  (float(v) for v in self.column("Price")),
+                                  (int(v) for v in self.column("Quantity"))))
+            except (KeyError, ValueError) as e:
+                print(f"Not adding the orders of {self.source} to the order books: {e}")
+                orders = []
+            self._orders = orders
+        return orders[start:stop]
+
+    def symbol_buckets(self):
+        """
+        (symbol names by id, row numbers of each symbol id in order), read
+        from the binary records once per segment.
+        """
+        if self._buckets is None:
+            if self.binary_error is None:
+                names = [name.rstrip(b"\0").decode("utf-8")
+                         for name in np.frombuffer(self.binary_symbols, dtype=SYMBOL_DTYPE)["name"].tolist()]
+                ids = np.frombuffer(self.binary_data, dtype=RECORD_DTYPE)["symbol"]
+            else:
+                names, ids = np.unique(np.array(self.column("Symbol"), dtype=str), return_inverse=True)
+                names = names.tolist()
+            order = np.argsort(ids, kind="stable")
+            starts = np.searchsorted(ids[order], np.arange(len(names) + 1))
+            self._buckets = (names, [order[starts[i]:starts[i + 1]] for i in range(len(names))])
+        return self._buckets
+
+    def header(self, protocol):
+        """Bytes to send before any row of this segment."""
+        if protocol == PROTOCOL_BINARY and self.binary_error is not None:
+            raise ValueError(f"{self.source} can't be sent as binary: {self.binary_error}")
+        return self.binary_symbols if protocol == PROTOCOL_BINARY else b""
+
+    def row_slice(self, protocol, start, stop):
+        """Zero-copy view of rows [start, stop) in the given wire format."""
+        if protocol == PROTOCOL_BINARY:
+            return self.binary_data[start * RECORD_SIZE:stop * RECORD_SIZE]
+        return self.json_data[self.json_offsets[start]:self.json_offsets[stop]]
+
+
+def encode_segment(source):
+    """
+    Parse one CSV file and encode every row in both wire formats, or only
+    in JSON if a row doesn't fit the binary record (see binary_error).
+    """
+    st = os.stat(source)
+    date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    timestamp = time.time()
+    encoder = BinaryEncoder()
+    symbols = []
+    json_parts = []
+    binary_parts = []
+    binary_error = None
+    offsets = [0]
+    with open(source, 'r') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            if binary_error is None:
+                try:
+                    # Collect the symbol table up front rather than interleaving it with the rows
+                    symbols.append(encoder.define_symbol(row['Symbol']))
+                    binary_parts.append(encoder.encode(row, RECORD_TICK, timestamp))
+                except (KeyError, TypeError, ValueError, struct.error) as e:
+                    binary_error = f"line {reader.line_num}: {e}"
+                    symbols, binary_parts = [], []
+            row['date'] = date
+            line = (json.dumps(row) + "\n").encode("utf-8")
+            json_parts.append(line)
+            offsets.append(offsets[-1] + len(line))
+    json_offsets = memoryview(array("Q", offsets))
+    return FeedSegment(source, st.st_mtime_ns, st.st_size, len(json_parts),
+                       memoryview(b"".join(json_parts)), json_offsets,
+                       memoryview(b"".join(symbols)), memoryview(b"".join(binary_parts)), binary_error=binary_error)
+
+
+def encode_store_segment(source):
+    """Encode every row of a tick store in both wire formats."""
+    st = os.stat(source)
+    store = TickStore(source)
+    columns = store.columns
+    records = np.zeros(store.rows, dtype=RECORD_DTYPE)
+    records["kind"] = RECORD_TICK
+    for name in RECORD_DTYPE.names[1:]:
+        records[name] = columns[name]
+    symbols = b"".join(SYMBOL.pack(RECORD_SYMBOL, i, name.encode("utf-8")) for i, name in enumerate(store.symbols))
+
+    date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    names = store.symbols
+    json_parts = []
+    offsets = [0]
+    for symbol, order_id, quantity, action, exchange, side, price, news in zip(
+            columns['symbol'].tolist(), columns['order_id'].tolist(), columns['quantity'].tolist(),
+            columns['action'].astype("U1").tolist(), columns['exchange'].tolist(), columns['side'].astype("U1").tolist(),
+            columns['price'].tolist(), columns['news'].tolist()):
+        # The CSV columns, as strings, in the CSV's order
+        line = (json.dumps({"Symbol": names[symbol], "OrderID": str(order_id), "Quantity": str(quantity),
+                            "Action": action, "Exchange": str(exchange), "Side": side, "Price": str(price),
+                            "News": str(news), "date": date}) + "\n").encode("utf-8")
+        json_parts.append(line)
+        offsets.append(offsets[-1] + len(line))
+    return FeedSegment(source, st.st_mtime_ns, st.st_size, store.rows,
+                       memoryview(b"".join(json_parts)), memoryview(array("Q", offsets)),
+                       memoryview(symbols), memoryview(records.tobytes()))
+
+
+class FilteredSegment(FeedSegment):
+    """
+    The rows of a FeedSegment that one subscription wants, gathered from the
+    segment's symbol buckets into contiguous buffers of their own, so they
+    stream as zero-copy slices too. The binary header only defines the
+    subscribed symbols; their ids are the segment's.
+    """
+    __slots__ = ("parent", "row_numbers")
+
+    def __init__(self, parent, subscription):
+        names, buckets = parent.symbol_buckets()
+        wanted = np.array([subscription.matches(name) for name in names], dtype=bool)
+        parts = [bucket for bucket, keep in zip(buckets, wanted) if keep]
+        rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+        if parent.binary_error is None:
+            records = np.frombuffer(parent.binary_data, dtype=RECORD_DTYPE)[rows]
+            symbols = np.frombuffer(parent.binary_symbols, dtype=SYMBOL_DTYPE)[wanted] if len(names) else b""
+        else:
+            records, symbols = np.empty(0, dtype=RECORD_DTYPE), b""
+        offsets = np.frombuffer(parent.json_offsets, dtype=np.uint64).astype(np.int64)
+        starts = offsets[rows]
+        lengths = offsets[rows + 1] - starts
+        json_offsets = np.zeros(len(rows) + 1, dtype=np.uint64)
+        np.cumsum(lengths, out=json_offsets[1:])
+        # Byte i of the filtered JSON is byte i + (start of its row - start of its row in the filtered data)
+        gather = np.repeat(starts - json_offsets[:-1].astype(np.int64), lengths) + np.arange(int(lengths.sum()))
+        json_data = np.frombuffer(parent.json_data, dtype=np.uint8)[gather]
+
+        super().__init__(f"{parent.source} [{subscription.describe()}]", parent.mtime_ns, parent.size, len(rows),
+                         memoryview(json_data.tobytes()), memoryview(json_offsets.tobytes()).cast("Q"),
+                         memoryview(bytes(symbols)), memoryview(records.tobytes()),
+                         binary_error=parent.binary_error)
+        self.parent = parent
+        self.row_numbers = rows
+
+    def is_stale(self):
+        return self.parent.is_stale()
+
+    def column(self, name):
+        values = self._columns.get(name)
+        if values is None:
+            column = self.parent.column(name)
+            values = self._columns[name] = [column[i] for i in self.row_numbers.tolist()]
+        return values
+
+    def orders(self, start, stop):
+        rows = self.row_numbers[start:stop].tolist()
+        return [order for i in rows for order in self.parent.orders(i, i + 1)]
+
+    def parent_rows(self, start, stop):
+        """The parent segment's rows up to and including the last of rows [start, stop)."""
+        if stop <= start:
+            return 0, 0
+        return 0, int(self.row_numbers[min(stop, self.rows) - 1]) + 1
+
+
+def write_segment_cache(segment, path):
+    """Write a segment to its cache file atomically (temp file + rename)."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    binary_error = (segment.binary_error or "").encode("utf-8")
+    with open(tmp, "wb") as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, segment.mtime_ns, segment.size, segment.rows,
+                                  len(segment.json_data), len(segment.binary_symbols), len(binary_error)))
+        f.write(segment.json_offsets)
+        f.write(segment.json_data)
+        f.write(segment.binary_symbols)
+        f.write(segment.binary_data)
+        f.write(binary_error)
+    os.replace(tmp, path)
+
+
+def map_segment_cache(source, path):
+    """Memory-map a segment cache file, or return None if it is missing or stale."""
+    try:
+        st = os.stat(source)
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    view = memoryview(mapped)
+    if len(view) < CACHE_HEADER.size:
+        return None
+    magic, mtime_ns, size, rows, json_len, symbols_len, error_len = CACHE_HEADER.unpack_from(view)
+    if magic != CACHE_MAGIC or mtime_ns != st.st_mtime_ns or size != st.st_size:
+        return None
+    pos = CACHE_HEADER.size
+    offsets_end = pos + (rows + 1) * 8
+    json_end = offsets_end + json_len
+    symbols_end = json_end + symbols_len
+    binary_rows = 0 if error_len else rows
+    binary_end = symbols_end + binary_rows * RECORD_SIZE
+    if len(view) != binary_end + error_len:
+        return None
+    binary_error = bytes(view[binary_end:]).decode("utf-8") if error_len else None
+    return FeedSegment(source, mtime_ns, size, rows, view[offsets_end:json_end],
+                       view[pos:offsets_end].cast("Q"), view[json_end:symbols_end],
+                       view[symbols_end:binary_end], mapped, binary_error)
+
+
+def load_segment(source, disk_cache=True):
+    path = source.rstrip(os.sep) + CACHE_SUFFIX  # Next to a tick store directory, not inside it
+    if disk_cache:
+        segment = map_segment_cache(source, path)
+        if segment is not None:
+            return segment
+    segment = encode_store_segment(source) if os.path.isdir(source) else encode_segment(source)
+    if disk_cache:
+        try:
+            write_segment_cache(segment, path)
+        except OSError as e:
+            print(f"Could not write feed cache {path}: {e}")
+    return segment
+
+
+class SharedFeed:
+    """
+    The server's single copy of the feed, shared by all client sessions.
+    Files whose CSV changed on disk are re-encoded the next time a session starts.
+    """
+
+    def __init__(self, files, disk_cache=True):
+        self.files = files
+        self.disk_cache = disk_cache
+        self._lock = threading.Lock()
+        self._segments = []
+        self._filtered = {}  # (segment, subscription key) -> FilteredSegment, oldest first
+        self._load(self._segments)
+
+    def _load(self, previous):
+        by_source = {segment.source: segment for segment in previous}
+        segments = []
+        for f in self.files:
+            segment = by_source.get(f)
+            if segment is None or segment.is_stale():
+                try:
+                    segment = load_segment(f, self.disk_cache)
+                except Exception as e:
+                    print(f"Error reading file {f}: {e}")
+                    continue
+                if segment.binary_error is not None:
+                    print(f"Serving {f} to JSON clients only, it doesn't fit the binary protocol "
+                          f"({segment.binary_error})")
+            segments.append(segment)
+        self._segments = segments
+        self._filtered = {key: filtered for key, filtered in self._filtered.items() if key[0] in segments}
+
+    def segments(self, subscription=None):
+        """
+        Current segments, reloading any whose CSV changed since they were
+        encoded; only the subscribed rows of each if a Subscription is given.
+        """
+        with self._lock:
+            if len(self._segments) != len(self.files) or any(s.is_stale() for s in self._segments):
+                self._load(self._segments)
+            if subscription is None:
+                return list(self._segments)
+            return [self._filter(segment, subscription) for segment in self._segments]
+
+    def _filter(self, segment, subscription):
+        key = (segment, subscription.key())
+        filtered = self._filtered.pop(key, None)
+        if filtered is None:
+            filtered = FilteredSegment(segment, subscription)
+            if len(self._filtered) >= MAX_FILTERED_SEGMENTS:
+                del self._filtered[next(iter(self._filtered))]
+        self._filtered[key] = filtered  # Most recently used last
+        return filtered
+
+    def __len__(self):
+        return sum(segment.rows for segment in self._segments)
+
@@ -0,0 +1,168 @@
+"""
+Streaming k-way merge of feed files, for tcp_server --merge-on.
+
+Without --merge-on the server sends its files one after the other. With it,
+every file (typically one per exchange or venue) is read lazily through its
+own CSV cursor, and the cursors are merged with a heap on a sequence or
+timestamp column (epoch seconds, a plain number, or ISO-8601), so rows go
+out in global order. Each file must already be in order on that column;
+rows with equal keys keep the order the files were given in.
+
+Only one pending row per file and the block of rows being sent are held in
+memory, so a multi-GB, multi-venue day replays in O(number of files) memory.
+Like the synthetic feed, each session runs its own merge and encodes rows
+as it sends them: it costs read and encode time per subscriber, where the
+pre-encoded feed of plain --files costs RAM once.
+
+    python tcp_server.py --files nyse.csv nasdaq.csv bats.csv --merge-on Timestamp --max-speed
+    python tcp_server.py --files nyse.csv nasdaq.csv --merge-on Timestamp --speed 10 --timestamp-column Timestamp
+"""
+import csv
+import datetime
+import heapq
+import json
+import struct
+import time
+from itertools import islice
+from operator import itemgetter
+from replay import parse_timestamp
+from wire_protocol import PROTOCOL_BINARY, RECORD_TICK, BinaryEncoder
+
+
+def check_columns(path, *columns):
+    """Raise ValueError unless the CSV file has every column."""
+    with open(path, newline='') as f:
+        fieldnames = csv.DictReader(f).fieldnames or []
+    for column in columns:
+        if column not in fieldnames:
+            raise ValueError(f"{path} has no '{column}' column")
+
+
+def file_rows(path, key_column):
+    """(key, path, line number, row) for each row of one CSV file, read one row at a time."""
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        previous = None
+        for row in reader:
+            key = parse_timestamp(row[key_column])
+            if previous is not None and key < previous:
+                raise ValueError(f"{path} line {reader.line_num}: '{key_column}' goes backwards "
+                                 f"({row[key_column]}), so the file can't be merged")
+            previous = key
+            yield key, path, reader.line_num, row
+
+
+def merged_entries(files, key_column, subscription=None):
+    """
+    (path, line number, row) of all files' rows in key order; equal keys keep
+    file order. Only the subscribed symbols' if given.
+    """
+    entries = (entry[1:] for entry in heapq.merge(*(file_rows(f, key_column) for f in files), key=itemgetter(0)))
+    if subscription is None:
+        return entries
+    matches = subscription.matches
+    return (entry for entry in entries if matches(entry[2]['Symbol']))
+
+
+def merged_rows(files, key_column, subscription=None):
+    """Rows of all files in key order (see merged_entries)."""
+    return (row for _, _, row in merged_entries(files, key_column, subscription))
+
+
+class MergedSegment:
+    """
+    One session's merged feed, in the interface of feed_cache.FeedSegment.
+    Rows are merged and encoded block by block as the session asks for them,
+    so they must be asked for in order. rows is unknown (infinite) until the
+    files run out. With a subscription, the other symbols' rows are dropped
+    before they are encoded. A row that doesn't fit the binary record raises
+    ValueError naming its file and line when a binary session reaches it.
+    """
+    binary_error = None  # Rows are encoded as they are sent
+
+    def __init__(self, files, key_column, subscription=None):
+        self.files = files
+        self.key_column = key_column
+        self.subscription = subscription
+        self.source = f"merge:{'+'.join(files)}"
+        if subscription is not None:
+            self.source += f" [{subscription.describe()}]"
+        self.rows = float("inf")
+        self._stream = merged_entries(files, key_column, subscription)
+        self._encoder = BinaryEncoder()  # Symbols are defined as they first appear
+        self._block = []
+        self._block_start = 0
+        self._no_orders = False
+
+    def column(self, name):
+        """Values of one column in merged order, from a merge of its own (for the real-time pacer)."""
+        return (row[name] for row in merged_rows(self.files, self.key_column, self.subscription))
+
+    def header(self, protocol):
+        return b""
+
+    def _rows(self, start, stop):
+        stop = min(stop, self.rows)
+        block_stop = self._block_start + len(self._block)
+        if stop > block_stop:
+            self._block = list(islice(self._stream, stop - block_stop))
+            self._block_start = block_stop
+            if len(self._block) < stop - block_stop:
+                self.rows = block_stop + len(self._block)
+        if start < self._block_start:
+            raise ValueError(f"{self.source}: rows must be read in order")
+        return self._block[start - self._block_start:stop - self._block_start]
+
+    def orders(self, start, stop):
+        """
+        (symbol, order id, side, price, quantity) of rows [start, stop), for
+        the matching engine. After a row that has no valid order, the rest of
+        the merge adds no orders (as FeedSegment does for a whole file).
+        """
+        entries = self._rows(start, stop)
+        if self._no_orders:
+            return []
+        try:
+            return [(row['Symbol'], int(row['OrderID']), row['Side'], float(row['Price']), int(row['Quantity']))
+                    for _, _, row in entries]
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"Not adding the orders of {self.source} to the order books: {e}")
+            self._no_orders = True
+            return []
+
+    def row_slice(self, protocol, start, stop):
+        entries = self._rows(start, stop)
+        if protocol == PROTOCOL_BINARY:
+            encode = self._encoder.encode
+            timestamp = time.time()
+            try:
+                return b"".join([encode(row, RECORD_TICK, timestamp) for _, _, row in entries])
+            except (KeyError, TypeError, ValueError, struct.error):
+                for path, line, row in entries:
+                    try:
+                        encode(row, RECORD_TICK, timestamp)
+                    except (KeyError, TypeError, ValueError, struct.error) as e:
+                        raise ValueError(f"{path} line {line} can't be sent as binary: {e}")
+                raise
+        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        lines = []
+        for _, _, row in entries:
+            row = dict(row, date=date)
+            lines.append(json.dumps(row) + "\n")
+        return "".join(lines).encode("utf-8")
+
+
+class MergedFeed:
+    """Stands in for SharedFeed: each session gets its own merge of the files."""
+
+    def __init__(self, files, key_column):
+        for path in files:
+            check_columns(path, key_column)
+        self.files = files
+        self.key_column = key_column
+
+    def describe(self):
+        return f"{len(self.files)} file(s) merged on '{self.key_column}'"
+
+    def segments(self, subscription=None):
+        return [MergedSegment(self.files, self.key_column, subscription)]
@@ -0,0 +1,145 @@
+"""
+Buffered, newline-framed reader for the CSV stream port.
+
+The server sends one JSON object per line. A single recv can return several
+lines, or a fraction of one, so FeedReader receives into one large reusable
+buffer with recv_into, frames complete lines on b"\\n", decodes every complete
+line from that read in one go and keeps any partial line for the next read.
+With the binary protocol (see wire_protocol.py) the same buffer is framed
+into fixed-size records instead.
+
+With stamps=True (the client asked for them in its hello) the server's clock
+records are stripped, and each message gets the "ServerTime" of the send it
+arrived in.
+"""
+import json
+from wire_protocol import PROTOCOL_BINARY, RECORD_SIZE, BinaryDecoder
+
+try:
+    import orjson  # Optional: faster decoding when installed
+except ImportError:
+    orjson = None
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+
+# orjson is fastest one line at a time; the stdlib decoder is fastest when all
+# lines are parsed as a single JSON array
+_decode_json_line = orjson.loads if orjson is not None else json.loads
+
+
+class FeedReader:
+    """
+    Reads newline-delimited JSON messages from a connected socket.
+
+    read_batch() blocks until at least one more chunk arrives and returns every
+    message completed by it (possibly an empty list), or None once the server
+    closes the connection. Lines that are not valid JSON are passed to
+    on_invalid and skipped; they never take neighbouring messages down with them.
+    """
+
+    def __init__(self, sock, buffer_size=DEFAULT_BUFFER_SIZE, on_invalid=None, protocol="json", stamps=False):
+        self.sock = sock
+        self.decoder = BinaryDecoder() if protocol == PROTOCOL_BINARY else None
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # First unconsumed byte
+        self._end = 0  # End of received data
+        self.on_invalid = on_invalid or (lambda line: print("Invalid JSON:", line))
+        self.messages_read = 0
+        self.bytes_read = 0
+        self.stamps = stamps
+        self.server_time = None
+
+    def _make_room(self):
+        if self._start > 0:
+            # Move the partial line to the front of the buffer
+            pending = self._end - self._start
+            self._buffer[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        if self._end == len(self._buffer):
+            # A single line is larger than the whole buffer
+            self._view.release()
+            self._buffer.extend(bytes(len(self._buffer)))
+            self._view = memoryview(self._buffer)
+
+    def read_batch(self):
+        if self._end == len(self._buffer):
+            self._make_room()
+        received = self.sock.recv_into(self._view[self._end:])
+        if not received:
+            return None
+        self._end += received
+        self.bytes_read += received
+
+        if self.decoder is not None:
+            return self._read_records()
+
+        last_newline = self._buffer.rfind(b"\n", self._start, self._end)
+        if last_newline < 0:
+            return []
+        chunk = bytes(self._view[self._start:last_newline])
+        self._start = last_newline + 1
+        if self._start == self._end:
+            self._start = self._end = 0
+
+        messages = self.decode_lines(chunk)
+        if self.stamps:
+            messages = self._apply_stamps(messages)
+        self.messages_read += len(messages)
+        return messages
+
+    def _apply_stamps(self, messages):
+        """Drop JSON clock lines and tag every other message with the latest one."""
+        stamped = []
+        server_time = self.server_time
+        for message in messages:
+            clock = message.get("Clock")
+            if clock is not None:
+                server_time = clock
+                continue
+            message["ServerTime"] = server_time
+            stamped.append(message)
+        self.server_time = server_time
+        return stamped
+
+    def _read_records(self):
+        usable = (self._end - self._start) // RECORD_SIZE * RECORD_SIZE
+        if not usable:
+            return []
+        chunk = bytes(self._view[self._start:self._start + usable])
+        self._start += usable
+        if self._start == self._end:
+            self._start = self._end = 0
+        messages = self.decoder.decode(chunk)
+        self.messages_read += len(messages)
+        return messages
+
+    def decode_lines(self, chunk):
+        """Decode newline-separated JSON objects (without the final newline) in one pass."""
+        try:
+            if orjson is not None:
+                return [orjson.loads(line) for line in chunk.split(b"\n")]
+            messages = json.loads(b"[" + chunk.replace(b"\n", b",") + b"]")
+            if len(messages) == chunk.count(b"\n") + 1:
+                return messages
+        except ValueError:
+            pass
+        # Blank or malformed lines; fall back to decoding line by line
+        messages = []
+        for line in chunk.split(b"\n"):
+            if not line.strip():
+                continue
+            try:
+                messages.append(_decode_json_line(line))
+            except ValueError:
+                self.on_invalid(line.decode("utf-8", errors="replace"))
+        return messages
+
+    def __iter__(self):
+        """Yield messages one at a time until the connection closes."""
+        while True:
+            messages = self.read_batch()
+            if messages is None:
+                return
+            yield from messages
@@ -0,0 +1,308 @@
+"""
+Background journal for the trading clients' per-tick ledger.
+
+The trading loop only appends a row tuple to an in-memory queue. A writer
+thread takes everything queued once flush_rows rows are waiting or every
+flush_interval seconds, whichever comes first, and writes it as one batch:
+
+- CSV: the trading_with_sentiment.csv format. Timestamps are recorded as
+  epoch seconds and formatted once per second of wall clock, not per row.
+- Columnar: a binary file of fixed-width column blocks (see
+  ColumnarLedgerWriter). Writing it formats no strings, and reading it back
+  with read_columnar is a NumPy view per column instead of CSV parsing. To
+  convert it to CSV:
+
+      python journal.py trading_with_sentiment.cols --csv ledger.csv
+
+With append (a client resuming from a checkpoint), both writers carry on
+from the end of an existing ledger instead of truncating it.
+
+If the writer falls far behind, record() writes the backlog itself, so
+memory stays bounded. Rows still queued when the process dies are lost,
+at most flush_interval seconds' worth.
+"""
+import argparse
+import csv
+import os
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import numpy as np
+
+LEDGER_FIELDS = ['Timestamp', 'Symbol', 'Price', 'PriceMA', 'Quantity',
+                 'Sentiment', 'TradeSignal', 'TradeQuantity', 'Portfolio', 'Capital']
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+JOURNAL_FORMATS = ("csv", "columnar", "both")
+COLUMNAR_SUFFIX = ".cols"
+CONSOLE_MODES = ("full", "summary", "quiet")
+
+DEFAULT_FLUSH_ROWS = 4096
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_SUMMARY_EVERY = 1000
+
+# Columnar file: magic, then blocks of (header, new symbol names, one array per column)
+COLUMNAR_MAGIC = b"LEDGCOL1"
+BLOCK_HEADER = struct.Struct("<II")  # Rows in the block, symbols first seen in the block
+SYMBOL_LENGTH = struct.Struct("<H")
+COLUMN_TYPES = [np.dtype(t) for t in ("<f8", "<u4", "<f8", "<f8", "<i8", "<f8", "u1", "<i8", "<i8", "<f8")]
+SIGNALS = ["WAIT", "BUY", "SELL"]
+SIGNAL_CODES = {name: code for code, name in enumerate(SIGNALS)}
+
+
+class CsvLedgerWriter:
+    def __init__(self, path, append=False):
+        self.path = path
+        self.file = open(path, 'a' if append else 'w', newline='')
+        self.writer = csv.writer(self.file)
+        if self.file.tell() == 0:
+            self.writer.writerow(LEDGER_FIELDS)
+        self._second = None
+        self._stamp = None
+
+    def write(self, rows):
+        out = []
+        for row in rows:
+            second = int(row[0])
+            if second != self._second:
+                self._second = second
+                self._stamp = datetime.fromtimestamp(second).strftime(TIMESTAMP_FORMAT)
+            price_ma = row[3]
+            out.append((self._stamp, row[1], row[2], 'Calculating...' if price_ma is None else price_ma) + row[4:])
+        self.writer.writerows(out)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ColumnarLedgerWriter:
+    """
+    Writes each batch as one block: the block header, the names of symbols not
+    seen in earlier blocks (their ids follow on from the previous blocks'),
+    then every column as a little-endian array of COLUMN_TYPES. Symbols and
+    signals are stored as ids, and a missing PriceMA as NaN.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        symbols = columnar_symbols(path) if append and os.path.exists(path) else None
+        if symbols is None:
+            self.file = open(path, 'wb')
+            self.file.write(COLUMNAR_MAGIC)
+            self.symbol_ids = {}
+        else:
+            self.file = open(path, 'ab')
+            self.symbol_ids = {symbol: i for i, symbol in enumerate(symbols)}
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        symbol_ids = self.symbol_ids
+        new_symbols = []
+        for symbol in dict.fromkeys(columns[1]):
+            if symbol not in symbol_ids:
+                symbol_ids[symbol] = len(symbol_ids)
+                new_symbols.append(symbol)
+        columns[1] = [symbol_ids[symbol] for symbol in columns[1]]
+        columns[3] = [np.nan if ma is None else ma for ma in columns[3]]
+        columns[6] = [SIGNAL_CODES[signal] for signal in columns[6]]
+
+        parts = [BLOCK_HEADER.pack(len(rows), len(new_symbols))]
+        for symbol in new_symbols:
+            name = symbol.encode("utf-8")
+            parts.append(SYMBOL_LENGTH.pack(len(name)) + name)
+        for values, dtype in zip(columns, COLUMN_TYPES):
+            parts.append(np.asarray(values, dtype=dtype).tobytes())
+        self.file.write(b"".join(parts))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def columnar_symbols(path):
+    """Symbol names of an existing columnar ledger in id order, read from the block headers; None if it is empty."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data:
+        return None
+    if not data.startswith(COLUMNAR_MAGIC):
+        raise ValueError(f"{path} is not a columnar ledger")
+    row_size = sum(dtype.itemsize for dtype in COLUMN_TYPES)
+    symbols = []
+    offset = len(COLUMNAR_MAGIC)
+    while offset < len(data):
+        n_rows, n_symbols = BLOCK_HEADER.unpack_from(data, offset)
+        offset += BLOCK_HEADER.size
+        for _ in range(n_symbols):
+            (length,) = SYMBOL_LENGTH.unpack_from(data, offset)
+            offset += SYMBOL_LENGTH.size
+            symbols.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+        offset += n_rows * row_size
+    return symbols
+
+
+def read_columnar(path):
+    """
+    Load a columnar ledger as {field: numpy array}. Symbol and TradeSignal come
+    back as names, PriceMA as NaN while it was being calculated, and Sentiment
+    always as a float.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(COLUMNAR_MAGIC):
+        raise ValueError(f"{path} is not a columnar ledger")
+    symbols = []
+    blocks = [[] for _ in LEDGER_FIELDS]
+    offset = len(COLUMNAR_MAGIC)
+    while offset < len(data):
+        n_rows, n_symbols = BLOCK_HEADER.unpack_from(data, offset)
+        offset += BLOCK_HEADER.size
+        for _ in range(n_symbols):
+            (length,) = SYMBOL_LENGTH.unpack_from(data, offset)
+            offset += SYMBOL_LENGTH.size
+            symbols.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+        for column, dtype in zip(blocks, COLUMN_TYPES):
+            column.append(np.frombuffer(data, dtype=dtype, count=n_rows, offset=offset))
+            offset += n_rows * dtype.itemsize
+    ledger = {}
+    for name, column, dtype in zip(LEDGER_FIELDS, blocks, COLUMN_TYPES):
+        ledger[name] = np.concatenate(column) if column else np.empty(0, dtype=dtype)
+    ledger['Symbol'] = np.array(symbols, dtype=object)[ledger['Symbol']] if symbols else ledger['Symbol'].astype(object)
+    ledger['TradeSignal'] = np.array(SIGNALS, dtype=object)[ledger['TradeSignal']]
+    return ledger
+
+
+def journal_paths(output_file, journal_format):
+    """The CSV and/or columnar paths a client writes for --output / --journal-format."""
+    paths = []
+    if journal_format in ("csv", "both"):
+        paths.append(output_file)
+    if journal_format in ("columnar", "both"):
+        paths.append(os.path.splitext(output_file)[0] + COLUMNAR_SUFFIX)
+    return paths
+
+
+class Journal:
+    """
+    Ledger rows in, batched writes to one or more ledger writers out.
+    Rows are tuples in LEDGER_FIELDS order, with Timestamp as epoch seconds
+    and None for a PriceMA that is still being calculated.
+    """
+
+    def __init__(self, writers, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.writers = writers
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_pending = flush_rows * 16  # Beyond this record() writes the backlog itself
+        self.rows_written = 0
+        self.batches = 0
+        self._pending = deque()
+        self._due = threading.Event()
+        self._write_lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def open(cls, output_file, journal_format="csv", append=False, **kwargs):
+        writers = []
+        for path in journal_paths(output_file, journal_format):
+            writer = ColumnarLedgerWriter if path.endswith(COLUMNAR_SUFFIX) else CsvLedgerWriter
+            writers.append(writer(path, append=append))
+        return cls(writers, **kwargs)
+
+    def record(self, row):
+        pending = self._pending
+        pending.append(row)
+        if len(pending) >= self.flush_rows:
+            if len(pending) >= self.max_pending:
+                self._write_pending()
+            else:
+                self._due.set()
+
+    def close(self):
+        """Write everything still queued and close the files."""
+        self._running = False
+        self._due.set()
+        self._thread.join()
+        self._write_pending()
+        for writer in self.writers:
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_pending(self):
+        with self._write_lock:
+            pending = self._pending
+            rows = [pending.popleft() for _ in range(len(pending))]
+            if not rows:
+                return
+            for writer in self.writers:
+                writer.write(rows)
+                writer.flush()
+            self.rows_written += len(rows)
+            self.batches += 1
+
+    def _run(self):
+        while self._running:
+            self._due.wait(self.flush_interval)
+            self._due.clear()
+            try:
+                self._write_pending()
+            except Exception as e:
+                print(f"Journal write error: {e}")
+
+
+class ConsoleSummary:
+    """Tick counter for --console summary/quiet: one status line every `every` ticks instead of a block per tick."""
+
+    def __init__(self, every=DEFAULT_SUMMARY_EVERY):
+        self.every = every
+        self.ticks = 0
+        self.started = time.perf_counter()
+
+    def tick(self):
+        """Count a tick; True when a summary line is due."""
+        self.ticks += 1
+        return self.ticks % self.every == 0
+
+    def line(self, available_capital, total_portfolio_value, profit_loss, executed_profit_loss):
+        elapsed = time.perf_counter() - self.started
+        rate = self.ticks / elapsed if elapsed > 0 else 0.0
+        return (f"{self.ticks:,} ticks ({rate:,.0f}/s) | Capital: ${available_capital:,.2f} | "
+                f"Portfolio Value: ${total_portfolio_value:,.2f} | Profit/Loss: ${profit_loss:,.2f} | "
+                f"Executed Profit/Loss: ${executed_profit_loss:,.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or convert a columnar trading ledger")
+    parser.add_argument("path", help="Columnar ledger written with --journal-format columnar or both")
+    parser.add_argument("--csv", help="Write the ledger to this CSV file in the trading_with_sentiment.csv format")
+    args = parser.parse_args()
+
+    ledger = read_columnar(args.path)
+    n = len(ledger['Timestamp'])
+    if args.csv:
+        writer = CsvLedgerWriter(args.csv)
+        columns = [ledger[name].tolist() for name in LEDGER_FIELDS]
+        columns[3] = [None if ma != ma else ma for ma in columns[3]]
+        writer.write(list(zip(*columns)))
+        writer.close()
+        print(f"Wrote {n:,} rows to {args.csv}")
+    else:
+        print(f"{n:,} rows, {len(set(ledger['Symbol'].tolist())):,} symbols")
+        if n:
+            print(f"Final capital: ${ledger['Capital'][-1]:,.2f}")
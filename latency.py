@@ -0,0 +1,171 @@
+"""
+Latency histograms and per-stage timing for the trading clients.
+
+LatencyHistogram is an HDR-style log-linear histogram of nanosecond values.
+Values below 2**(SUB_BITS + 1) ns get a bucket each. Above that, every
+power of two is split into 2**SUB_BITS equal buckets, so a percentile is
+reported to within about 1.6% of the true value. Recording is a bit_length,
+a shift and a list increment, and a histogram is a few thousand counters.
+
+Stats.instrument() times a method by replacing it with a wrapper that
+records perf_counter_ns() around each call. The clients wrap their own
+objects' methods, or a timed_subclass() of a class they instantiate, never a
+shared class, so one client's stats don't time another client in the same
+process. Nothing is wrapped unless stats are enabled (--stats in the
+clients), so with stats off the clients run exactly the code they ran before. Stats.serve() answers GET requests on a
+local port with a JSON snapshot of every histogram:
+
+    curl -s localhost:9100
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SUB_BITS = 6
+N_BUCKETS = 64 << SUB_BITS  # Enough for any value below 2**63 ns
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value):
+    shift = value.bit_length() - SUB_BITS - 1
+    if shift <= 0:
+        return value
+    return (shift << SUB_BITS) + (value >> shift)
+
+
+def bucket_high(index):
+    """Largest value that lands in bucket `index`."""
+    shift = (index >> SUB_BITS) - 1
+    if shift <= 0:
+        return index
+    return ((index - (shift << SUB_BITS) + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    def __init__(self, name):
+        self.name = name
+        self.counts = [0] * N_BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, ns):
+        if ns < 0:
+            ns = 0  # A wall clock stepped backwards between two hosts/processes
+        shift = ns.bit_length() - SUB_BITS - 1  # bucket_index(ns), inlined
+        self.counts[ns if shift <= 0 else (shift << SUB_BITS) + (ns >> shift)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile, in ns (0 when empty)."""
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * p // 100))  # ceil, at least the first value
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= rank:
+                    return min(bucket_high(index), self.max)
+        return self.max
+
+    def summary(self):
+        """Count, mean, min, max and PERCENTILES, all in microseconds."""
+        summary = {"count": self.count}
+        if self.count:
+            summary["mean_us"] = round(self.total / self.count / 1000, 3)
+            summary["min_us"] = round(self.min / 1000, 3)
+            summary["max_us"] = round(self.max / 1000, 3)
+            for p in PERCENTILES:
+                summary[f"p{p:g}_us"] = round(self.percentile(p) / 1000, 3)
+        return summary
+
+
+class Stats:
+    """A set of named histograms, with helpers to time methods and to publish snapshots."""
+
+    def __init__(self):
+        self.histograms = {}
+        self.started = time.time()
+        self._server = None
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram(name)
+        return histogram
+
+    def instrument(self, target, attribute, stage=None):
+        """Time every call of target.attribute (an instance's or a class's method) into histogram `stage`."""
+        func = getattr(target, attribute)
+        record = self.histogram(stage or attribute).record
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(clock() - start)
+
+        setattr(target, attribute, timed)
+
+    def timed_subclass(self, cls, attribute, stage=None):
+        """A subclass of cls whose `attribute` method is timed, for one client to instantiate instead of cls."""
+        subclass = type(f"Timed{cls.__name__}", (cls,), {"__slots__": ()})
+        self.instrument(subclass, attribute, stage)
+        return subclass
+
+    def snapshot(self):
+        return {
+            "uptime_s": round(time.time() - self.started, 3),
+            "histograms": {name: histogram.summary() for name, histogram in list(self.histograms.items())},
+        }
+
+    def report(self):
+        """The snapshot as a table, one histogram per line."""
+        columns = ["count", "mean_us"] + [f"p{p:g}_us" for p in PERCENTILES] + ["max_us"]
+        width = max([len(name) for name in self.histograms] + [5])
+        lines = [f"{'stage':<{width}} " + " ".join(f"{column:>11}" for column in columns)]
+        for name, histogram in list(self.histograms.items()):
+            summary = histogram.summary()
+            lines.append(f"{name:<{width}} " + " ".join(
+                f"{summary.get(column, 0):>11,}" if column == "count" else f"{summary.get(column, 0):>11,.1f}"
+                for column in columns))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Answer GET requests on host:port with the JSON snapshot, from a daemon thread."""
+        stats = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(stats.snapshot(), indent=2).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep the client's console for the client
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="stats-endpoint", daemon=True).start()
+        print(f"Stats endpoint listening on http://{host}:{port}/")
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
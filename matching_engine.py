@@ -0,0 +1,285 @@
+"""
+Per-symbol limit order books and price-time priority matching for the order port.
+
+Each book keeps its bid and ask price levels in sorted lists (best price at
+the end, so the hot path only ever pops from the tail) and a FIFO deque of
+resting orders per level. An incoming order trades against the opposite side
+at the resting orders' prices for as long as it crosses, and whatever is
+left rests at its limit price.
+
+Liquidity comes from two places: orders sent by clients on the order port,
+and the market's own orders replayed from the feed (see MarketReplay), so a
+client's order fills against what the feed actually showed rather than at
+the last tick price.
+
+Run this module directly to benchmark the engine in-process:
+
+    python matching_engine.py --orders 500000
+"""
+import argparse
+import random
+import threading
+import time
+from bisect import insort
+from collections import deque
+
+BUY = "B"
+SELL = "S"
+
+# Order status in acknowledgements
+STATUS_NEW = "N"  # Resting, nothing filled yet
+STATUS_PARTIAL = "P"  # Partly filled, rest is resting
+STATUS_FILLED = "F"  # Completely filled
+STATUS_REJECTED = "R"
+
+
+class Order:
+    __slots__ = ("order_id", "owner", "symbol", "side", "price", "quantity", "remaining")
+
+    def __init__(self, order_id, owner, symbol, side, price, quantity):
+        self.order_id = order_id
+        self.owner = owner  # Gets owner.filled(order, quantity, price) calls; None for the feed's own orders
+        self.symbol = symbol
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.remaining = quantity
+
+    def status(self):
+        if self.remaining == 0:
+            return STATUS_FILLED
+        return STATUS_PARTIAL if self.remaining < self.quantity else STATUS_NEW
+
+
+class Fill:
+    __slots__ = ("taker", "maker", "price", "quantity")
+
+    def __init__(self, taker, maker, price, quantity):
+        self.taker = taker
+        self.maker = maker
+        self.price = price
+        self.quantity = quantity
+
+
+class BookSide:
+    """
+    Price levels of one side. Levels are keyed so that the best price sorts
+    last: the price itself for bids, the negated price for asks.
+    """
+    __slots__ = ("sign", "keys", "levels")
+
+    def __init__(self, sign):
+        self.sign = sign
+        self.keys = []
+        self.levels = {}
+
+    def add(self, order):
+        key = order.price * self.sign
+        queue = self.levels.get(key)
+        if queue is None:
+            queue = self.levels[key] = deque()
+            insort(self.keys, key)
+        queue.append(order)
+
+    def remove(self, order):
+        key = order.price * self.sign
+        queue = self.levels[key]
+        queue.remove(order)
+        if not queue:
+            del self.levels[key]
+            self.keys.remove(key)
+
+    def best(self):
+        return self.keys[-1] * self.sign if self.keys else None
+
+    def depth(self, levels=5):
+        """[(price, total quantity), ...] from the best level outwards."""
+        out = []
+        for key in reversed(self.keys[-levels:]):
+            out.append((key * self.sign, sum(o.remaining for o in self.levels[key])))
+        return out
+
+
+class OrderBook:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide(1)
+        self.asks = BookSide(-1)
+
+    def match(self, order, fills):
+        """Trade `order` against the opposite side while it crosses; returns the resting orders that were filled completely."""
+        if order.side == BUY:
+            opposite, limit = self.asks, -order.price
+        else:
+            opposite, limit = self.bids, order.price
+        keys = opposite.keys
+        levels = opposite.levels
+        done = []
+        remaining = order.remaining
+        # Opposite keys are best-last; the order crosses while best key >= its own limit key
+        while remaining and keys and keys[-1] >= limit:
+            key = keys[-1]
+            queue = levels[key]
+            price = key * opposite.sign
+            while remaining and queue:
+                maker = queue[0]
+                quantity = remaining if remaining < maker.remaining else maker.remaining
+                remaining -= quantity
+                maker.remaining -= quantity
+                fills.append(Fill(order, maker, price, quantity))
+                if maker.remaining == 0:
+                    queue.popleft()
+                    done.append(maker)
+            if not queue:
+                keys.pop()
+                del levels[key]
+        order.remaining = remaining
+        return done
+
+    def rest(self, order):
+        (self.bids if order.side == BUY else self.asks).add(order)
+
+    def remove(self, order):
+        (self.bids if order.side == BUY else self.asks).remove(order)
+
+
+class MatchingEngine:
+    """
+    All order books, plus an index of resting orders by (owner, order id) so
+    orders can be cancelled or replaced. Safe to call from several threads.
+    """
+
+    def __init__(self):
+        self.books = {}
+        self.resting = {}
+        self.lock = threading.Lock()
+        self._next_id = 1
+        self.orders_processed = 0
+        self.fills = 0
+
+    def book(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = OrderBook(symbol)
+        return book
+
+    def submit(self, symbol, side, price, quantity, owner=None, order_id=None):
+        """
+        Match a new limit order and rest any remainder.
+        Returns (order, fills); order.remaining is what is left on the book.
+        """
+        with self.lock:
+            return self._submit(symbol, side, price, quantity, owner, order_id)
+
+    def replace(self, symbol, side, price, quantity, owner=None, order_id=None):
+        """Cancel the resting order with this id (if any) and submit its new version, which loses time priority."""
+        with self.lock:
+            self._cancel(owner, order_id)
+            return self._submit(symbol, side, price, quantity, owner, order_id)
+
+    def cancel(self, owner, order_id):
+        """Remove a resting order; returns it, or None if it was not resting."""
+        with self.lock:
+            return self._cancel(owner, order_id)
+
+    def cancel_all(self, owner):
+        """Remove every resting order of one owner (e.g. a disconnected client)."""
+        with self.lock:
+            for key in [key for key in self.resting if key[0] is owner]:
+                self._cancel(*key)
+
+    def _submit(self, symbol, side, price, quantity, owner, order_id):
+        if order_id is None:
+            order_id = self._next_id
+            self._next_id += 1
+        order = Order(order_id, owner, symbol, side, price, quantity)
+        self.orders_processed += 1
+        fills = []
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = OrderBook(symbol)
+        resting = self.resting
+        for maker in book.match(order, fills):
+            del resting[(maker.owner, maker.order_id)]
+        if order.remaining:
+            book.rest(order)
+            resting[(owner, order_id)] = order
+        self.fills += len(fills)
+        return order, fills
+
+    def _cancel(self, owner, order_id):
+        order = self.resting.pop((owner, order_id), None)
+        if order is not None:
+            self.books[order.symbol].remove(order)
+        return order
+
+
+class MarketReplay:
+    """
+    Applies the feed's own orders to the engine as the feed is streamed, so
+    the books hold the liquidity subscribers are seeing. Each feed row is
+    applied once, when the furthest-ahead subscriber reaches it, and replaces
+    any resting feed order with the same OrderID ('A' and 'M' rows alike).
+    A session that starts while no other session is streaming starts a new
+    replay, and the feed's orders from the previous one are removed.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.active_sessions = 0
+        self.applied = {}  # Segment source -> rows applied
+
+    def session_started(self):
+        with self.lock:
+            if self.active_sessions == 0:
+                self.engine.cancel_all(None)
+                self.applied = {}
+            self.active_sessions += 1
+
+    def session_finished(self):
+        with self.lock:
+            self.active_sessions -= 1
+
+    def advance(self, segment, start, stop):
+        """Called with each range of rows a session is about to send."""
+        with self.lock:
+            applied = self.applied.get(segment.source, 0)
+            if stop <= applied:
+                return
+            engine = self.engine
+            for symbol, order_id, side, price, quantity in segment.orders(max(start, applied), stop):
+                _, fills = engine.replace(symbol, side, price, quantity, None, order_id)
+                for fill in fills:
+                    if fill.maker.owner is not None:
+                        fill.maker.owner.filled(fill.maker, fill.quantity, fill.price)
+            self.applied[segment.source] = stop
+
+
+def benchmark(n_orders, n_symbols=50, seed=1):
+    """Submit n_orders random limit orders around a fixed mid price; returns orders per second."""
+    rng = random.Random(seed)
+    symbols = [f"SYM{i}" for i in range(n_symbols)]
+    orders = []
+    for _ in range(n_orders):
+        side = BUY if rng.random() < 0.5 else SELL
+        offset = rng.randint(-20, 20) / 100  # Orders within 20 ticks of the mid cross roughly half the time
+        orders.append((rng.choice(symbols), side, round(100 + offset, 2), rng.randint(1, 10) * 100))
+    engine = MatchingEngine()
+    submit = engine.submit
+    start = time.perf_counter()
+    for symbol, side, price, quantity in orders:
+        submit(symbol, side, price, quantity)
+    elapsed = time.perf_counter() - start
+    print(f"{n_orders:,} orders in {elapsed:.3f}s: {n_orders / elapsed:,.0f} orders/s, "
+          f"{engine.fills:,} fills, {len(engine.resting):,} resting")
+    return n_orders / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the matching engine in-process")
+    parser.add_argument("--orders", type=int, default=200000, help="Number of random orders to submit")
+    parser.add_argument("--symbols", type=int, default=50, help="Number of order books")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    benchmark(args.orders, args.symbols, args.seed)
@@ -0,0 +1,106 @@
+"""
+Low-latency XGBoost scoring for the trading client.
+
+ModelScorer writes feature rows into a preallocated float32 buffer and scores
+them with Booster.inplace_predict, so no DMatrix is built per tick.
+MicroBatcher coalesces ticks that arrive together (across symbols) into one
+prediction call, bounded by a max batch size and a max wait.
+"""
+import time
+import numpy as np
+
+N_FEATURES = 6  # price, price_ma, volume_signal, news, buy_volume_ma, sell_volume_ma
+
+BUY_THRESHOLD = 0.6
+SELL_THRESHOLD = 0.4
+
+
+def signal_from_probability(probability):
+    """
+    Map the model's probability of upward movement to a trade signal:
+        - If probability > 0.6, signal BUY;
+        - If probability < 0.4, signal SELL;
+        - Otherwise, signal WAIT.
+    """
+    if probability > BUY_THRESHOLD:
+        return "BUY"
+    elif probability < SELL_THRESHOLD:
+        return "SELL"
+    return "WAIT"
+
+
+class ModelScorer:
+    """Scores one or many feature rows through a reusable float32 buffer."""
+
+    def __init__(self, model, max_batch=256, n_features=N_FEATURES):
+        self.model = model
+        self.max_batch = max_batch
+        self._buffer = np.zeros((max_batch, n_features), dtype=np.float32)
+        self._single = self._buffer[:1]
+
+    def score_one(self, features):
+        self._single[0] = features
+        return float(self.model.inplace_predict(self._single, validate_features=False)[0])
+
+    def score_batch(self, feature_rows):
+        """Probabilities for a list of feature rows, in order."""
+        probabilities = []
+        for start in range(0, len(feature_rows), self.max_batch):
+            chunk = feature_rows[start:start + self.max_batch]
+            batch = self._buffer[:len(chunk)]
+            batch[:] = chunk
+            probabilities.extend(self.model.inplace_predict(batch, validate_features=False).tolist())
+        return probabilities
+
+
+class MicroBatcher:
+    """
+    Collects (features, context) pairs and scores them together.
+
+    A batch is due once it holds max_batch rows or its oldest row has waited
+    max_wait seconds; the caller may also flush early, e.g. when no more ticks
+    are immediately available. flush() returns (context, trade_signal) pairs
+    in arrival order.
+    """
+
+    def __init__(self, scorer, max_batch=64, max_wait=0.001):
+        self.scorer = scorer
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._features = []
+        self._contexts = []
+        self._oldest = None
+
+    def __len__(self):
+        return len(self._contexts)
+
+    def add(self, features, context):
+        if not self._contexts:
+            self._oldest = time.monotonic()
+        self._features.append(features)
+        self._contexts.append(context)
+
+    def time_left(self):
+        """Seconds until the pending batch is due, or None when nothing is pending."""
+        if not self._contexts:
+            return None
+        if len(self._contexts) >= self.max_batch:
+            return 0.0
+        return max(0.0, self._oldest + self.max_wait - time.monotonic())
+
+    def due(self):
+        left = self.time_left()
+        return left is not None and left <= 0.0
+
+    def flush(self):
+        if not self._contexts:
+            return []
+        if len(self._features) == 1:
+            probabilities = [self.scorer.score_one(self._features[0])]
+        else:
+            probabilities = self.scorer.score_batch(self._features)
+        decided = [(context, signal_from_probability(p)) for context, p in zip(self._contexts, probabilities)]
+        self._features = []
+        self._contexts = []
+        self._oldest = None
+        return decided
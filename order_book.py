@@ -0,0 +1,170 @@
+"""
+Client-side L2 order books rebuilt from the feed.
+
+Every feed row is an order event: 'A' adds an order, 'M' modifies it
+(price, quantity or side) and 'D' (or a zero quantity) removes it. Orders
+are tracked by OrderID in one book per (symbol, exchange) and aggregated
+into price levels per side:
+
+- finding an order or a level is a dict lookup;
+- creating or emptying a level is a bisect into the side's sorted prices;
+- best bid/ask are the last sorted key, and top-of-book depth is cached
+  until the side changes.
+
+BookBuilder.features() merges a symbol's exchanges into the feature
+store's book input (see feature_store.py).
+"""
+from bisect import bisect_left, insort
+
+DEFAULT_DEPTH_LEVELS = 5
+
+# Extra model inputs, appended to the feature vector when the model was trained with them
+BOOK_FEATURES = ["best_bid", "best_ask", "spread", "bid_depth", "ask_depth", "imbalance"]
+BOOK_IMBALANCE = BOOK_FEATURES.index("imbalance")
+
+
+class PriceLevels:
+    """
+    Aggregate size per price for one side of a book. Keys are signed so the
+    best price always sorts last: the price for bids, minus the price for asks.
+    """
+    __slots__ = ("sign", "keys", "sizes", "_depth", "_depth_levels")
+
+    def __init__(self, sign, depth_levels=DEFAULT_DEPTH_LEVELS):
+        self.sign = sign
+        self.keys = []
+        self.sizes = {}
+        self._depth = None
+        self._depth_levels = depth_levels
+
+    def add(self, price, quantity):
+        key = price * self.sign
+        sizes = self.sizes
+        size = sizes.get(key)
+        if size is None:
+            insort(self.keys, key)
+            sizes[key] = quantity
+        else:
+            sizes[key] = size + quantity
+        self._depth = None
+
+    def remove(self, price, quantity):
+        key = price * self.sign
+        sizes = self.sizes
+        size = sizes[key] - quantity
+        if size > 0:
+            sizes[key] = size
+        else:
+            del sizes[key]
+            keys = self.keys
+            del keys[bisect_left(keys, key)]
+        self._depth = None
+
+    def best(self):
+        return self.keys[-1] * self.sign if self.keys else None
+
+    def depth(self):
+        """Total size of the best depth_levels levels."""
+        if self._depth is None:
+            sizes = self.sizes
+            self._depth = sum(sizes[key] for key in self.keys[-self._depth_levels:])
+        return self._depth
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class L2Book:
+    """One symbol on one exchange: live orders by OrderID and their price levels."""
+    __slots__ = ("symbol", "exchange", "orders", "bids", "asks")
+
+    def __init__(self, symbol, exchange, depth_levels=DEFAULT_DEPTH_LEVELS):
+        self.symbol = symbol
+        self.exchange = exchange
+        self.orders = {}  # OrderID -> (is_bid, price, quantity)
+        self.bids = PriceLevels(1, depth_levels)
+        self.asks = PriceLevels(-1, depth_levels)
+
+    def apply(self, order_id, action, is_bid, price, quantity):
+        orders = self.orders
+        previous = orders.pop(order_id, None)
+        if previous is not None:
+            (self.bids if previous[0] else self.asks).remove(previous[1], previous[2])
+        if action == "D" or quantity <= 0:
+            return
+        orders[order_id] = (is_bid, price, quantity)
+        (self.bids if is_bid else self.asks).add(price, quantity)
+
+
+class BookBuilder:
+    """All books seen on the feed, updated one feed message at a time."""
+
+    def __init__(self, depth_levels=DEFAULT_DEPTH_LEVELS):
+        self.depth_levels = depth_levels
+        self.books = {}  # (symbol, exchange) -> L2Book
+        self.by_symbol = {}  # symbol -> [L2Book, ...], one per exchange
+        self.updates = 0
+
+    def book(self, symbol, exchange):
+        book = self.books.get((symbol, exchange))
+        if book is None:
+            book = self.books[(symbol, exchange)] = L2Book(symbol, exchange, self.depth_levels)
+            self.by_symbol.setdefault(symbol, []).append(book)
+        return book
+
+    def update(self, message):
+        """Apply one feed message (JSON strings or binary-decoded values). Rows without an OrderID are ignored."""
+        order_id = message.get("OrderID")
+        if order_id is None or order_id == "":
+            return
+        self.updates += 1
+        symbol = message["Symbol"]
+        exchange = message.get("Exchange") or 0
+        book = self.books.get((symbol, exchange))
+        if book is None:
+            book = self.book(symbol, exchange)
+        book.apply(int(order_id), message.get("Action", "A"), message.get("Side", "B") == "B",
+                   float(message["Price"]), int(message["Quantity"]))
+
+    def live_orders(self):
+        return sum(len(book.orders) for book in self.books.values())
+
+    def top_of_book(self, symbol):
+        """(best bid, best ask) across the symbol's exchanges; None for an empty side."""
+        best_bid = best_ask = None
+        for book in self.by_symbol.get(symbol, ()):
+            bid = book.bids.best()
+            ask = book.asks.best()
+            if bid is not None and (best_bid is None or bid > best_bid):
+                best_bid = bid
+            if ask is not None and (best_ask is None or ask < best_ask):
+                best_ask = ask
+        return best_bid, best_ask
+
+    def depth(self, symbol):
+        """(bid size, ask size) in the top levels of each of the symbol's exchanges."""
+        bid_depth = ask_depth = 0
+        for book in self.by_symbol.get(symbol, ()):
+            bid_depth += book.bids.depth()
+            ask_depth += book.asks.depth()
+        return bid_depth, ask_depth
+
+    def imbalance(self, symbol):
+        """(bid depth - ask depth) / (bid depth + ask depth), from -1 (all asks) to 1 (all bids)."""
+        bid_depth, ask_depth = self.depth(symbol)
+        total = bid_depth + ask_depth
+        return (bid_depth - ask_depth) / total if total else 0.0
+
+    def features(self, symbol):
+        """Values for BOOK_FEATURES, with 0 for anything the book doesn't have yet."""
+        best_bid, best_ask = self.top_of_book(symbol)
+        bid_depth, ask_depth = self.depth(symbol)
+        total = bid_depth + ask_depth
+        return [
+            best_bid or 0.0,
+            best_ask or 0.0,
+            best_ask - best_bid if best_bid is not None and best_ask is not None else 0.0,
+            bid_depth,
+            ask_depth,
+            (bid_depth - ask_depth) / total if total else 0.0,
+        ]
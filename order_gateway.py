@@ -0,0 +1,230 @@
+"""
+Non-blocking order gateway for the trading clients.
+
+submit() only assigns a client order id and queues the order; a dedicated
+I/O thread owns the order socket. Each time it wakes it sends everything
+queued since its last write as one write, and reads the server's execution
+reports back. submit() never touches the socket, so order I/O can't stall
+the strategy loop.
+
+Every order stays outstanding until a report says it is completely filled
+or rejected. If the connection drops, the thread reconnects with
+exponential backoff and resends all outstanding orders. The server cancels
+a client's resting orders on disconnect, so each one is resent with only
+its unfilled quantity. An order whose ACK was lost along with the
+connection can be executed twice (at-least-once delivery).
+
+Given a latency histogram and the ServerTime of the tick an order came from,
+the gateway records server send -> order written latency right after each
+order's first write.
+"""
+import json
+import select
+import socket
+import threading
+import time
+from collections import deque
+from feed_reader import FeedReader
+from wire_protocol import PROTOCOL_BINARY, RECORD_ORDER, BinaryEncoder, send_hello
+
+DEFAULT_MAX_QUEUED = 10000  # Orders waiting to be written; submit() refuses more
+INITIAL_BACKOFF = 0.05
+MAX_BACKOFF = 5.0
+REPORT_BUFFER_SIZE = 64 * 1024
+
+# Order statuses that end an order (see matching_engine)
+FINAL_STATUSES = ("F", "R")
+
+
+class OutstandingOrder:
+    __slots__ = ("message", "remaining", "acked", "server_time")
+
+    def __init__(self, message, server_time=None):
+        self.message = message
+        self.remaining = int(message["Quantity"])
+        self.acked = False
+        self.server_time = server_time  # time.time_ns() at which the server sent the tick; None once measured
+
+
+class OrderGateway:
+    def __init__(self, host, port, protocol="json", max_queued=DEFAULT_MAX_QUEUED, latency=None):
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.max_queued = max_queued
+        self.outstanding = {}  # Client order id -> OutstandingOrder
+        self.dropped = 0
+        self.latency = latency  # LatencyHistogram for tick-to-order latency, or None
+        self.reconnects = 0
+        self._queue = deque()  # Client order ids waiting to be written
+        self._reports = deque()  # Execution reports for the strategy thread
+        self._lock = threading.Lock()
+        self._idle = False  # Set while the I/O thread waits with nothing queued
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_w.setblocking(False)
+        self._next_id = 1
+        self._running = False
+        self._thread = None
+        self.sock = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="order-gateway", daemon=True)
+        self._thread.start()
+
+    def submit(self, order_msg, server_time=None):
+        """
+        Queue an order and return its client order id (also set as the
+        message's OrderID), or None if the queue is full.
+        """
+        with self._lock:
+            if len(self._queue) >= self.max_queued:
+                self.dropped += 1
+                return None
+            order_id = self._next_id
+            self._next_id += 1
+            message = dict(order_msg, OrderID=order_id)
+            self.outstanding[order_id] = OutstandingOrder(message, server_time)
+            self._queue.append(order_id)
+            wake = self._idle
+            self._idle = False
+        if wake:
+            self._wake()
+        return order_id
+
+    def reports(self):
+        """Execution reports received since the last call, oldest first."""
+        reports = []
+        while self._reports:
+            reports.append(self._reports.popleft())
+        return reports
+
+    def pending(self):
+        """Orders not yet acknowledged by the server (queued, in flight or awaiting resend)."""
+        with self._lock:
+            return sum(1 for order in self.outstanding.values() if not order.acked)
+
+    def close(self, timeout=2.0):
+        """Wait up to timeout seconds for every order to be acknowledged, then disconnect."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self._running = False
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # Already has a wake-up pending
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=MAX_BACKOFF)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        encoder = None
+        if self.protocol == PROTOCOL_BINARY:
+            # Symbol ids are per connection, so a reconnect starts a fresh table
+            send_hello(sock, self.protocol)
+            encoder = BinaryEncoder()
+        return sock, encoder, FeedReader(sock, REPORT_BUFFER_SIZE, protocol=self.protocol)
+
+    def _take_batch(self):
+        """
+        Messages for everything queued since the last write, and the server
+        times of those still to be measured (called with the lock held).
+        """
+        messages = []
+        server_times = []
+        for order_id in self._queue:
+            order = self.outstanding.get(order_id)
+            if order is None:
+                continue  # Completed while it was waiting for a resend
+            message = order.message
+            if order.remaining != int(message["Quantity"]):
+                message = dict(message, Quantity=str(order.remaining))
+            messages.append(message)
+            if order.server_time is not None:
+                server_times.append(order.server_time)
+                order.server_time = None
+        self._queue.clear()
+        return messages, server_times
+
+    def _encode(self, messages, encoder):
+        if encoder is not None:
+            return b"".join(encoder.encode(message, kind=RECORD_ORDER) for message in messages)
+        return "".join(json.dumps(message) + "\n" for message in messages).encode("utf-8")
+
+    def _handle_report(self, report):
+        order = self.outstanding.get(report.get("OrderID"))
+        if order is not None:
+            if report.get("Type") == "ACK":
+                order.acked = True
+                order.remaining = int(report["Quantity"])
+            elif order.acked:
+                # FILLs before the ACK are already reflected in its remaining quantity
+                order.remaining -= int(report["Quantity"])
+            if report.get("Status") in FINAL_STATUSES:
+                del self.outstanding[report["OrderID"]]
+        self._reports.append(report)
+
+    def _run(self):
+        backoff = INITIAL_BACKOFF
+        encoder = reader = None
+        while self._running:
+            if self.sock is None:
+                try:
+                    self.sock, encoder, reader = self._connect()
+                except OSError as e:
+                    print(f"Order gateway: cannot connect to {self.host}:{self.port} ({e}), retrying in {backoff:.2f}s")
+                    self._wake_r.settimeout(backoff)
+                    try:
+                        self._wake_r.recv(4096)
+                    except OSError:
+                        pass
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+                    continue
+                print(f"Connected to order server at {self.host}:{self.port}")
+                backoff = INITIAL_BACKOFF
+                with self._lock:
+                    # Everything outstanding goes out again on the new connection, in id order
+                    self._queue = deque(sorted(self.outstanding))
+                    for order in self.outstanding.values():
+                        order.acked = False
+
+            try:
+                with self._lock:
+                    messages, server_times = self._take_batch()
+                    self._idle = not messages
+                if messages:
+                    self.sock.sendall(self._encode(messages, encoder))  # One write for the whole batch
+                    if server_times and self.latency is not None:
+                        now = time.time_ns()
+                        for server_time in server_times:
+                            self.latency.record(now - server_time)
+                # Read reports between writes too, so the server is never stuck sending them to us
+                readable = select.select([self.sock, self._wake_r], [], [], 0 if messages else 1.0)[0]
+                if self._wake_r in readable:
+                    self._wake_r.setblocking(False)
+                    try:
+                        self._wake_r.recv(4096)
+                    except BlockingIOError:
+                        pass
+                if self.sock in readable:
+                    reports = reader.read_batch()
+                    if reports is None:
+                        raise ConnectionError("order server closed the connection")
+                    with self._lock:
+                        for report in reports:
+                            self._handle_report(report)
+            except OSError as e:
+                if not self._running:
+                    break
+                print(f"Order gateway: connection lost ({e}), reconnecting")
+                self.sock.close()
+                self.sock = None
+                self.reconnects += 1
+        if self.sock is not None:
+            self.sock.close()
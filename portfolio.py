@@ -0,0 +1,138 @@
+"""
+Mark-to-market portfolio ledger with running totals.
+
+Each symbol's Position keeps its share count, last price, cost basis
+(average cost) and realized profit/loss. mark() and fill() adjust the
+portfolio's running market value, gross exposure, cost basis and realized
+profit/loss by the change in that one position, so NAV, exposure and
+profit/loss are read in O(1) instead of re-valuing every holding on every tick.
+
+Cash follows the same arithmetic as the clients' available_capital (cash -=
+quantity * price on every fill), so it matches their ledger to the cent. The
+running totals can pick up float rounding over millions of updates;
+revalue() recomputes them from the positions with exact (fsum) sums.
+"""
+import math
+
+
+class Position:
+    __slots__ = ("quantity", "last_price", "cost", "realized")
+
+    def __init__(self):
+        self.quantity = 0
+        self.last_price = None
+        self.cost = 0.0  # Signed cost of the open shares (quantity * average cost)
+        self.realized = 0.0
+
+    def average_cost(self):
+        return self.cost / self.quantity if self.quantity else 0.0
+
+    def market_value(self):
+        return self.quantity * self.last_price if self.last_price is not None else 0.0
+
+
+class PortfolioLedger:
+    def __init__(self, initial_capital=0):
+        self.initial_capital = initial_capital
+        self.cash = initial_capital
+        self.clear()
+
+    def clear(self):
+        """Drop every position and running total (cash is left as it is)."""
+        self.positions = {}  # symbol -> Position
+        self.market_value = 0.0  # Sum of quantity * last price (net exposure)
+        self.gross_exposure = 0.0  # Sum of |quantity * last price|
+        self.cost_basis = 0.0  # Sum of the open positions' cost
+        self.realized = 0.0
+        self.fills = 0
+
+    def position(self, symbol):
+        """Shares held (negative when short); 0 for a symbol never traded."""
+        position = self.positions.get(symbol)
+        return position.quantity if position is not None else 0
+
+    def last_price(self, symbol):
+        position = self.positions.get(symbol)
+        return position.last_price if position is not None else None
+
+    def mark(self, symbol, price):
+        """A new price for symbol; revalues only that position."""
+        position = self.positions.get(symbol)
+        if position is None:
+            position = self.positions[symbol] = Position()
+        quantity = position.quantity
+        if quantity:
+            old_value = quantity * position.last_price if position.last_price is not None else 0.0
+            new_value = quantity * price
+            self.market_value += new_value - old_value
+            self.gross_exposure += abs(new_value) - abs(old_value)
+        position.last_price = price
+
+    def buy(self, symbol, quantity, price):
+        """Buy if the cash covers the cost; returns whether it was filled."""
+        if price * quantity > self.cash:
+            return False
+        self.fill(symbol, quantity, price)
+        return True
+
+    def sell(self, symbol, quantity, price):
+        self.fill(symbol, -quantity, price)
+
+    def fill(self, symbol, quantity, price):
+        """Buy (quantity > 0) or sell (quantity < 0) shares at price."""
+        self.cash -= quantity * price
+        self.apply_fill(symbol, quantity, price)
+
+    def apply_fill(self, symbol, quantity, price):
+        """The position side of a fill; the caller has already settled its cash."""
+        position = self.positions.get(symbol)
+        if position is None:
+            position = self.positions[symbol] = Position()
+        if position.last_price is None:
+            position.last_price = price
+        mark_price = position.last_price
+        self.fills += 1
+
+        old = position.quantity
+        old_cost = position.cost
+        old_value = old * mark_price
+        if old == 0 or (old > 0) == (quantity > 0):
+            position.cost += quantity * price  # Opening or adding to the position
+        else:
+            # Close against the average cost first; anything left over opens the other way
+            closing = min(abs(quantity), abs(old)) * (1 if old > 0 else -1)
+            average = old_cost / old
+            realized = closing * (price - average)
+            position.realized += realized
+            self.realized += realized
+            position.cost -= closing * average
+            opening = quantity + closing
+            if opening:
+                position.cost += opening * price
+        position.quantity = new = old + quantity
+        if new == 0:
+            position.cost = 0.0
+        new_value = new * mark_price
+        self.market_value += new_value - old_value
+        self.gross_exposure += abs(new_value) - abs(old_value)
+        self.cost_basis += position.cost - old_cost
+
+    def nav(self):
+        """Cash plus every position at its last price."""
+        return self.cash + self.market_value
+
+    def profit_loss(self):
+        return self.nav() - self.initial_capital
+
+    def unrealized(self):
+        """Profit/loss of the open positions against their average cost."""
+        return self.market_value - self.cost_basis
+
+    def revalue(self):
+        """Recompute the running totals from the positions (O(symbols)); returns NAV."""
+        positions = self.positions.values()
+        self.market_value = math.fsum(position.market_value() for position in positions)
+        self.gross_exposure = math.fsum(abs(position.market_value()) for position in positions)
+        self.cost_basis = math.fsum(position.cost for position in positions)
+        self.realized = math.fsum(position.realized for position in positions)
+        return self.nav()
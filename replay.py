@@ -0,0 +1,173 @@
+"""
+Feed replay pacing for tcp_server.
+
+A session walks the shared feed and alternates between sending and waiting.
+The pacer decides how many rows may have been sent by a given time since
+the session started; everything that is due is sent as one contiguous slice
+(one sendall), so high rates are reached by coalescing rows rather than by
+sleeping for tiny intervals. Due times are measured from the session start,
+so oversleeping or slow sends never accumulate into drift.
+
+Modes:
+    --interval S     one row every S seconds (the original behaviour)
+    --rate N         N rows per second, token bucket with burst capacity
+    --max-speed      no pacing; rows go out in large batches
+    --speed X        X times real time, driven by a timestamp column
+"""
+import time
+from bisect import bisect_right
+from datetime import datetime
+
+DEFAULT_MAX_BATCH_ROWS = 4096  # Most rows coalesced into a single send
+DEFAULT_BURST_SECONDS = 0.05  # Default token bucket depth, in seconds' worth of rows
+FORGET_ROWS = 65536  # Sent rows whose due times RealTimePacer keeps before dropping them
+
+SEND = "send"
+SLEEP = "sleep"
+
+
+class MaxSpeedPacer:
+    def allowed(self, elapsed, sent):
+        return float("inf")
+
+    def next_due(self, sent):
+        return 0.0
+
+
+class RatePacer:
+    """
+    Token bucket: `rate` rows per second with room for `burst` rows at once.
+    If the session falls more than `burst` rows behind (e.g. a slow client),
+    the backlog beyond the burst is forgiven instead of being sent in a flood.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(1, int(burst if burst is not None else rate * DEFAULT_BURST_SECONDS))
+        self._shift = 0.0
+
+    def allowed(self, elapsed, sent):
+        allowed = int((elapsed - self._shift) * self.rate) + 1
+        if allowed - sent > self.burst:
+            self._shift = elapsed - (sent + self.burst - 1) / self.rate
+            allowed = sent + self.burst
+        return allowed
+
+    def next_due(self, sent):
+        return sent / self.rate + self._shift
+
+
+class RealTimePacer:
+    """
+    Row k is due (timestamps[k] - timestamps[0]) / speed seconds after the start.
+    timestamps may be any iterable; it is read only as far as rows are due, and
+    the offsets of rows already sent are dropped, so a streamed feed's
+    timestamps never have to fit in memory.
+    """
+
+    def __init__(self, timestamps, speed=1.0):
+        self.speed = speed
+        self._timestamps = iter(timestamps)
+        self._first = None
+        self._offsets = []  # Due offsets of rows _base, _base + 1, ...
+        self._base = 0
+
+    def _load(self, row):
+        """Read timestamps up to `row`; False if the feed ends before it."""
+        offsets = self._offsets
+        while self._base + len(offsets) <= row:
+            t = next(self._timestamps, None)
+            if t is None:
+                return False
+            if self._first is None:
+                self._first = t
+            offsets.append((t - self._first) / self.speed)
+        return True
+
+    def allowed(self, elapsed, sent):
+        if sent - self._base > FORGET_ROWS:
+            del self._offsets[:sent - self._base]
+            self._base = sent
+        while not self._offsets or self._offsets[-1] <= elapsed:
+            if not self._load(self._base + len(self._offsets)):
+                break
+        return self._base + bisect_right(self._offsets, elapsed)
+
+    def next_due(self, sent):
+        return self._offsets[sent - self._base] if self._load(sent) else 0.0
+
+
+def parse_timestamp(value):
+    """Epoch seconds, or an ISO-8601 date/time string."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+class ReplayConfig:
+    """Pacing settings from the command line; builds a fresh pacer for each session."""
+
+    def __init__(self, interval=0.1, rate=None, max_speed=False, speed=None,
+                 timestamp_column=None, burst=None, max_batch_rows=DEFAULT_MAX_BATCH_ROWS):
+        if speed is not None and not timestamp_column:
+            raise ValueError("--speed needs --timestamp-column")
+        self.interval = interval
+        self.rate = rate
+        self.max_speed = max_speed
+        self.speed = speed
+        self.timestamp_column = timestamp_column
+        self.burst = burst
+        self.max_batch_rows = max_batch_rows
+
+    def describe(self):
+        if self.max_speed or (self.rate is None and self.speed is None and not self.interval):
+            return "max speed"
+        if self.speed is not None:
+            return f"{self.speed:g}x real time on '{self.timestamp_column}'"
+        if self.rate is not None:
+            return f"{self.rate:g} msgs/s"
+        return f"one row every {self.interval:g}s"
+
+    def new_pacer(self, segments):
+        if self.max_speed:
+            return MaxSpeedPacer()
+        if self.speed is not None:
+            timestamps = (parse_timestamp(v) for segment in segments for v in segment.column(self.timestamp_column))
+            return RealTimePacer(timestamps, self.speed)
+        if self.rate is not None:
+            return RatePacer(self.rate, self.burst)
+        if not self.interval:
+            return MaxSpeedPacer()
+        return RatePacer(1 / self.interval, self.burst)
+
+
+def replay_steps(segments, protocol, pacer, max_batch_rows=DEFAULT_MAX_BATCH_ROWS, clock=time.perf_counter,
+                 on_rows=None):
+    """
+    Yield (SEND, payload) and (SLEEP, seconds) steps for one session.
+    Payloads are zero-copy slices of the shared feed. on_rows(segment, start, stop)
+    is called with each range of rows just before it is sent.
+    """
+    start = clock()
+    sent = 0
+    for segment in segments:
+        header = segment.header(protocol)
+        if header:
+            yield SEND, header
+        i = 0
+        while i < segment.rows:
+            elapsed = clock() - start
+            allowed = pacer.allowed(elapsed, sent)
+            if allowed <= sent:
+                yield SLEEP, pacer.next_due(sent) - elapsed
+                continue
+            n = int(min(allowed - sent, segment.rows - i, max_batch_rows))
+            if on_rows is not None:
+                on_rows(segment, i, i + n)
+            payload = segment.row_slice(protocol, i, i + n)
+            n = int(min(n, segment.rows - i))  # A streamed segment learns its length when it runs out
+            if n:
+                yield SEND, payload
+            i += n
+            sent += n
@@ -0,0 +1,148 @@
+"""
+Per-symbol rolling state for the trading clients.
+
+Every symbol keeps fixed-capacity ring buffers for its price, total volume and
+buy/sell volumes, each with a running sum, so memory per symbol is constant and
+each tick costs O(1) no matter how long the feed runs.
+"""
+from array import array
+
+# How close (in cents) a mean must be to a .5 cent tie before the running sum
+# is considered too imprecise to round from.
+_TIE_TOLERANCE = 1e-6
+
+
+class RollingWindow:
+    """
+    Ring buffer holding the last `capacity` values with a running sum.
+
+    The running sum is rebuilt from the buffer every time the write position
+    wraps around. At that point the buffer is in chronological order, so the
+    rebuilt sum is exactly sum(history[-capacity:]) and float drift can never
+    accumulate across more than one window. When a mean lands within float
+    noise of a rounding tie, moving_average re-sums the window oldest first so
+    the rounded result always matches summing a plain history list.
+    """
+    __slots__ = ("capacity", "_values", "_head", "_count", "_sum")
+
+    def __init__(self, capacity, typecode="d"):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._values = array(typecode, [0]) * capacity
+        self._head = 0  # Next slot to write
+        self._count = 0
+        self._sum = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        values = self._values
+        head = self._head
+        if self._count == self.capacity:
+            self._sum -= values[head]
+        else:
+            self._count += 1
+        values[head] = value
+        head += 1
+        if head == self.capacity:
+            head = 0
+            self._sum = sum(values)
+        else:
+            self._sum += value
+        self._head = head
+
+    def last(self):
+        if self._count == 0:
+            return None
+        return self._values[self._head - 1]
+
+    def moving_average(self):
+        """Same result as the clients' original calculate_moving_average on the full history."""
+        if self._count < self.capacity:
+            return None
+        ma = self._sum / self.capacity
+        cents = abs(ma * 100)
+        if abs(cents - int(cents) - 0.5) < _TIE_TOLERANCE:
+            ma = sum(self.to_list()) / self.capacity
+        return round(ma, 2)
+
+    def dump(self):
+        """(buffer, head, count, running sum): everything load() needs to rebuild the window."""
+        return self._values, self._head, self._count, self._sum
+
+    def load(self, data, head, count, total):
+        """Restore the window from dump()'s parts, with the buffer as raw bytes."""
+        values = array(self._values.typecode)
+        values.frombytes(data)
+        if len(values) != self.capacity:
+            raise ValueError(f"Expected {self.capacity} values, got {len(values)}")
+        self._values = values
+        self._head = head
+        self._count = count
+        self._sum = total
+
+    def to_list(self):
+        """Return the buffered values oldest first."""
+        if self._count < self.capacity:
+            return self._values[:self._count].tolist()
+        return (self._values[self._head:] + self._values[:self._head]).tolist()
+
+
+class SymbolState:
+    """
+    Rolling price/volume state for a single symbol.
+
+    Holds the moving-average windows used by the clients plus the last three
+    prices needed for the 3-tick trend check in analyze_sentiment.
+    """
+    __slots__ = ("prices", "quantities", "buy_volumes", "sell_volumes",
+                 "ticks", "last_price", "_prev_price", "_prev_prev_price")
+
+    def __init__(self, window_size):
+        self.prices = RollingWindow(window_size, "d")
+        self.quantities = RollingWindow(window_size, "q")
+        self.buy_volumes = RollingWindow(window_size, "q")
+        self.sell_volumes = RollingWindow(window_size, "q")
+        self.ticks = 0
+        self.last_price = None
+        self._prev_price = None
+        self._prev_prev_price = None
+
+    def update(self, price, quantity, side):
+        self.prices.append(price)
+        self.quantities.append(quantity)
+        # Separate volume histories based on order side
+        if side == "B":
+            self.buy_volumes.append(quantity)
+        elif side == "S":
+            self.sell_volumes.append(quantity)
+        self._prev_prev_price = self._prev_price
+        self._prev_price = self.last_price
+        self.last_price = price
+        self.ticks += 1
+
+    def recent_prices(self):
+        """The last three prices, oldest first (None where fewer were seen)."""
+        return self._prev_prev_price, self._prev_price, self.last_price
+
+    def restore_recent_prices(self, prev_prev_price, prev_price, last_price):
+        self._prev_prev_price = prev_prev_price
+        self._prev_price = prev_price
+        self.last_price = last_price
+
+    def trend(self):
+        """
+        Direction of the last 3 prices:
+            1 if strictly rising, -1 if strictly falling, 0 otherwise
+            (or when fewer than 3 prices have been seen).
+        """
+        if self.ticks < 3:
+            return 0
+        p0, p1, p2 = self._prev_prev_price, self._prev_price, self.last_price
+        if p0 < p1 < p2:
+            return 1
+        if p0 > p1 > p2:
+            return -1
+        return 0
@@ -0,0 +1,228 @@
+"""
+Multi-process, symbol-sharded strategy runtime.
+
+N worker processes each open their own feed connection and subscribe to
+shard i of N (see subscriptions.py): the symbols whose CRC32 hash lands on
+that shard. So a symbol always lands on the same worker, and its rolling
+state, order book and position live in that one process. The server sends
+each row once, to the worker that trades it, and nothing sits between the
+feed and the workers: no process decodes or forwards the whole feed. Each
+worker runs the ordinary FinanceClient (moving-average or XGBoost), with
+its own order gateway connection and its own ledger file
+(<output>.shard<N>.csv).
+
+Positions never cross shards, but cash does. SharedCapital keeps the
+cash, and each shard's position market value, in shared memory. A buy
+reserves its cost atomically under one lock, so two shards can't spend
+the same dollars, and the reservation fails if it would take cash below
+--cash-floor. --max-symbol-value caps the cost of any one position.
+
+    python sharded_runtime.py --workers 4 --strategy ma --console summary
+
+The server must support subscriptions (tcp_server.py or async_server.py of
+this repository, from files, a merge or the synthetic feed).
+
+Ledger rows are written in each worker's own tick order. Because the
+shards spend the same cash concurrently, the Capital column and which
+borderline buys fill can differ from one run to the next.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from journal import CONSOLE_MODES, DEFAULT_SUMMARY_EVERY, JOURNAL_FORMATS
+from portfolio import PortfolioLedger
+from subscriptions import Subscription
+from wire_protocol import PROTOCOLS
+
+PROGRESS_INTERVAL = 0.25  # Seconds between the parent's looks at the shards' tick counts
+
+CASH = 0  # Slot of the shared cash; slot 1 + N is shard N's position market value
+
+
+def shard_path(output_file, shard):
+    root, ext = os.path.splitext(output_file)
+    return f"{root}.shard{shard}{ext}"
+
+
+class SharedCapital:
+    """Cash and per-shard market values in shared memory, with atomic cash reservations."""
+
+    def __init__(self, initial_capital, n_shards, cash_floor=0.0):
+        self.initial_capital = initial_capital
+        self.n_shards = n_shards
+        self.cash_floor = cash_floor
+        self.values = multiprocessing.RawArray('d', 1 + n_shards)
+        self.values[CASH] = initial_capital
+        self.rejected = multiprocessing.RawValue('q', 0)
+        self.ticks = multiprocessing.RawArray('q', n_shards)  # Ticks each shard has marked; one writer per slot
+        self.lock = multiprocessing.Lock()
+
+    def cash(self):
+        return self.values[CASH]
+
+    def reserve(self, amount):
+        """Take amount from the cash if that leaves at least cash_floor; returns whether it did."""
+        with self.lock:
+            cash = self.values[CASH]
+            if cash - amount < self.cash_floor:
+                self.rejected.value += 1
+                return False
+            self.values[CASH] = cash - amount
+            return True
+
+    def settle(self, amount):
+        """Add amount (negative to pay) to the cash without a limit check."""
+        with self.lock:
+            self.values[CASH] += amount
+
+    def publish(self, shard, market_value):
+        self.values[1 + shard] = market_value  # Each slot has a single writer, its shard
+
+    def nav(self):
+        """Cash plus every shard's positions at their last prices."""
+        values = self.values
+        return values[CASH] + sum(values[1:])
+
+
+class ShardLedger(PortfolioLedger):
+    """
+    One shard's positions. Cash lives in SharedCapital: buys reserve it,
+    sells and other fills settle into it, and every change in the shard's
+    market value is published for the portfolio-wide NAV.
+    """
+
+    def __init__(self, capital, shard, max_symbol_value=0):
+        self.capital = capital
+        self.shard = shard
+        self.max_symbol_value = max_symbol_value  # Most a single position may cost; 0 for no limit
+        self.initial_capital = capital.initial_capital
+        self.limited = 0  # Buys refused by max_symbol_value
+        self.clear()
+
+    @property
+    def cash(self):
+        return self.capital.values[CASH]
+
+    def buy(self, symbol, quantity, price):
+        cost = price * quantity
+        if self.max_symbol_value:
+            position = self.positions.get(symbol)
+            if (position.cost if position is not None else 0.0) + cost > self.max_symbol_value:
+                self.limited += 1
+                return False
+        if not self.capital.reserve(cost):
+            return False
+        self.apply_fill(symbol, quantity, price)
+        self.capital.publish(self.shard, self.market_value)
+        return True
+
+    def fill(self, symbol, quantity, price):
+        self.capital.settle(-quantity * price)
+        self.apply_fill(symbol, quantity, price)
+        self.capital.publish(self.shard, self.market_value)
+
+    def mark(self, symbol, price):
+        PortfolioLedger.mark(self, symbol, price)
+        self.capital.publish(self.shard, self.market_value)
+        self.capital.ticks[self.shard] += 1  # Clients mark once per tick
+
+    def revalue(self):
+        PortfolioLedger.revalue(self)
+        self.capital.publish(self.shard, self.market_value)
+        return self.nav()
+
+    def nav(self):
+        return self.capital.nav()
+
+
+def shard_client(shard, capital, args):
+    if args.strategy == "xgboost":
+        from trade_xgboost import FinanceClient
+    else:
+        from trading_client import FinanceClient
+    return FinanceClient(args.host, args.csv_port, window_size=5, initial_capital=capital.initial_capital,
+                         order_host=args.host, order_port=args.order_port, protocol=args.protocol,
+                         book_weight=args.book_weight, output_file=shard_path(args.output, shard),
+                         journal_format=args.journal_format, console=args.worker_console,
+                         summary_every=args.summary_every, ledger=ShardLedger(capital, shard, args.max_symbol_value),
+                         subscription=Subscription(shard=(shard, args.workers)))
+
+
+def shard_worker(shard, capital, args):
+    """Stream this shard's symbols straight from the server and trade them."""
+    client = shard_client(shard, capital, args)
+    client.run()
+    print(f"Shard {shard}: {client.summary.ticks:,} ticks, {len(client.ledger.positions):,} symbols")
+
+
+def run_sharded(args):
+    """Run one subscribed worker per shard until the feed ends; returns (ticks, seconds)."""
+    capital = SharedCapital(args.initial_capital, args.workers, args.cash_floor)
+    workers = [multiprocessing.Process(target=shard_worker, args=(shard, capital, args), name=f"shard-{shard}")
+               for shard in range(args.workers)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    print(f"{len(workers)} workers subscribed to their shards of {args.host}:{args.csv_port}")
+    next_summary = args.summary_every
+    for worker in workers:
+        while worker.is_alive():
+            worker.join(PROGRESS_INTERVAL)
+            ticks = sum(capital.ticks)
+            if args.console == "summary" and ticks >= next_summary:
+                next_summary = (ticks // args.summary_every + 1) * args.summary_every
+                elapsed = time.perf_counter() - start
+                nav = capital.nav()
+                print(f"{ticks:,} ticks ({ticks / elapsed:,.0f}/s) | Capital: ${capital.cash():,.2f} | "
+                      f"Portfolio Value: ${nav:,.2f} | Profit/Loss: ${nav - capital.initial_capital:,.2f}")
+    elapsed = time.perf_counter() - start
+    ticks = sum(capital.ticks)
+    report(args, capital, ticks, elapsed)
+    return ticks, elapsed
+
+
+def report(args, capital, ticks, elapsed):
+    nav = capital.nav()
+    print("=" * 70)
+    print(f"Workers: {args.workers}, ticks: {ticks:,} in {elapsed:.2f}s "
+          f"({ticks / elapsed if elapsed > 0 else 0:,.0f} ticks/s)")
+    print(f"Available Capital: ${capital.cash():,.2f}")
+    print(f"Total Portfolio Value: ${nav:,.2f}")
+    print(f"Profit/Loss: ${nav - capital.initial_capital:,.2f}")
+    print(f"Buys refused for lack of cash: {capital.rejected.value:,}")
+    print("=" * 70)
+
+
+def argument_parser():
+    """The command line options (also used by bench.py's sharded suite)."""
+    parser = argparse.ArgumentParser(description="Run a trading strategy across worker processes, sharded by symbol")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: one per core)")
+    parser.add_argument("--strategy", choices=["ma", "xgboost"], default="ma",
+                        help="trading_client's moving-average rule or trade_xgboost's model")
+    parser.add_argument("--host", default="127.0.0.1", help="Server host address")
+    parser.add_argument("--csv-port", type=int, default=9995, help="Port for CSV streaming")
+    parser.add_argument("--order-port", type=int, default=9999, help="Port for sending orders")
+    parser.add_argument("--protocol", choices=PROTOCOLS, default="json", help="Wire format for the feed and orders")
+    parser.add_argument("--initial-capital", type=float, default=1000000, help="Capital shared by all workers")
+    parser.add_argument("--cash-floor", type=float, default=0.0, help="Buys may not take the shared cash below this")
+    parser.add_argument("--max-symbol-value", type=float, default=0.0,
+                        help="Most any one position may cost (0 for no limit)")
+    parser.add_argument("--book-weight", type=float, default=0,
+                        help="Sentiment points added for a fully bid-heavy order book (subtracted when ask-heavy)")
+    parser.add_argument("--output", default='trading_with_sentiment.csv',
+                        help="Ledger file name; each worker writes <name>.shard<N><ext>")
+    parser.add_argument("--journal-format", choices=JOURNAL_FORMATS, default="csv")
+    parser.add_argument("--console", choices=["summary", "quiet"], default="summary",
+                        help="A portfolio line every --summary-every ticks (over all shards), or only the final summary")
+    parser.add_argument("--worker-console", choices=CONSOLE_MODES, default="quiet", help="Console mode of each worker")
+    parser.add_argument("--summary-every", type=int, default=DEFAULT_SUMMARY_EVERY)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = argument_parser()
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    run_sharded(args)
@@ -0,0 +1,125 @@
+"""
+Symbol-filtered feed subscriptions.
+
+A feed client can ask for a subset of the symbols in its hello line:
+
+    {"Protocol": "binary", "Symbols": ["AAPL", "MSFT"]}
+    {"Protocol": "json", "SymbolPrefixes": ["A", "B"]}
+    {"Protocol": "binary", "Shard": [2, 8]}
+
+Symbols and SymbolPrefixes add up: a symbol is wanted if it is listed or
+starts with one of the prefixes. Shard [i, n] keeps the symbols that
+shard_for() puts on shard i of n (the split sharded_runtime uses), and
+narrows Symbols/SymbolPrefixes when given with them. A hello with none of
+these subscribes to everything.
+
+The server buckets each pre-encoded feed file by symbol once, and builds a
+subscription's rows from the buckets of its symbols the first time a client
+asks for it (see feed_cache.FilteredSegment). Sessions then stream those
+rows like any other feed, so a client's cost follows the rows it
+subscribed to, not the size of the feed. Streamed feeds (--synthetic,
+--merge-on) drop the other rows before encoding them.
+
+    python trading_client.py --symbols AAPL MSFT
+    python trade_xgboost.py --shard 0 4
+"""
+import zlib
+
+
+def shard_for(symbol, n_shards):
+    """Stable across processes and runs, unlike the salted built-in hash()."""
+    return zlib.crc32(symbol.encode("utf-8")) % n_shards
+
+
+class Subscription:
+    """Which symbols a feed client asked for."""
+
+    def __init__(self, symbols=None, prefixes=None, shard=None):
+        self.symbols = frozenset(symbols) if symbols else None
+        self.prefixes = tuple(prefixes) if prefixes else None
+        if shard is not None:
+            index, count = shard
+            if not 0 <= index < count:
+                raise ValueError(f"Shard {index} of {count} doesn't exist")
+            shard = (index, count)
+        self.shard = shard
+        self._matches = {}  # symbol -> bool, for streamed feeds that ask per row
+
+    @classmethod
+    def from_hello(cls, hello):
+        """The subscription in a hello dict, or None for the whole feed. Raises ValueError if it is malformed."""
+        if not hello:
+            return None
+        symbols = hello.get("Symbols")
+        prefixes = hello.get("SymbolPrefixes")
+        shard = hello.get("Shard")
+        if symbols is None and prefixes is None and shard is None:
+            return None
+        for name, values in (("Symbols", symbols), ("SymbolPrefixes", prefixes)):
+            if values is not None and (not isinstance(values, list) or not values
+                                       or not all(isinstance(v, str) for v in values)):
+                raise ValueError(f"{name} must be a non-empty list of strings")
+        if shard is not None and (not isinstance(shard, list) or len(shard) != 2
+                                  or not all(isinstance(v, int) for v in shard)):
+            raise ValueError("Shard must be [index, count]")
+        return cls(symbols, prefixes, shard)
+
+    def hello_options(self):
+        """The hello fields asking for this subscription (for wire_protocol.send_hello)."""
+        options = {}
+        if self.symbols is not None:
+            options["Symbols"] = sorted(self.symbols)
+        if self.prefixes is not None:
+            options["SymbolPrefixes"] = list(self.prefixes)
+        if self.shard is not None:
+            options["Shard"] = list(self.shard)
+        return options
+
+    def key(self):
+        """Hashable identity, so sessions with the same subscription share its filtered rows."""
+        return (self.symbols, self.prefixes, self.shard)
+
+    def matches(self, symbol):
+        matched = self._matches.get(symbol)
+        if matched is None:
+            matched = self._matches[symbol] = self._match(symbol)
+        return matched
+
+    def _match(self, symbol):
+        if self.symbols is not None or self.prefixes is not None:
+            if not ((self.symbols is not None and symbol in self.symbols)
+                    or (self.prefixes is not None and symbol.startswith(self.prefixes))):
+                return False
+        return self.shard is None or shard_for(symbol, self.shard[1]) == self.shard[0]
+
+    def describe(self):
+        parts = []
+        if self.symbols is not None:
+            listed = sorted(self.symbols)
+            parts.append(" ".join(listed[:5]) + (f" (+{len(listed) - 5})" if len(listed) > 5 else ""))
+        if self.prefixes is not None:
+            parts.append(" ".join(f"{prefix}*" for prefix in self.prefixes))
+        text = " ".join(parts)
+        if self.shard is not None:
+            shard = f"shard {self.shard[0]}/{self.shard[1]}"
+            text = f"{text} in {shard}" if text else shard
+        return text
+
+
+def add_subscription_arguments(parser):
+    """The clients' --symbols / --symbol-prefixes / --shard options."""
+    parser.add_argument("--symbols", nargs='+', help="Only stream these symbols")
+    parser.add_argument("--symbol-prefixes", nargs='+', metavar="PREFIX",
+                        help="Only stream symbols starting with one of these (added to --symbols)")
+    parser.add_argument("--shard", nargs=2, type=int, metavar=("INDEX", "COUNT"),
+                        help="Only stream the symbols of shard INDEX of COUNT (CRC32 of the symbol, as sharded_runtime)")
+
+
+def subscription_from_args(parser, args):
+    """The Subscription the clients' options ask for, or None for the whole feed."""
+    if not (args.symbols or args.symbol_prefixes or args.shard):
+        return None
+    try:
+        return Subscription(args.symbols, args.symbol_prefixes, args.shard)
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,265 @@
+"""
+Parallel parameter sweep over the offline backtester.
+
+The feed is loaded and parsed once. Its columns (and the order book inputs,
+when the model uses them) are copied into one shared memory block, and a
+process pool runs every combination of the strategy knobs against it:
+
+    --window-sizes     moving-average window
+    --buy-thresholds   model probability above which to BUY (xgboost only)
+    --sell-thresholds  model probability below which to SELL (xgboost only)
+    --capital-floors   share of capital risked at zero sentiment (0.1)
+    --capital-caps     most capital risked at full sentiment (0.5)
+    --high-volume      volume is HIGH above this multiple of its MA (1.5)
+    --low-volume       volume is LOW below this multiple of its MA (0.5)
+
+Each worker caches its indicators (and model probabilities) for the last
+window/volume settings it computed, and combinations are handed out grouped
+by those settings, so most runs only redo the signals and the accounting.
+
+Every result is appended to --results as a JSON line the moment it
+finishes. Re-running the same sweep skips the combinations already in the
+file, so an interrupted sweep resumes where it stopped. The results are
+ranked by profit/loss, maximum drawdown or their ratio (--rank).
+
+    python sweep.py --files finance/finance.csv --strategy xgboost \\
+        --window-sizes 3 5 8 13 --buy-thresholds 0.55 0.6 0.65 0.7 --sell-thresholds 0.3 0.35 0.4 0.45 \\
+        --capital-caps 0.3 0.5 --high-volume 1.25 1.5 2 --low-volume 0.5 0.75
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from backtest import (book_features, compute_indicators, load_feed, ma_signals, max_drawdown, model_probabilities,
+                      nav_series, simulate, threshold_signals)
+from model_inference import BUY_THRESHOLD, N_FEATURES, SELL_THRESHOLD
+from order_book import BOOK_FEATURES
+from tree_model import default_model_path, load_model
+
+PARAMETERS = ("window_size", "buy_threshold", "sell_threshold", "capital_floor", "capital_cap", "high_volume",
+              "low_volume")
+INDICATOR_PARAMETERS = ("window_size", "high_volume", "low_volume")  # What the indicators (and probabilities) depend on
+RANKINGS = ("pnl", "drawdown", "calmar")
+
+
+class SharedFeed:
+    """Numeric feed columns in one shared memory block; workers map them as NumPy views."""
+
+    def __init__(self, columns):
+        self.layout = {}
+        size = 0
+        for name, values in columns.items():
+            size = -(-size // 8) * 8  # Keep every column 8-byte aligned
+            self.layout[name] = (size, values.dtype.str, values.shape)
+            size += values.nbytes
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for name, values in columns.items():
+            view(self.memory, self.layout[name])[...] = values
+
+    def close(self):
+        self.memory.close()
+        self.memory.unlink()
+
+
+def view(memory, spec):
+    offset, dtype, shape = spec
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+
+
+def share_feed(feed, with_book):
+    """Everything a worker needs to rebuild the feed dict, with the big columns in shared memory."""
+    side_labels, side_codes = np.unique(feed['side'], return_inverse=True)
+    news_labels, news_codes = np.unique(feed['news'], return_inverse=True)
+    columns = {
+        'symbol': feed['symbol'],
+        'price': feed['price'],
+        'quantity': feed['quantity'],
+        'side': side_codes.astype(np.uint8),
+        'news': news_codes.astype(np.int32),
+    }
+    if with_book:
+        columns['book'] = book_features(feed)
+    shared = SharedFeed(columns)
+    labels = {'symbol_names': feed['symbol_names'], 'side': side_labels, 'news': news_labels}
+    return shared, labels
+
+
+# Worker state, set once per process by init_worker
+_feed = None
+_book = None
+_model = None
+_initial_capital = None
+_memory = None
+_cache = {}
+
+
+def init_worker(memory_name, layout, labels, model_path, initial_capital):
+    global _feed, _book, _model, _initial_capital, _memory
+    _memory = shared_memory.SharedMemory(name=memory_name)
+    columns = {name: view(_memory, spec) for name, spec in layout.items()}
+    _feed = {
+        'symbol_names': labels['symbol_names'],
+        'symbol': columns['symbol'],
+        'price': columns['price'],
+        'quantity': columns['quantity'],
+        # Small-alphabet string columns are rebuilt once per worker from their codes
+        'side': labels['side'][columns['side']],
+        'news': labels['news'][columns['news']],
+    }
+    _book = columns.get('book')
+    _initial_capital = initial_capital
+    if model_path:
+        _model = load_model(model_path)
+
+
+def run_one(params):
+    """Backtest one combination; returns its params and metrics."""
+    start = time.perf_counter()
+    key = tuple(params[name] for name in INDICATOR_PARAMETERS)
+    cached = _cache.get(key)
+    if cached is None:
+        indicators = compute_indicators(_feed, params['window_size'], with_book=_book is not None,
+                                        high_volume=params['high_volume'], low_volume=params['low_volume'], book=_book)
+        probabilities = model_probabilities(_feed, indicators, _model) if _model is not None else None
+        _cache.clear()  # Combinations arrive grouped by indicator settings; one entry is enough
+        cached = _cache[key] = (indicators, probabilities)
+    indicators, probabilities = cached
+
+    if probabilities is not None:
+        signals = threshold_signals(probabilities, params['buy_threshold'], params['sell_threshold'])
+    else:
+        signals = ma_signals(_feed, indicators)
+    result = simulate(_feed, indicators, signals, _initial_capital, params['capital_floor'], params['capital_cap'])
+    nav = nav_series(_feed, result)
+    final_nav = result['ledger'].nav()
+    return {
+        'params': params,
+        'pnl': round(final_nav - _initial_capital, 2),
+        'max_drawdown': round(max_drawdown(nav), 6),
+        'trades': int(np.count_nonzero(result['trade_quantity'])),
+        'seconds': round(time.perf_counter() - start, 4),
+    }
+
+
+def parameter_grid(args):
+    """Every valid combination, grouped by indicator settings."""
+    thresholds = (list(itertools.product(args.buy_thresholds, args.sell_thresholds)) if args.strategy == "xgboost"
+                  else [(BUY_THRESHOLD, SELL_THRESHOLD)])  # The MA rule has no thresholds
+    combinations = []
+    for window_size, high_volume, low_volume in itertools.product(args.window_sizes, args.high_volume, args.low_volume):
+        if low_volume >= high_volume:
+            continue
+        for (buy, sell), floor, cap in itertools.product(thresholds, args.capital_floors, args.capital_caps):
+            if sell > buy or floor > cap:
+                continue
+            combinations.append(dict(zip(PARAMETERS, (window_size, buy, sell, floor, cap, high_volume, low_volume))))
+    return combinations
+
+
+def params_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def load_results(path, run):
+    """Results already in the file for this same sweep (strategy, files, model and capital)."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # A line cut short when the previous sweep was killed
+            if all(result.get(name) == value for name, value in run.items()):
+                done[params_key(result['params'])] = result
+    return done
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def rank(results, by="pnl"):
+    if by == "drawdown":
+        key = lambda r: (r['max_drawdown'], -r['pnl'])
+    elif by == "calmar":
+        key = lambda r: -(r['pnl'] / r['max_drawdown'] if r['max_drawdown'] > 0 else float("inf"))
+    else:
+        key = lambda r: (-r['pnl'], r['max_drawdown'])
+    return sorted(results, key=key)
+
+
+def print_ranking(results, top, strategy):
+    names = [name for name in PARAMETERS if strategy == "xgboost" or "threshold" not in name]
+    print(" ".join(f"{name:>14}" for name in names) + f" {'pnl':>14} {'max_drawdown':>13} {'trades':>7}")
+    for result in results[:top]:
+        params = result['params']
+        print(" ".join(f"{params[name]:>14g}" for name in names) +
+              f" {result['pnl']:>14,.2f} {result['max_drawdown']:>13.2%} {result['trades']:>7,}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep strategy parameters over a feed with a process pool")
+    parser.add_argument("--files", nargs='+', required=True, help="Feed CSV file(s) or tick store directories")
+    parser.add_argument("--strategy", choices=["ma", "xgboost"], default="ma")
+    parser.add_argument("--model", help="Model file for the xgboost strategy: an exported .json/.ubj or a pickle "
+                                        "(default: xgb_model.json if present, else xgb_model.pkl)")
+    parser.add_argument("--initial-capital", type=int, default=1000000)
+    parser.add_argument("--window-sizes", type=int, nargs='+', default=[5])
+    parser.add_argument("--buy-thresholds", type=float, nargs='+', default=[BUY_THRESHOLD])
+    parser.add_argument("--sell-thresholds", type=float, nargs='+', default=[SELL_THRESHOLD])
+    parser.add_argument("--capital-floors", type=float, nargs='+', default=[0.1])
+    parser.add_argument("--capital-caps", type=float, nargs='+', default=[0.5])
+    parser.add_argument("--high-volume", type=float, nargs='+', default=[1.5])
+    parser.add_argument("--low-volume", type=float, nargs='+', default=[0.5])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--results", default="sweep_results.jsonl", help="Results file, appended to and resumed from")
+    parser.add_argument("--rank", choices=RANKINGS, default="pnl",
+                        help="Order by profit/loss, by smallest max drawdown, or by profit/loss per unit of drawdown")
+    parser.add_argument("--top", type=int, default=20, help="Combinations to print")
+    args = parser.parse_args()
+
+    model_path = os.path.abspath(args.model or default_model_path()) if args.strategy == "xgboost" else None
+    run = {'strategy': args.strategy, 'files': [os.path.abspath(f) for f in args.files], 'model': model_path,
+           'initial_capital': args.initial_capital}
+    combinations = parameter_grid(args)
+    done = load_results(args.results, run)
+    todo = [params for params in combinations if params_key(params) not in done]
+    print(f"{len(combinations):,} combinations, {len(combinations) - len(todo):,} already in {args.results}")
+
+    results = [done[params_key(params)] for params in combinations if params_key(params) in done]
+    if todo:
+        with_book = False
+        if model_path:
+            with_book = load_model(model_path).num_features() == N_FEATURES + len(BOOK_FEATURES)
+        feed = load_feed(args.files)
+        shared, labels = share_feed(feed, with_book)
+        del feed
+        start = time.perf_counter()
+        try:
+            with multiprocessing.Pool(args.workers, initializer=init_worker,
+                                      initargs=(shared.memory.name, shared.layout, labels, model_path,
+                                                args.initial_capital)) as pool, \
+                    open(args.results, "a") as out:
+                if out.tell() and not ends_with_newline(args.results):
+                    out.write("\n")  # Start after the line a killed sweep left unfinished
+                chunksize = max(1, min(32, len(todo) // (args.workers * 4)))
+                for i, result in enumerate(pool.imap_unordered(run_one, todo, chunksize=chunksize), 1):
+                    out.write(json.dumps({**run, **result}) + "\n")
+                    out.flush()
+                    results.append(result)
+                    if i % 100 == 0 or i == len(todo):
+                        elapsed = time.perf_counter() - start
+                        print(f"{i:,}/{len(todo):,} done ({i / elapsed:,.1f} combinations/s)")
+        finally:
+            shared.close()
+
+    print(f"Top {min(args.top, len(results))} by {args.rank}:")
+    print_ranking(rank(results, args.rank), args.top, args.strategy)
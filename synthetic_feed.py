@@ -0,0 +1,270 @@
+"""
+Deterministic synthetic market feed, for load tests beyond finance.csv.
+
+SyntheticMarket.rows() streams rows in the finance.csv schema
+(Symbol, Description, OrderID, Quantity, Action, Exchange, Side, Price,
+News) for any number of symbols, without end. The same settings and seed
+always give the same rows. Only per-symbol state is kept (mid price, live
+order ids, news burst), so memory doesn't grow with the row count:
+
+- Prices: each symbol's mid is a random walk (multiplicative, with
+  --volatility per tick). Orders are placed a few cents either side of it.
+- Orders: every symbol has one order slot per exchange and side. An empty
+  slot gets an 'A' with a new OrderID, and then 'M' rows change its price
+  and quantity. With probability --cancel-probability an 'M' has quantity 0,
+  which removes the order from the books (client books and matching engine
+  alike) and frees the slot for a new 'A'.
+- Activity: symbols tick with Zipf-like weights, so a few are busy and most
+  are quiet.
+- News: mostly the background mix of finance.csv. A burst picks a symbol,
+  multiplies how often it ticks and how much its price moves (with a
+  drift), and sets its News to 50 or 100 for --burst-length of its ticks.
+
+Write a file:
+
+    python synthetic_feed.py --rows 10000000 --symbols 5000 --seed 7 --output synthetic.csv
+
+or stream it from the server (endless unless --synthetic-rows is set):
+
+    python tcp_server.py --synthetic --synthetic-symbols 5000 --seed 7 --max-speed
+
+Each server session generates its own copy of the stream from the seed, so
+unlike a CSV feed it costs generation time per subscriber.
+"""
+import argparse
+import csv
+import datetime
+import json
+import math
+import time
+from itertools import islice
+import numpy as np
+from wire_protocol import PROTOCOL_BINARY, RECORD_TICK, BinaryEncoder
+
+FIELDS = ['Symbol', 'Description', 'OrderID', 'Quantity', 'Action', 'Exchange', 'Side', 'Price', 'News']
+
+DEFAULT_SYMBOLS = 1000
+DEFAULT_SEED = 1
+CHUNK_ROWS = 1024  # Random draws are made this many rows at a time
+BACKGROUND_NEWS = ([0, 50, 100], [0.74, 0.13, 0.13])  # Values and frequencies in finance.csv
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def ticker(index):
+    """AAAA, AAAB, ... (up to 26**4 symbols; longer names beyond that)."""
+    name = ""
+    for _ in range(4):
+        index, letter = divmod(index, 26)
+        name = LETTERS[letter] + name
+    return name if index == 0 else f"{name}{index}"
+
+
+class SyntheticMarket:
+    def __init__(self, symbols=DEFAULT_SYMBOLS, seed=DEFAULT_SEED, exchanges=3, volatility=0.0005, spread=0.05,
+                 cancel_probability=0.02, zipf=0.8, burst_rate=0.0002, burst_length=200, burst_boost=20.0):
+        if symbols < 1:
+            raise ValueError("symbols must be at least 1")
+        self.n_symbols = symbols
+        self.seed = seed
+        self.exchanges = exchanges
+        self.volatility = volatility  # Standard deviation of a tick's relative mid-price move
+        self.spread = spread  # Typical distance of an order from the mid, in dollars
+        self.cancel_probability = cancel_probability
+        self.zipf = zipf  # Activity of the k-th busiest symbol ~ 1 / k**zipf
+        self.burst_rate = burst_rate  # Bursts started per row
+        self.burst_length = burst_length  # Ticks of the bursting symbol a burst lasts
+        self.burst_boost = burst_boost  # How much more often, and more widely, a bursting symbol ticks
+        self.tickers = [ticker(i) for i in range(symbols)]
+
+    def describe(self):
+        return f"synthetic:{self.n_symbols}-symbols:seed-{self.seed}"
+
+    def rows(self):
+        """Endless row dicts with string values, like csv.DictReader gives for finance.csv."""
+        rng = np.random.default_rng(self.seed)
+        n = self.n_symbols
+        n_slots = self.exchanges * 2
+        tickers = self.tickers
+        descriptions = [f"Synthetic {name} Inc" for name in tickers]
+        mids = np.exp(rng.uniform(math.log(5), math.log(500), n)).tolist()
+        activity = rng.permutation(1.0 / np.arange(1, n + 1) ** self.zipf)
+        slots = [[None] * n_slots for _ in range(n)]  # Live OrderID per (exchange, side)
+        bursts = {}  # symbol index -> [ticks left, news value, drift per tick]
+        next_order_id = 1
+        news_values, news_frequencies = BACKGROUND_NEWS
+        volatility = self.volatility
+        cancel_probability = self.cancel_probability
+        burst_boost = self.burst_boost
+
+        while True:
+            weights = activity.copy()
+            for index in bursts:
+                weights[index] *= burst_boost
+            symbol_ids = rng.choice(n, CHUNK_ROWS, p=weights / weights.sum()).tolist()
+            moves = rng.standard_normal(CHUNK_ROWS).tolist()
+            slot_ids = rng.integers(0, n_slots, CHUNK_ROWS).tolist()
+            quantities = (rng.integers(100, 1001, CHUNK_ROWS) * 1000).tolist()
+            offsets = np.abs(rng.normal(0, self.spread, CHUNK_ROWS)).tolist()
+            cancels = (rng.random(CHUNK_ROWS) < cancel_probability).tolist()
+            background_news = rng.choice(news_values, CHUNK_ROWS, p=news_frequencies).tolist()
+            for _ in range(rng.poisson(self.burst_rate * CHUNK_ROWS)):
+                index = int(rng.choice(n, p=activity / activity.sum()))
+                drift = float(rng.choice([-1, 1])) * volatility * 2
+                bursts[index] = [self.burst_length, int(rng.choice([50, 100])), drift]
+
+            for i in range(CHUNK_ROWS):
+                s = symbol_ids[i]
+                burst = bursts.get(s)
+                if burst is None:
+                    mid = mids[s] * (1 + volatility * moves[i])
+                    news = background_news[i]
+                else:
+                    mid = mids[s] * (1 + burst[2] + volatility * burst_boost ** 0.5 * moves[i])
+                    news = burst[1]
+                    burst[0] -= 1
+                    if burst[0] <= 0:
+                        del bursts[s]
+                mids[s] = mid = max(mid, 0.05)
+
+                slot = slot_ids[i]
+                order_id = slots[s][slot]
+                quantity = quantities[i]
+                if order_id is None:
+                    action = "A"
+                    order_id = slots[s][slot] = next_order_id
+                    next_order_id += 1
+                else:
+                    action = "M"
+                    if cancels[i]:
+                        quantity = 0
+                        slots[s][slot] = None
+                side = "B" if slot % 2 == 0 else "S"
+                price = mid - offsets[i] if side == "B" else mid + offsets[i]
+                yield {
+                    'Symbol': tickers[s],
+                    'Description': descriptions[s],
+                    'OrderID': str(order_id),
+                    'Quantity': str(quantity),
+                    'Action': action,
+                    'Exchange': str(slot // 2 + 1),
+                    'Side': side,
+                    'Price': f"{max(price, 0.01):.2f}",
+                    'News': str(news),
+                }
+
+
+def write_csv(path, rows, market):
+    """Stream `rows` rows of the market to a CSV file in the finance.csv format."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        stream = market.rows()
+        written = 0
+        while written < rows:
+            batch = list(islice(stream, min(65536, rows - written)))
+            writer.writerows(batch)
+            written += len(batch)
+    return written
+
+
+class SyntheticSegment:
+    """
+    One session's synthetic feed, in the interface of feed_cache.FeedSegment.
+    Rows are generated and encoded block by block as the session asks for
+    them, so they must be asked for in order. With a subscription, every row
+    is still generated, but only the subscribed symbols' rows are kept (and
+    counted towards rows). A subscription that matches none of the market's
+    symbols raises ValueError.
+    """
+    binary_error = None  # Rows are encoded as they are sent
+
+    def __init__(self, market, rows=None, subscription=None):
+        self.source = market.describe()
+        self.rows = rows if rows else float("inf")
+        self._stream = market.rows()
+        self._encoder = BinaryEncoder()
+        # Every symbol is defined up front, as a CSV segment's symbol table is
+        definitions = [self._encoder.define_symbol(name) for name in market.tickers]
+        if subscription is not None:
+            self.source += f" [{subscription.describe()}]"
+            matches = subscription.matches
+            self._stream = (row for row in self._stream if matches(row['Symbol']))
+            definitions = [record for name, record in zip(market.tickers, definitions) if matches(name)]
+            if not definitions:
+                # The filtered stream would never yield a row
+                raise ValueError(f"{subscription.describe()} matches none of the "
+                                 f"{len(market.tickers):,} synthetic symbols")
+        self._symbols = b"".join(definitions)
+        self._block = []
+        self._block_start = 0
+
+    def column(self, name):
+        raise KeyError(f"{self.source} is generated; it has no '{name}' column to read ahead")
+
+    def header(self, protocol):
+        return self._symbols if protocol == PROTOCOL_BINARY else b""
+
+    def _rows(self, start, stop):
+        block_stop = self._block_start + len(self._block)
+        if stop > block_stop:
+            self._block = list(islice(self._stream, stop - block_stop))
+            self._block_start = block_stop
+        if start < self._block_start:
+            raise ValueError(f"{self.source}: rows must be read in order")
+        return self._block[start - self._block_start:stop - self._block_start]
+
+    def orders(self, start, stop):
+        """(symbol, order id, side, price, quantity) of rows [start, stop), for the matching engine."""
+        return [(row['Symbol'], int(row['OrderID']), row['Side'], float(row['Price']), int(row['Quantity']))
+                for row in self._rows(start, stop)]
+
+    def row_slice(self, protocol, start, stop):
+        rows = self._rows(start, stop)
+        if protocol == PROTOCOL_BINARY:
+            encode = self._encoder.encode
+            timestamp = time.time()
+            return b"".join([encode(row, RECORD_TICK, timestamp) for row in rows])
+        date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        lines = []
+        for row in rows:
+            row = dict(row, date=date)
+            lines.append(json.dumps(row) + "\n")
+        return "".join(lines).encode("utf-8")
+
+
+class SyntheticFeed:
+    """Stands in for SharedFeed: each session gets its own segment, generated from the same seed."""
+
+    def __init__(self, rows=None, **market_options):
+        self.market = SyntheticMarket(**market_options)
+        self.rows = rows
+
+    def describe(self):
+        count = f"{self.rows:,} rows" if self.rows else "endless rows"
+        return f"{count} of {self.market.n_symbols:,} synthetic symbols (seed {self.market.seed})"
+
+    def segments(self, subscription=None):
+        return [SyntheticSegment(self.market, self.rows, subscription)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic feed in the finance.csv format")
+    parser.add_argument("--rows", type=int, required=True, help="Rows to write")
+    parser.add_argument("--symbols", type=int, default=DEFAULT_SYMBOLS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", default="synthetic.csv")
+    parser.add_argument("--volatility", type=float, default=0.0005, help="Relative mid-price move per tick (std dev)")
+    parser.add_argument("--cancel-probability", type=float, default=0.02,
+                        help="Chance that a modify cancels its order (quantity 0)")
+    parser.add_argument("--burst-rate", type=float, default=0.0002, help="News bursts started per row")
+    parser.add_argument("--burst-length", type=int, default=200, help="Ticks of its symbol a news burst lasts")
+    args = parser.parse_args()
+
+    market = SyntheticMarket(args.symbols, args.seed, volatility=args.volatility,
+                             cancel_probability=args.cancel_probability, burst_rate=args.burst_rate,
+                             burst_length=args.burst_length)
+    start = time.perf_counter()
+    written = write_csv(args.output, args.rows, market)
+    elapsed = time.perf_counter() - start
+    print(f"Wrote {written:,} rows of {args.symbols:,} symbols to {args.output} in {elapsed:.1f}s "
+          f"({written / elapsed if elapsed > 0 else 0:,.0f} rows/s)")
@@ -1,111 +1,362 @@
 #!/usr/bin/env python3
 import socket
 import threading
-import csv
 import json
 import argparse
 import sys
 import time
-import datetime
+from feed_cache import FilteredSegment, SharedFeed
+from feed_merge import MergedFeed
+from matching_engine import BUY, SELL, STATUS_REJECTED, MarketReplay, MatchingEngine, Order
+from replay import DEFAULT_MAX_BATCH_ROWS, SEND, ReplayConfig, replay_steps
+from subscriptions import Subscription
+from synthetic_feed import DEFAULT_SEED, DEFAULT_SYMBOLS, SyntheticFeed
+from wire_protocol import (HANDSHAKE_TIMEOUT, PROTOCOL_BINARY, PROTOCOL_JSON, RECORD_ACK, RECORD_FILL,
+                           RECORD_SIZE, REPORT_TYPES, BinaryDecoder, BinaryEncoder, clock_record, read_hello)
 
-def handle_csv_client(client, files, interval):
+DEFAULT_BACKLOG = 1024  # Pending-connection queue for both listening sockets
+LINGER_TIMEOUT = 5  # Seconds to wait for a feed client to close after the last row
+
+def close_gracefully(client, timeout=LINGER_TIMEOUT):
+    """
+    Half-closes the connection and discards anything the client still sends
+    (e.g. a hello that arrived after the handshake timeout) until it closes too.
+    Closing with unread data would reset the connection and the client could
+    lose the tail of the feed.
+    """
+    try:
+        client.shutdown(socket.SHUT_WR)
+        client.settimeout(timeout)
+        while client.recv(4096):
+            pass
+    except OSError:
+        pass
+    finally:
+        client.close()
+
+def negotiated_protocol(hello):
+    """Wire format the client asked for in its hello; JSON if it sent none."""
+    if hello and hello.get("Protocol") == PROTOCOL_BINARY:
+        return PROTOCOL_BINARY
+    return PROTOCOL_JSON
+
+def wants_stamps(hello):
+    """Whether the client asked for a clock record in front of every send."""
+    return bool(hello and hello.get("Stamps"))
+
+def session_segments(feed, hello, protocol=PROTOCOL_JSON):
+    """
+    The segments to stream for a hello: the whole feed, or only the symbols it
+    subscribed to (see subscriptions.py). Raises ValueError for a malformed
+    subscription, or for a binary client if a file can't be sent as binary.
+    """
+    subscription = Subscription.from_hello(hello)
+    if subscription is None:
+        segments = feed.segments()
+    else:
+        print(f"CSV client subscribed to {subscription.describe()}")
+        segments = feed.segments(subscription)
+    if protocol == PROTOCOL_BINARY:
+        for segment in segments:
+            if segment.binary_error is not None:
+                raise ValueError(f"{segment.source} can't be sent as binary ({segment.binary_error}); "
+                                 f"use the JSON protocol")
+    return segments
+
+def market_rows(market):
+    """
+    replay_steps' on_rows for a MarketReplay. The market follows the whole
+    feed, so a filtered segment advances it through every row of the file up
+    to the rows it sends.
+    """
+    def advance(segment, start, stop):
+        if isinstance(segment, FilteredSegment):
+            start, stop = segment.parent_rows(start, stop)
+            segment = segment.parent
+        market.advance(segment, start, stop)
+    return advance
+
+def handle_csv_client(client, feed, replay_config, handshake_timeout=HANDSHAKE_TIMEOUT, market=None):
     """
     Streams CSV data to the connected client.
-    Each row is sent as a JSON message with a timestamp.
+    Each row is sent as a JSON message with a timestamp, or as a binary record
+    if the client asked for the binary protocol in its hello. Rows are
+    zero-copy slices of the shared pre-encoded feed, paced by replay_config;
+    rows that are due together go out in a single send. A client that
+    subscribed to some symbols in its hello only gets their rows. If a
+    MarketReplay is given, the rows' orders are applied to the matching engine
+    as they go out.
     """
-    csv_data = []
-    # Read all CSV files and accumulate rows
-    for f in files:
-        try:
-            with open(f, 'r') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    csv_data.append(row)
-        except Exception as e:
-            print(f"Error reading file {f}: {e}")
-    # Stream each row to the client
-    for row in csv_data:
-        # Optionally add a timestamp or other processing here
-        row['date'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        try:
-            client.send((json.dumps(row) + "\n").encode("utf-8"))
-            time.sleep(interval)
-        except Exception as e:
-            print(f"Error sending to CSV client: {e}")
-            break
-    client.close()
+    hello = read_hello(client, handshake_timeout)
+    protocol = negotiated_protocol(hello)
+    stamps = wants_stamps(hello)
+    try:
+        segments = session_segments(feed, hello, protocol)
+    except ValueError as e:
+        print(f"Refusing CSV client: {e}")
+        close_gracefully(client)
+        return
+    if market is not None:
+        market.session_started()
+    try:
+        pacer = replay_config.new_pacer(segments)
+        on_rows = market_rows(market) if market is not None else None
+        for step, value in replay_steps(segments, protocol, pacer, replay_config.max_batch_rows, on_rows=on_rows):
+            if step == SEND:
+                if stamps:
+                    client.sendall(clock_record(protocol))
+                client.sendall(value)
+            elif value > 0:
+                time.sleep(value)
+    except Exception as e:
+        print(f"Error sending to CSV client: {e}")
+    finally:
+        if market is not None:
+            market.session_finished()
+    close_gracefully(client)
 
-def csv_stream_server(host, port, files, interval):
+def csv_stream_server(host, port, feed, replay_config, handshake_timeout=HANDSHAKE_TIMEOUT, backlog=DEFAULT_BACKLOG,
+                      market=None):
     """
     Listens for incoming CSV stream clients.
     """
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((host, port))
-    s.listen(5)
+    s.listen(backlog)
     print(f"CSV Stream Server listening on {host}:{port}")
     while True:
         client, addr = s.accept()
         print(f"CSV Client connected from {addr}")
-        threading.Thread(target=handle_csv_client, args=(client, files, interval)).start()
+        threading.Thread(target=handle_csv_client,
+                         args=(client, feed, replay_config, handshake_timeout, market)).start()
+
+class OrderSession:
+    """
+    One order-port connection: its wire format, and the execution reports
+    (acks and fills) sent back to it. Fills of this session's resting orders
+    can be reported from other sessions' threads, so sends are serialized.
+    """
 
-def handle_order_client(client):
+    def __init__(self, engine, send):
+        self.engine = engine
+        self.send = send
+        self.decoder = None  # Set once the client switches to binary
+        self.report_encoder = None
+        self.lock = threading.Lock()
+
+    def use_binary(self):
+        self.decoder = BinaryDecoder()
+        self.report_encoder = BinaryEncoder()
+
+    def report(self, kind, order, quantity, price, status=None):
+        """
+        Send one ACK (quantity = what is left on the book, price = the limit)
+        or FILL (quantity and price of the execution) for an Order.
+        """
+        message = {"Type": REPORT_TYPES[kind], "OrderID": order.order_id, "Symbol": order.symbol,
+                   "Side": order.side, "Quantity": quantity, "Price": price, "Status": status or order.status()}
+        with self.lock:
+            if self.report_encoder is not None:
+                data = self.report_encoder.encode(message, kind)
+            else:
+                data = (json.dumps(message) + "\n").encode("utf-8")
+            try:
+                self.send(data)
+            except OSError as e:
+                print(f"Error sending execution report: {e}")
+
+    def filled(self, order, quantity, price):
+        """Called by the engine when one of this session's resting orders trades."""
+        self.report(RECORD_FILL, order, quantity, price)
+
+def _order_id_or_zero(order):
+    try:
+        return int(order.get("OrderID") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def parse_order(order):
+    """(symbol, side, price, quantity, client order id or None) from an order message, or None if it is invalid."""
+    try:
+        symbol = str(order["Symbol"])
+        side = str(order.get("Side", BUY))
+        price = float(order["Price"])
+        quantity = int(order["Quantity"])
+        order_id = int(order.get("OrderID") or 0) or None
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+    if side not in (BUY, SELL) or price <= 0 or quantity <= 0:
+        return None
+    return symbol, side, price, quantity, order_id
+
+def process_order(order, session):
+    """
+    Matches the order and reports back to its sender: a FILL per execution,
+    then an ACK with the order's status and what is left on the book. Owners
+    of the resting orders it traded against get their FILLs too. An order that reuses the OrderID of
+    one of the session's resting orders replaces it.
+    """
+    print("Received order:", order)
+    parsed = parse_order(order)
+    if parsed is None:
+        order = order if isinstance(order, dict) else {}
+        rejected = Order(_order_id_or_zero(order), session, str(order.get("Symbol", "")), BUY, 0.0, 0)
+        session.report(RECORD_ACK, rejected, 0, 0.0, STATUS_REJECTED)
+        return
+    symbol, side, price, quantity, order_id = parsed
+    if order_id is None:
+        taker, fills = session.engine.submit(symbol, side, price, quantity, session)
+    else:
+        taker, fills = session.engine.replace(symbol, side, price, quantity, session, order_id)
+    for fill in fills:
+        session.report(RECORD_FILL, taker, fill.quantity, fill.price)
+        if fill.maker.owner is not None:
+            fill.maker.owner.filled(fill.maker, fill.quantity, fill.price)
+    session.report(RECORD_ACK, taker, taker.remaining, price)
+
+def consume_orders(buffer, session):
+    """
+    Processes every complete order in buffer and returns the leftover bytes.
+    Orders are newline-delimited JSON until a {"Protocol": "binary"} hello line,
+    after which the rest of the connection carries binary order records.
     """
-    Receives order messages from a client.
-    Expects newline-delimited JSON messages.
+    while session.decoder is None and b"\n" in buffer:
+        line, buffer = buffer.split(b"\n", 1)
+        line = line.decode("utf-8", errors="replace").strip()
+        if not line:
+            continue
+        try:
+            order = json.loads(line)
+        except json.JSONDecodeError:
+            print("Received invalid JSON order:", line)
+            continue
+        if isinstance(order, dict) and "Protocol" in order:
+            if order["Protocol"] == PROTOCOL_BINARY:
+                session.use_binary()
+            continue
+        process_order(order, session)
+    if session.decoder is not None:
+        usable = len(buffer) // RECORD_SIZE * RECORD_SIZE
+        for order in session.decoder.decode(buffer[:usable]):
+            process_order(order, session)
+        buffer = buffer[usable:]
+    return buffer
+
+def handle_order_client(client, engine):
+    """
+    Receives order messages from a client and sends its execution reports back.
+    Expects newline-delimited JSON messages, or binary order records after a binary hello.
+    The client's resting orders are cancelled when it disconnects.
     """
-    buffer = ""
+    session = OrderSession(engine, client.sendall)
+    buffer = b""
     while True:
         try:
-            data = client.recv(1024).decode("utf-8")
+            data = client.recv(4096)
             if not data:
                 break
-            buffer += data
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
-                if not line.strip():
-                    continue
-                try:
-                    order = json.loads(line.strip())
-                    print("Received order:", order)
-                    # Here you could add further processing for the order.
-                except json.JSONDecodeError:
-                    print("Received invalid JSON order:", line)
+            buffer = consume_orders(buffer + data, session)
         except Exception as e:
             print(f"Error receiving order: {e}")
             break
+    engine.cancel_all(session)
     client.close()
 
-def order_server(host, port):
+def order_server(host, port, engine, backlog=DEFAULT_BACKLOG):
     """
     Listens for incoming order connections.
     """
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((host, port))
-    s.listen(5)
+    s.listen(backlog)
     print(f"Order Server listening on {host}:{port}")
     while True:
         client, addr = s.accept()
         print(f"Order Client connected from {addr}")
-        threading.Thread(target=handle_order_client, args=(client,)).start()
+        threading.Thread(target=handle_order_client, args=(client, engine)).start()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(usage='Usage: unified_server.py --csv-port PORT --order-port PORT --files file1.csv file2.csv [--interval seconds]')
     parser.add_argument("--csv-port", type=int, default=9995, help="Port for CSV streaming")
     parser.add_argument("--order-port", type=int, default=9999, help="Port for receiving orders")
-    parser.add_argument("--files", nargs='+', required=True, help="CSV file(s) to stream")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--files", nargs='+', help="CSV file(s) or tick store directories to stream")
+    source.add_argument("--synthetic", action="store_true",
+                        help="Stream a generated feed instead of files (see synthetic_feed.py)")
+    parser.add_argument("--merge-on", metavar="COLUMN",
+                        help="Merge --files into one stream ordered on this sequence or timestamp column, "
+                             "reading them lazily instead of sending them one after the other (see feed_merge.py)")
+    parser.add_argument("--synthetic-rows", type=int, default=0, help="Rows per --synthetic session (0 for no end)")
+    parser.add_argument("--synthetic-symbols", type=int, default=DEFAULT_SYMBOLS, help="Symbols in the --synthetic feed")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Seed of the --synthetic feed")
     parser.add_argument("--host", default="127.0.0.1", help="Host address")
-    parser.add_argument("--interval", type=int, default=0.1, help="Time interval between messages")
+    parser.add_argument("--interval", type=float, default=0.1, help="Time interval between messages")
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument("--rate", type=float, help="Target messages per second (overrides --interval)")
+    pacing.add_argument("--max-speed", action="store_true", help="Send as fast as possible, many rows per send")
+    pacing.add_argument("--speed", type=float, help="Replay at N times real time (needs --timestamp-column)")
+    parser.add_argument("--timestamp-column", help="CSV column with each row's time, for --speed")
+    parser.add_argument("--burst", type=int, help="Rows a --rate session may send at once when catching up")
+    parser.add_argument("--max-batch-rows", type=int, default=DEFAULT_MAX_BATCH_ROWS, help="Most rows coalesced into one send")
+    parser.add_argument("--handshake-timeout", type=float, default=HANDSHAKE_TIMEOUT,
+                        help="Seconds to wait for a client's protocol hello before defaulting to JSON")
+    parser.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG, help="Listen backlog for both ports")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Serve both ports from one asyncio event loop instead of a thread per client")
+    parser.add_argument("--no-market-orders", dest="market_orders", action="store_false",
+                        help="Don't add the feed's own orders to the matching engine's books")
+    parser.add_argument("--no-feed-cache", dest="feed_cache", action="store_false",
+                        help="Don't read or write the pre-encoded <file>.feedcache next to each CSV")
     args = parser.parse_args()
 
+    try:
+        replay_config = ReplayConfig(args.interval, args.rate, args.max_speed, args.speed,
+                                     args.timestamp_column, args.burst, args.max_batch_rows)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.synthetic and args.speed is not None:
+        parser.error("--speed needs a timestamp column, which the --synthetic feed doesn't have")
+
+    if args.merge_on and args.synthetic:
+        parser.error("--merge-on merges --files")
+
+    if args.synthetic:
+        feed = SyntheticFeed(args.synthetic_rows, symbols=args.synthetic_symbols, seed=args.seed)
+        print(f"Generating {feed.describe()}, replaying at {replay_config.describe()}")
+    elif args.merge_on:
+        try:
+            feed = MergedFeed(args.files, args.merge_on)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        print(f"Streaming {feed.describe()}, replaying at {replay_config.describe()}")
+    else:
+        # Parse and encode the feed once; every client session streams from this copy
+        feed = SharedFeed(args.files, disk_cache=args.feed_cache)
+        print(f"Loaded {len(feed)} rows from {len(args.files)} file(s), replaying at {replay_config.describe()}")
+
+    # Orders from every client are matched in one engine, against each other and the feed's orders
+    engine = MatchingEngine()
+    market = MarketReplay(engine) if args.market_orders else None
+
+    if args.use_async:
+        from async_server import run_async_server
+        print("Unified server running (asyncio). Press Ctrl+C to exit.")
+        try:
+            run_async_server(args.host, args.csv_port, args.order_port, feed, replay_config, engine,
+                             args.handshake_timeout, args.backlog, market)
+        except KeyboardInterrupt:
+            print("Server shutting down.")
+        sys.exit(0)
+
     # Start CSV stream server in one thread.
-    csv_thread = threading.Thread(target=csv_stream_server, args=(args.host, args.csv_port, args.files, args.interval))
+    csv_thread = threading.Thread(target=csv_stream_server, args=(args.host, args.csv_port, feed, replay_config, args.handshake_timeout, args.backlog, market))
     csv_thread.daemon = True
     csv_thread.start()
 
     # Start Order server in another thread.
-    order_thread = threading.Thread(target=order_server, args=(args.host, args.order_port))
+    order_thread = threading.Thread(target=order_server, args=(args.host, args.order_port, engine, args.backlog))
     order_thread.daemon = True
     order_thread.start()
 
@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+# The modules are flat scripts in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def new_client():
+    """Builds trading_client.FinanceClients (or trade_xgboost's with module=...) that never connect."""
+    clients = []
+
+    def make(module="trading_client", **options):
+        client_class = __import__(module).FinanceClient
+        # Nothing listens on the order port; the gateway just keeps retrying in the background
+        client = client_class("127.0.0.1", 1, order_port=1, console="quiet", **options)
+        clients.append(client)
+        return client
+    yield make
+    for client in clients:
+        client.gateway.close(timeout=0)
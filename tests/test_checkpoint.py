@@ -0,0 +1,87 @@
+import mmap
+import os
+import pytest
+import checkpoint
+from checkpoint import CheckpointError, Checkpointer, restore, snapshot, write_atomic
+
+
+def traded_client(new_client):
+    client = new_client()
+    for price, quantity, side in [(10.0, 100, "B"), (10.5, 200, "S"), (11.0, 50, "B")]:
+        client.symbol_state["AAA"].update(price, quantity, side)
+    client.ledger.cash -= 500.0
+    return client
+
+
+def test_round_trip(tmp_path, new_client):
+    path = str(tmp_path / "client.ckpt")
+    client = traded_client(new_client)
+    write_atomic(path, snapshot(client))
+    restored = new_client()
+    assert restore(restored, path) == 1
+    assert restored.symbol_state["AAA"].prices.moving_average() == client.symbol_state["AAA"].prices.moving_average()
+    assert restored.ledger.cash == client.ledger.cash
+
+
+@pytest.mark.parametrize("damage", ["empty", "truncated", "corrupt", "garbage"])
+def test_unusable_checkpoint_raises_checkpoint_error(tmp_path, new_client, damage):
+    path = str(tmp_path / "client.ckpt")
+    data = snapshot(traded_client(new_client))
+    if damage == "empty":
+        data = b""
+    elif damage == "truncated":
+        data = data[:len(data) // 2]
+    elif damage == "corrupt":
+        data = data[:-20] + bytes(20)
+    else:
+        data = b"not a checkpoint at all"
+    with open(path, "wb") as f:
+        f.write(data)
+    fresh = new_client()
+    with pytest.raises(CheckpointError):
+        restore(fresh, path)
+    assert not fresh.symbol_state
+
+
+def test_client_starts_fresh_from_an_empty_checkpoint(tmp_path, new_client, capsys):
+    path = str(tmp_path / "client.ckpt")
+    open(path, "wb").close()
+    checkpointer = Checkpointer(path)
+    try:
+        client = new_client(checkpoint=checkpointer, resume=True)
+    finally:
+        checkpointer.close()
+    assert not client.resume
+    assert "starting fresh" in capsys.readouterr().out
+
+
+def test_write_atomic_leaves_no_temp_file(tmp_path):
+    path = str(tmp_path / "client.ckpt")
+    write_atomic(path, b"first")
+    write_atomic(path, b"second")
+    assert os.listdir(tmp_path) == ["client.ckpt"]
+    with open(path, "rb") as f:
+        assert f.read() == b"second"
+
+
+def test_other_window_size_raises_checkpoint_error(tmp_path, new_client):
+    path = str(tmp_path / "client.ckpt")
+    write_atomic(path, snapshot(traded_client(new_client)))
+    with pytest.raises(CheckpointError, match="window size 5, not 7"):
+        restore(new_client(window_size=7), path)
+
+
+def test_restore_closes_its_map(tmp_path, new_client, monkeypatch):
+    path = str(tmp_path / "client.ckpt")
+    write_atomic(path, snapshot(traded_client(new_client)))
+    maps = []
+
+    class RecordedMap(mmap.mmap):
+        def __new__(cls, *args, **kwargs):
+            mapped = super().__new__(cls, *args, **kwargs)
+            maps.append(mapped)
+            return mapped
+
+    monkeypatch.setattr(checkpoint.mmap, "mmap", RecordedMap)
+    restore(new_client(), path)
+    assert [mapped.closed for mapped in maps] == [True]
@@ -0,0 +1,45 @@
+import json
+import os
+import pytest
+from feed_cache import CACHE_SUFFIX, SharedFeed
+from tcp_server import session_segments
+from wire_protocol import PROTOCOL_BINARY, PROTOCOL_JSON, BinaryDecoder
+
+
+def write_feed(path, quantities):
+    with open(path, "w") as f:
+        f.write("Symbol,Description,OrderID,Quantity,Action,Exchange,Side,Price,News\n")
+        for i, quantity in enumerate(quantities):
+            f.write(f"{'AAA' if i % 2 else 'BBB'},Test Inc,{i + 1},{quantity},A,1,B,10.5,50\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("disk_cache", [False, True])
+def test_row_too_big_for_binary_is_still_served_as_json(tmp_path, disk_cache):
+    path = write_feed(tmp_path / "feed.csv", [100, 2 ** 32 + 5, 300])
+    for _ in range(2 if disk_cache else 1):  # The second load maps the cache file
+        [segment] = SharedFeed([path], disk_cache=disk_cache).segments()
+        assert "line 3" in segment.binary_error
+        lines = bytes(segment.row_slice(PROTOCOL_JSON, 0, segment.rows)).decode().splitlines()
+        assert [json.loads(line)["Quantity"] for line in lines] == ["100", str(2 ** 32 + 5), "300"]
+    assert os.path.exists(path + CACHE_SUFFIX) == disk_cache
+
+
+def test_binary_client_is_refused_a_file_that_does_not_fit(tmp_path):
+    feed = SharedFeed([write_feed(tmp_path / "feed.csv", [100, 2 ** 32 + 5])], disk_cache=False)
+    assert session_segments(feed, {"Protocol": "json"}, PROTOCOL_JSON)
+    with pytest.raises(ValueError, match="can't be sent as binary"):
+        session_segments(feed, {"Protocol": "binary"}, PROTOCOL_BINARY)
+    # Subscriptions still work for JSON clients
+    [segment] = session_segments(feed, {"Protocol": "json", "Symbols": ["AAA"]}, PROTOCOL_JSON)
+    assert [json.loads(line)["Symbol"] for line in bytes(segment.row_slice(PROTOCOL_JSON, 0, segment.rows))
+            .decode().splitlines()] == ["AAA"]
+
+
+def test_binary_rows(tmp_path):
+    [segment] = SharedFeed([write_feed(tmp_path / "feed.csv", [100, 200])], disk_cache=False).segments()
+    assert segment.binary_error is None
+    decoder = BinaryDecoder()
+    decoder.decode(segment.header(PROTOCOL_BINARY))
+    rows = decoder.decode(segment.row_slice(PROTOCOL_BINARY, 0, segment.rows))
+    assert [(row["Symbol"], row["Quantity"]) for row in rows] == [("BBB", 100), ("AAA", 200)]
@@ -0,0 +1,49 @@
+import json
+import pytest
+from feed_merge import MergedFeed
+from matching_engine import MarketReplay, MatchingEngine
+from wire_protocol import PROTOCOL_BINARY
+
+
+def write_venue(path, rows, order_ids=True):
+    columns = ["Seq", "Symbol", "OrderID", "Quantity", "Action", "Exchange", "Side", "Price", "News"]
+    if not order_ids:
+        columns.remove("OrderID")
+    with open(path, "w") as f:
+        f.write(",".join(columns) + "\n")
+        for seq, symbol, order_id, *quantity in rows:
+            values = {"Seq": seq, "Symbol": symbol, "OrderID": order_id, "Quantity": quantity[0] if quantity else 100,
+                      "Action": "A", "Exchange": 1, "Side": "B", "Price": 10.5, "News": 50}
+            f.write(",".join(str(values[column]) for column in columns) + "\n")
+    return str(path)
+
+
+def test_merge_without_order_ids_streams_but_adds_no_orders(tmp_path, capsys):
+    files = [write_venue(tmp_path / "a.csv", [(1, "AAA", 1), (3, "AAA", 2)], order_ids=False),
+             write_venue(tmp_path / "b.csv", [(2, "BBB", 3)], order_ids=False)]
+    [segment] = MergedFeed(files, "Seq").segments()
+    market = MarketReplay(MatchingEngine())
+    market.session_started()
+    market.advance(segment, 0, 3)
+    assert "Not adding the orders" in capsys.readouterr().out
+    assert segment.orders(0, 3) == []
+    lines = bytes(segment.row_slice("json", 0, 3)).decode().splitlines()
+    assert [json.loads(line)["Symbol"] for line in lines] == ["AAA", "BBB", "AAA"]
+
+
+def test_merge_orders(tmp_path):
+    files = [write_venue(tmp_path / "a.csv", [(1, "AAA", 1), (3, "AAA", 2)]),
+             write_venue(tmp_path / "b.csv", [(2, "BBB", 3)])]
+    [segment] = MergedFeed(files, "Seq").segments()
+    assert [order[:2] for order in segment.orders(0, 3)] == [("AAA", 1), ("BBB", 3), ("AAA", 2)]
+
+
+def test_row_too_big_for_binary_names_its_file_and_line(tmp_path):
+    files = [write_venue(tmp_path / "a.csv", [(1, "AAA", 1), (3, "AAA", 2, 5_000_000_000)]),
+             write_venue(tmp_path / "b.csv", [(2, "BBB", 3)])]
+    [segment] = MergedFeed(files, "Seq").segments()
+    with pytest.raises(ValueError, match=r"a\.csv line 3 can't be sent as binary"):
+        segment.row_slice(PROTOCOL_BINARY, 0, 3)
+    [segment] = MergedFeed(files, "Seq").segments()
+    lines = bytes(segment.row_slice("json", 0, 3)).decode().splitlines()
+    assert [json.loads(line)["Quantity"] for line in lines] == ["100", "100", "5000000000"]
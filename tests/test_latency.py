@@ -0,0 +1,12 @@
+import pytest
+from latency import Stats
+
+
+@pytest.mark.parametrize("module", ["trading_client", "trade_xgboost"])
+def test_stats_time_only_their_own_client(new_client, module):
+    first, second = Stats(), Stats()
+    clients = [new_client(module, stats=first), new_client(module, stats=second), new_client(module)]
+    for client in clients:
+        client.symbol_state["AAA"].update(10.0, 100, "B")
+    assert first.histogram("history_update").count == 1
+    assert second.histogram("history_update").count == 1
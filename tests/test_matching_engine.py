@@ -0,0 +1,87 @@
+from matching_engine import (BUY, SELL, STATUS_FILLED, STATUS_NEW, STATUS_PARTIAL, MarketReplay, MatchingEngine)
+
+
+class Owner:
+    """A client connection, as the engine sees it."""
+
+    def __init__(self):
+        self.fills = []
+
+    def filled(self, order, quantity, price):
+        self.fills.append((order.order_id, quantity, price))
+
+
+def fills_of(fills):
+    return [(fill.maker.order_id, fill.price, fill.quantity) for fill in fills]
+
+
+def test_price_then_time_priority():
+    engine = MatchingEngine()
+    engine.submit("AAA", SELL, 10.2, 100, order_id=1)
+    engine.submit("AAA", SELL, 10.1, 100, order_id=2)
+    engine.submit("AAA", SELL, 10.1, 100, order_id=3)
+    order, fills = engine.submit("AAA", BUY, 10.2, 250, order_id=4)
+    # Best price first, and the older order first within a price level, each at the resting order's price
+    assert fills_of(fills) == [(2, 10.1, 100), (3, 10.1, 100), (1, 10.2, 50)]
+    assert order.status() == STATUS_FILLED
+    assert engine.book("AAA").asks.depth() == [(10.2, 50)]
+
+
+def test_partial_fill_rests_the_remainder():
+    engine = MatchingEngine()
+    engine.submit("AAA", SELL, 10.0, 40, order_id=1)
+    order, fills = engine.submit("AAA", BUY, 10.5, 100, order_id=2)
+    assert fills_of(fills) == [(1, 10.0, 40)]
+    assert order.status() == STATUS_PARTIAL and order.remaining == 60
+    assert engine.book("AAA").bids.depth() == [(10.5, 60)]
+    assert engine.book("AAA").asks.depth() == []
+    assert (None, 2) in engine.resting and (None, 1) not in engine.resting
+
+
+def test_orders_that_do_not_cross_rest():
+    engine = MatchingEngine()
+    engine.submit("AAA", BUY, 9.9, 100, order_id=1)
+    order, fills = engine.submit("AAA", SELL, 10.0, 100, order_id=2)
+    assert fills == [] and order.status() == STATUS_NEW
+    assert engine.book("AAA").bids.best() == 9.9 and engine.book("AAA").asks.best() == 10.0
+
+
+def test_replace_moves_the_order_and_loses_time_priority():
+    engine = MatchingEngine()
+    engine.submit("AAA", SELL, 10.0, 100, order_id=1)
+    engine.submit("AAA", SELL, 10.0, 100, order_id=2)
+    engine.replace("AAA", SELL, 10.0, 80, order_id=1)  # Same price, new quantity: now behind order 2
+    _, fills = engine.submit("AAA", BUY, 10.0, 150, order_id=3)
+    assert fills_of(fills) == [(2, 10.0, 100), (1, 10.0, 50)]
+    engine.replace("AAA", SELL, 11.0, 30, order_id=1)
+    assert engine.book("AAA").asks.depth() == [(11.0, 30)]
+    assert engine.cancel(None, 1).remaining == 30
+    assert engine.book("AAA").asks.depth() == []
+
+
+def test_owners_keep_their_own_order_ids():
+    engine = MatchingEngine()
+    client = Owner()
+    engine.submit("AAA", BUY, 10.0, 100, owner=client, order_id=1)
+    engine.submit("AAA", BUY, 10.0, 100, order_id=1)  # The feed's order 1 is a different order
+    assert len(engine.book("AAA").bids.levels[10.0]) == 2
+    engine.cancel_all(client)
+    assert engine.book("AAA").bids.depth() == [(10.0, 100)]
+
+
+def test_market_replay_fills_resting_client_orders():
+    class Segment:
+        source = "feed"
+
+        def orders(self, start, stop):
+            return [("AAA", 7, SELL, 9.5, 30), ("AAA", 8, SELL, 9.0, 100)][start:stop]
+
+    engine = MatchingEngine()
+    replay = MarketReplay(engine)
+    replay.session_started()
+    client = Owner()
+    engine.submit("AAA", BUY, 10.0, 50, owner=client, order_id=1)
+    replay.advance(Segment(), 0, 2)
+    replay.advance(Segment(), 0, 2)  # Rows already applied are not applied again
+    assert client.fills == [(1, 30, 10.0), (1, 20, 10.0)]
+    assert engine.book("AAA").asks.depth() == [(9.0, 80)]
@@ -0,0 +1,54 @@
+import random
+import pytest
+from portfolio import PortfolioLedger
+
+
+def totals(ledger):
+    return ledger.nav(), ledger.market_value, ledger.gross_exposure, ledger.cost_basis, ledger.realized
+
+
+def test_running_totals_equal_a_full_revalue():
+    rng = random.Random(3)
+    ledger = PortfolioLedger(1_000_000)
+    symbols = [f"S{i}" for i in range(20)]
+    prices = {symbol: rng.uniform(10, 500) for symbol in symbols}
+    cash = 1_000_000
+    for _ in range(20_000):
+        symbol = rng.choice(symbols)
+        prices[symbol] = max(0.01, prices[symbol] * (1 + rng.gauss(0, 0.01)))
+        ledger.mark(symbol, prices[symbol])
+        if rng.random() < 0.3:
+            quantity = rng.randint(-300, 300) or 1  # Shorts and flips through zero included
+            ledger.fill(symbol, quantity, prices[symbol])
+            cash -= quantity * prices[symbol]
+    running = totals(ledger)
+    revalued_nav = ledger.revalue()
+    assert running == pytest.approx(totals(ledger), rel=1e-9, abs=1e-6)
+    # And both agree with valuing every holding from scratch
+    assert revalued_nav == pytest.approx(cash + sum(p.quantity * prices[s] for s, p in ledger.positions.items()),
+                                         rel=1e-12)
+    assert ledger.cash == pytest.approx(cash, rel=1e-12)
+
+
+def test_realized_and_unrealized_profit():
+    ledger = PortfolioLedger(10_000)
+    ledger.fill("AAA", 10, 100.0)
+    ledger.fill("AAA", 10, 110.0)  # Average cost 105
+    ledger.mark("AAA", 120.0)
+    assert ledger.unrealized() == pytest.approx(300.0)
+    ledger.sell("AAA", 5, 120.0)
+    assert ledger.realized == pytest.approx(75.0)
+    assert ledger.positions["AAA"].average_cost() == pytest.approx(105.0)
+    ledger.sell("AAA", 25, 100.0)  # Closes 15 at a loss of 5 each, then opens 10 short at 100
+    assert ledger.realized == pytest.approx(0.0)
+    assert ledger.position("AAA") == -10
+    assert ledger.positions["AAA"].average_cost() == pytest.approx(100.0)
+    assert ledger.nav() == pytest.approx(ledger.revalue())
+    assert ledger.profit_loss() == pytest.approx(ledger.realized + ledger.unrealized())
+
+
+def test_buy_needs_the_cash():
+    ledger = PortfolioLedger(1_000)
+    assert not ledger.buy("AAA", 11, 100.0)
+    assert ledger.buy("AAA", 10, 100.0)
+    assert ledger.cash == 0 and ledger.fills == 1
@@ -0,0 +1,20 @@
+import pytest
+from subscriptions import Subscription
+from synthetic_feed import SyntheticFeed
+
+
+def test_subscription_matching_no_symbol_is_refused():
+    feed = SyntheticFeed(symbols=50)
+    for subscription in (Subscription(symbols=["NOPE"]), Subscription(prefixes=["zz"]),
+                         Subscription(symbols=["NOPE"], shard=(0, 2))):
+        with pytest.raises(ValueError, match="matches none"):
+            feed.segments(subscription)
+
+
+def test_subscription_keeps_only_its_symbols():
+    feed = SyntheticFeed(rows=200, symbols=50)
+    name = feed.market.tickers[3]
+    [segment] = feed.segments(Subscription(symbols=[name]))
+    orders = segment.orders(0, 20)
+    assert len(orders) == 20
+    assert {order[0] for order in orders} == {name}
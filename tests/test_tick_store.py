@@ -0,0 +1,34 @@
+import csv
+import os
+import backtest
+import tick_store
+
+FEED = os.path.join(os.path.dirname(__file__), "..", "finance", "finance.csv")
+
+
+def ledger_rows(path):
+    """Ledger rows without the first column, the wall-clock time of the run."""
+    with open(path, newline='') as f:
+        return [row[1:] for row in csv.reader(f)]
+
+
+def test_backtest_from_store_matches_csv(tmp_path):
+    store = str(tmp_path / "ticks")
+    tick_store.ingest(store, [FEED])
+    from_csv = tmp_path / "csv.csv"
+    from_store = tmp_path / "store.csv"
+    backtest.run_backtest([FEED], output_file=str(from_csv))
+    backtest.run_backtest([store], output_file=str(from_store))
+    assert ledger_rows(from_store) == ledger_rows(from_csv)
+
+
+def test_symbol_query_returns_that_symbols_rows_in_order(tmp_path):
+    store = str(tmp_path / "ticks")
+    tick_store.ingest(store, [FEED])
+    ticks = tick_store.TickStore(store)
+    symbol = ticks.symbols[0]
+    rows = ticks.query(symbols=[symbol])
+    everything = ticks.query()
+    expected = everything['symbol'] == ticks.symbol_ids[symbol]
+    assert len(rows['ts']) == expected.sum() > 0
+    assert (rows['ts'] == everything['ts'][expected]).all()
@@ -0,0 +1,49 @@
+import os
+import numpy as np
+import pytest
+from tree_model import TreeModel, export_model
+
+xgboost = pytest.importorskip("xgboost")
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL = os.path.join(HERE, "xgb_model.json")
+
+
+def sample(n_features, rows=2000, seed=7):
+    """Random rows in the client's ranges, with some missing values to cover the default directions."""
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(0, 1000, (rows, n_features)).astype(np.float32)
+    X[:, :2] = rng.uniform(10, 500, (rows, 2))
+    X[rng.random(X.shape) < 0.02] = np.nan
+    return X
+
+
+def assert_same_as_booster(model, booster, X):
+    expected = booster.inplace_predict(X, validate_features=False)
+    np.testing.assert_array_equal(model.predict(X), expected)
+    np.testing.assert_array_equal(np.array([model.predict_row(row) for row in X[:300].tolist()], np.float32),
+                                  expected[:300])
+    np.testing.assert_array_equal(model.inplace_predict(X[:3]), expected[:3])  # The row-by-row path
+
+
+@pytest.mark.skipif(not os.path.exists(MODEL), reason="no exported model in the repository")
+def test_repository_model_matches_booster():
+    model = TreeModel.load(MODEL)
+    assert_same_as_booster(model, xgboost.Booster(model_file=MODEL), sample(model.num_features()))
+
+
+@pytest.mark.parametrize("suffix", [".json", ".ubj"])
+def test_trained_model_matches_booster(tmp_path, suffix):
+    X = sample(6, rows=3000, seed=1)
+    y = (np.nan_to_num(X[:, 0]) + np.nan_to_num(X[:, 3]) > 600).astype(np.float32)
+    booster = xgboost.train({"objective": "binary:logistic", "max_depth": 4, "tree_method": "hist"},
+                            xgboost.DMatrix(X, label=y), num_boost_round=20)
+    path = str(tmp_path / f"model{suffix}")
+    export_model(booster, path)
+    model = TreeModel.load(path)
+    assert model.num_features() == 6 and model.num_trees() == 20
+    assert_same_as_booster(model, booster, sample(6, seed=2))
+
+
+def test_export_needs_a_model_suffix(tmp_path):
+    with pytest.raises(ValueError):
+        export_model(None, str(tmp_path / "model.pkl"))
@@ -0,0 +1,66 @@
+import struct
+import pytest
+from wire_protocol import (PROTOCOL_BINARY, RECORD_ACK, RECORD_SIZE, RECORD_TICK, BinaryDecoder, BinaryEncoder,
+                           clock_record)
+
+ROW = {"Symbol": "AAPL", "Description": "Apple Inc", "OrderID": "1102", "Quantity": "685000", "Action": "A",
+       "Exchange": "1", "Side": "B", "Price": "128.75", "News": "0"}
+
+
+def round_trip(*rows, kind=RECORD_TICK):
+    encoder = BinaryEncoder()
+    data = b"".join(encoder.encode(row, kind, 1234.5) for row in rows)
+    assert len(data) % RECORD_SIZE == 0
+    return BinaryDecoder().decode(data)
+
+
+def test_tick_round_trip():
+    [message] = round_trip(ROW)
+    assert message == {"Symbol": "AAPL", "OrderID": 1102, "Quantity": 685000, "Price": 128.75, "Side": "B",
+                       "Action": "A", "Exchange": 1, "News": 0, "Timestamp": 1234.5}
+
+
+def test_symbols_are_defined_once():
+    encoder = BinaryEncoder()
+    first = encoder.encode(ROW, RECORD_TICK, 0.0)
+    second = encoder.encode(ROW, RECORD_TICK, 0.0)
+    assert len(first) == 2 * RECORD_SIZE and len(second) == RECORD_SIZE
+    decoder = BinaryDecoder()
+    assert [m["Symbol"] for m in decoder.decode(first) + decoder.decode(second)] == ["AAPL", "AAPL"]
+
+
+def test_largest_values_fit():
+    row = dict(ROW, Symbol="S" * 32, OrderID=str(2 ** 64 - 1), Quantity=str(2 ** 32 - 1), Exchange="255",
+               News="255")
+    [message] = round_trip(row)
+    assert (message["Symbol"], message["OrderID"], message["Quantity"], message["Exchange"], message["News"]) == (
+        "S" * 32, 2 ** 64 - 1, 2 ** 32 - 1, 255, 255)
+
+
+@pytest.mark.parametrize("field, value", [("Quantity", str(2 ** 32)), ("OrderID", str(2 ** 64)),
+                                          ("Exchange", "256"), ("News", "256"), ("Quantity", "-1")])
+def test_values_out_of_range_raise(field, value):
+    with pytest.raises(struct.error):
+        BinaryEncoder().encode(dict(ROW, **{field: value}), RECORD_TICK, 0.0)
+
+
+def test_symbol_longer_than_the_record_raises():
+    with pytest.raises(ValueError, match="longer than 32 bytes"):
+        BinaryEncoder().encode(dict(ROW, Symbol="S" * 33), RECORD_TICK, 0.0)
+
+
+def test_missing_numbers_get_defaults():
+    row = dict(ROW, OrderID="", Exchange="NYSE")
+    del row["News"]
+    [message] = round_trip(row)
+    assert (message["OrderID"], message["Exchange"], message["News"]) == (0, 0, 50)
+
+
+def test_reports_and_clock_records():
+    decoder = BinaryDecoder()
+    encoder = BinaryEncoder()
+    data = clock_record(PROTOCOL_BINARY, ns=42) + encoder.encode(
+        {"Symbol": "AAPL", "OrderID": 7, "Quantity": 10, "Price": 1.5, "Side": "S", "Status": "F"}, RECORD_ACK, 9.0)
+    [report] = decoder.decode(data)
+    assert decoder.server_time == 42
+    assert (report["Type"], report["OrderID"], report["Status"], report["Side"]) == ("ACK", 7, "F", "S")
@@ -0,0 +1,429 @@
+"""
+Append-only columnar tick store with a per-symbol index.
+
+A store is a directory holding one file per column, with fixed-width
+little-endian values. The columns are the fields of a binary feed record
+(wire_protocol.RECORD):
+
+    ts, symbol, order_id, quantity, price, side, action, exchange, news
+
+The directory also holds:
+
+- symbols.txt: symbol names, one per line, in id order;
+- index.<N>.rows and index.<N>.starts: the per-symbol index of the first N
+  rows. The rows file holds those row numbers grouped by symbol (ascending
+  within a symbol), and starts[i]:starts[i + 1] is symbol i's part of it.
+  Each rebuild writes new files, so a reader never maps a half-written index;
+- meta.json: the row count and how far the index reaches. It is renamed into
+  place after every appended batch, so readers never see a half-written
+  batch. A writer reopening the store truncates any such batch.
+
+TickStore memory-maps the columns. A query for a symbol reads only that
+symbol's rows, and a time range is a binary search on ts while ts only moves
+forward. Neither parses anything. Rows appended after the index was last
+rebuilt (by TickStoreWriter.close()) are indexed in memory when the store is
+opened.
+
+Rows get into a store in two ways. The clients record the ticks they receive
+(--record-ticks DIR, stamped with the receive time), and
+`python tick_store.py ingest` loads feed CSVs. A store directory can then be
+used wherever a feed CSV is expected: backtest.py, sweep.py and
+train_xgboost.py load it with no parsing, and tcp_server.py streams it.
+
+    python tick_store.py ingest ticks --files finance/finance.csv
+    python tick_store.py query ticks --symbols AAPL MSFT --start 2026-10-17T09:30 --csv aapl_msft.csv
+    python backtest.py --files ticks --strategy xgboost
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from contextlib import nullcontext
+import numpy as np
+from journal import Journal
+from replay import parse_timestamp
+from wire_protocol import _int_field
+
+COLUMNS = [
+    ("ts", np.dtype("<f8")),
+    ("symbol", np.dtype("<u4")),
+    ("order_id", np.dtype("<u8")),
+    ("quantity", np.dtype("<u4")),
+    ("price", np.dtype("<f8")),
+    ("side", np.dtype("S1")),
+    ("action", np.dtype("S1")),
+    ("exchange", np.dtype("u1")),
+    ("news", np.dtype("u1")),
+]
+COLUMN_SUFFIX = ".col"
+SYMBOLS_FILE = "symbols.txt"
+META_FILE = "meta.json"
+INDEX_ROWS = "index.{}.rows"
+INDEX_STARTS = "index.{}.starts"
+INDEX_TYPE = np.dtype("<u8")
+
+# Feed CSV column -> store column, for readers that ask for CSV columns (feed_cache, the matching engine)
+CSV_COLUMNS = {"Timestamp": "ts", "Symbol": "symbol", "OrderID": "order_id", "Quantity": "quantity",
+               "Price": "price", "Side": "side", "Action": "action", "Exchange": "exchange", "News": "news"}
+
+INGEST_BATCH_ROWS = 65536
+
+
+def is_tick_store(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'rows': 0, 'symbols': 0, 'symbols_bytes': 0, 'indexed_rows': 0, 'ts_sorted': True, 'last_ts': None}
+
+
+def _replace(path, data):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build_index(symbols, n_symbols):
+    """(rows grouped by symbol, start of each symbol's group) for a symbol id column."""
+    rows = np.argsort(symbols, kind="stable").astype(INDEX_TYPE)
+    starts = np.searchsorted(symbols[rows], np.arange(n_symbols + 1)).astype(INDEX_TYPE)
+    return rows, starts
+
+
+class TickStoreWriter:
+    """
+    Appends feed rows to a store, creating it if needed. write() takes
+    (ts, message) pairs, with message a feed row dict of CSV strings or
+    binary-decoded values, so it also works as a journal.Journal writer.
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        meta = read_meta(path)
+        self.rows = meta['rows']
+        self.indexed_rows = meta['indexed_rows']
+        self.ts_sorted = meta['ts_sorted']
+        self.last_ts = meta['last_ts']
+        self.symbols_bytes = meta['symbols_bytes']
+        self.files = []
+        for name, dtype in COLUMNS:
+            f = open(os.path.join(path, name + COLUMN_SUFFIX), 'ab')
+            f.truncate(self.rows * dtype.itemsize)  # Drop a batch a killed writer left unfinished
+            self.files.append(f)
+        self.symbols_file = open(os.path.join(path, SYMBOLS_FILE), 'ab')
+        self.symbols_file.truncate(self.symbols_bytes)
+        self.symbol_ids = {}
+        if meta['symbols']:
+            with open(os.path.join(path, SYMBOLS_FILE), 'rb') as f:
+                names = f.read(self.symbols_bytes).decode("utf-8").split("\n")[:meta['symbols']]
+            self.symbol_ids = {name: i for i, name in enumerate(names)}
+
+    def write(self, rows):
+        if not rows:
+            return
+        symbol_ids = self.symbol_ids
+        new_symbols = []
+        ids = []
+        for _, message in rows:
+            symbol = message['Symbol']
+            sid = symbol_ids.get(symbol)
+            if sid is None:
+                sid = symbol_ids[symbol] = len(symbol_ids)
+                new_symbols.append(symbol)
+            ids.append(sid)
+        columns = [
+            [ts for ts, _ in rows],
+            ids,
+            [_int_field(m.get("OrderID")) for _, m in rows],
+            [int(m["Quantity"]) for _, m in rows],
+            [float(m["Price"]) for _, m in rows],
+            [m.get("Side") or "B" for _, m in rows],
+            [m.get("Action") or "A" for _, m in rows],
+            [_int_field(m.get("Exchange")) for _, m in rows],
+            [_int_field(m.get("News"), 50) for _, m in rows],
+        ]
+        ts = np.asarray(columns[0], dtype=np.float64)
+        if self.ts_sorted and ((self.last_ts is not None and ts[0] < self.last_ts) or np.any(ts[1:] < ts[:-1])):
+            self.ts_sorted = False
+        self.last_ts = float(ts[-1]) if self.last_ts is None else max(self.last_ts, float(ts.max()))
+
+        for f, values, (_, dtype) in zip(self.files, columns, COLUMNS):
+            f.write(np.asarray(values, dtype=dtype).tobytes())
+        if new_symbols:
+            names = "".join(name + "\n" for name in new_symbols).encode("utf-8")
+            self.symbols_file.write(names)
+            self.symbols_bytes += len(names)
+        self.rows += len(rows)
+
+    def flush(self):
+        """Make the rows written so far visible to readers."""
+        for f in self.files:
+            f.flush()
+        self.symbols_file.flush()
+        self._write_meta()
+
+    def close(self):
+        """Flush, rebuild the per-symbol index over every row, and close the files."""
+        self.flush()
+        for f in self.files:
+            f.close()
+        self.symbols_file.close()
+        if self.indexed_rows != self.rows:
+            symbols = np.fromfile(os.path.join(self.path, "symbol" + COLUMN_SUFFIX), dtype=dict(COLUMNS)["symbol"],
+                                  count=self.rows)
+            rows, starts = build_index(symbols, len(self.symbol_ids))
+            _replace(os.path.join(self.path, INDEX_ROWS.format(self.rows)), rows.tobytes())
+            _replace(os.path.join(self.path, INDEX_STARTS.format(self.rows)), starts.tobytes())
+            previous, self.indexed_rows = self.indexed_rows, self.rows
+            self._write_meta()
+            for name in (INDEX_ROWS, INDEX_STARTS):
+                try:
+                    os.remove(os.path.join(self.path, name.format(previous)))
+                except FileNotFoundError:
+                    pass
+
+    def _write_meta(self):
+        meta = {'rows': self.rows, 'symbols': len(self.symbol_ids), 'symbols_bytes': self.symbols_bytes,
+                'indexed_rows': self.indexed_rows, 'ts_sorted': self.ts_sorted, 'last_ts': self.last_ts}
+        _replace(os.path.join(self.path, META_FILE), json.dumps(meta).encode("utf-8"))
+
+
+class TickStore:
+    """Read-only, memory-mapped view of a store as of when it was opened."""
+
+    def __init__(self, path):
+        if not is_tick_store(path):
+            raise ValueError(f"{path} is not a tick store")
+        self.path = path
+        meta = read_meta(path)
+        self.rows = meta['rows']
+        self.ts_sorted = meta['ts_sorted']
+        with open(os.path.join(path, SYMBOLS_FILE), 'rb') as f:
+            self.symbols = f.read(meta['symbols_bytes']).decode("utf-8").split("\n")[:meta['symbols']]
+        self.symbol_ids = {name: i for i, name in enumerate(self.symbols)}
+        self.columns = {name: self._map(name + COLUMN_SUFFIX, dtype, self.rows) for name, dtype in COLUMNS}
+
+        indexed = meta['indexed_rows']
+        self._index_rows = self._map(INDEX_ROWS.format(indexed), INDEX_TYPE, indexed)
+        # One start per symbol known at the rebuild, plus the end; later symbols only have tail rows
+        self._index_starts = self._map(INDEX_STARTS.format(indexed), INDEX_TYPE, None if indexed else 0)
+        # Rows appended since the index was rebuilt, indexed here in memory
+        self._tail_rows, self._tail_starts = build_index(self.columns['symbol'][indexed:], len(self.symbols))
+        self._tail_rows += indexed
+
+    def _map(self, name, dtype, count):
+        """Memory-map count values of a file (all of it if None)."""
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=None if count is None else (count,))
+
+    def __len__(self):
+        return self.rows
+
+    def symbol_rows(self, symbol):
+        """Row numbers of one symbol's ticks, in order."""
+        sid = self.symbol_ids.get(symbol)
+        if sid is None:
+            return np.empty(0, dtype=INDEX_TYPE)
+        tail = self._tail_rows[self._tail_starts[sid]:self._tail_starts[sid + 1]]
+        if sid + 1 >= len(self._index_starts):
+            return tail
+        return np.concatenate([self._index_rows[self._index_starts[sid]:self._index_starts[sid + 1]], tail])
+
+    def select(self, symbols=None, start=None, end=None):
+        """
+        Rows of the given symbols (all if None) with start <= ts < end, as a
+        slice when every symbol is wanted and ts only moves forward, otherwise
+        as an array of row numbers in order.
+        """
+        ts = self.columns['ts']
+        if symbols is None:
+            if not self.ts_sorted and (start is not None or end is not None):
+                mask = np.ones(self.rows, dtype=bool)
+                if start is not None:
+                    mask &= ts >= start
+                if end is not None:
+                    mask &= ts < end
+                return np.flatnonzero(mask)
+            lo = 0 if start is None else int(np.searchsorted(ts, start, 'left'))
+            hi = self.rows if end is None else int(np.searchsorted(ts, end, 'left'))
+            return slice(lo, max(lo, hi))
+        parts = [self.symbol_rows(symbol) for symbol in symbols]
+        rows = np.sort(np.concatenate(parts)) if len(parts) > 1 else parts[0]
+        if start is None and end is None:
+            return rows
+        row_ts = ts[rows]
+        if self.ts_sorted:
+            lo = 0 if start is None else np.searchsorted(row_ts, start, 'left')
+            hi = len(rows) if end is None else np.searchsorted(row_ts, end, 'left')
+            return rows[lo:max(lo, hi)]
+        mask = np.ones(len(rows), dtype=bool)
+        if start is not None:
+            mask &= row_ts >= start
+        if end is not None:
+            mask &= row_ts < end
+        return rows[mask]
+
+    def query(self, symbols=None, start=None, end=None):
+        """{column: values} of the selected rows (memory-mapped slices where possible)."""
+        rows = self.select(symbols, start, end)
+        return {name: column[rows] for name, column in self.columns.items()}
+
+    def csv_column(self, name):
+        """Values of one feed CSV column, as FeedSegment.column() returns them for a CSV file."""
+        if name not in CSV_COLUMNS:
+            raise KeyError(f"{self.path} has no '{name}' column")
+        values = self.columns[CSV_COLUMNS[name]]
+        if name == "Symbol":
+            return np.array(self.symbols, dtype=object)[values].tolist() if len(values) else []
+        if values.dtype.kind == "S":
+            return values.astype("U1").tolist()
+        return values.tolist()
+
+    def feed(self, symbols=None, start=None, end=None):
+        """The selected rows as the feed dict of backtest.load_feed, with no parsing."""
+        return feed_dict([self.query(symbols, start, end)], [self.symbols])
+
+
+def feed_dict(parts, symbol_tables):
+    """backtest.load_feed's dict for column dicts of one or more stores, concatenated in order."""
+    names = np.unique(np.array([name for table in symbol_tables for name in table], dtype=str))
+    codes = np.concatenate([np.searchsorted(names, np.array(table, dtype=str)).astype(np.int64)[part['symbol']]
+                            if len(table) else np.empty(0, np.int64) for part, table in zip(parts, symbol_tables)])
+    # Keep only the symbols that occur, sorted, as np.unique does for a CSV feed
+    used = np.bincount(codes, minlength=len(names)) > 0
+    codes = (np.cumsum(used) - 1)[codes]
+    column = lambda name: np.concatenate([part[name] for part in parts])
+    return {
+        'symbol_names': names[used],
+        'symbol': codes.astype(np.int64),
+        'price': column('price').astype(np.float64),
+        'quantity': column('quantity').astype(np.int64),
+        'side': column('side').astype("U1"),
+        'news': column('news').astype(str),
+        'order_id': column('order_id').tolist(),
+        'exchange': column('exchange').tolist(),
+        'action': column('action').astype("U1").tolist(),
+    }
+
+
+def tick_recorder(path, **journal_options):
+    """
+    A background journal.Journal whose record((receive time, message)) appends
+    to the store at path; a context yielding None when path is None.
+    """
+    if path is None:
+        return nullcontext()
+    return Journal([TickStoreWriter(path)], **journal_options)
+
+
+def load_feed(paths):
+    """Every row of one or more stores as the feed dict of backtest.load_feed."""
+    stores = [TickStore(path) for path in paths]
+    return feed_dict([store.columns for store in stores], [store.symbols for store in stores])
+
+
+def ingest(path, files, timestamp_column=None):
+    """Append feed CSV files to a store; returns the number of rows added."""
+    writer = TickStoreWriter(path)
+    added = 0
+    now = time.time()
+    try:
+        for f in files:
+            with open(f, newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                if timestamp_column and timestamp_column not in (reader.fieldnames or []):
+                    raise ValueError(f"{f} has no '{timestamp_column}' column")
+                batch = []
+                for row in reader:
+                    batch.append((parse_timestamp(row[timestamp_column]) if timestamp_column else now, row))
+                    if len(batch) == INGEST_BATCH_ROWS:
+                        writer.write(batch)
+                        added += len(batch)
+                        batch = []
+                writer.write(batch)
+                added += len(batch)
+    finally:
+        writer.close()
+    return added
+
+
+def write_csv(store, rows, path):
+    """Write selected rows as a feed CSV (with a Timestamp column), for tools that want text."""
+    fields = list(CSV_COLUMNS)
+    columns = {name: column[rows] for name, column in store.columns.items()}
+    names = np.array(store.symbols, dtype=object)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        writer.writerows(zip(
+            columns['ts'].tolist(),
+            names[columns['symbol']].tolist() if len(names) else [],
+            columns['order_id'].tolist(),
+            columns['quantity'].tolist(),
+            columns['price'].tolist(),
+            columns['side'].astype("U1").tolist(),
+            columns['action'].astype("U1").tolist(),
+            columns['exchange'].tolist(),
+            columns['news'].tolist(),
+        ))
+
+
+def time_arg(value):
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not epoch seconds or an ISO-8601 time: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, inspect and query a columnar tick store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="Append feed CSV file(s) to a store")
+    ingest_parser.add_argument("store", help="Store directory (created if needed)")
+    ingest_parser.add_argument("--files", nargs='+', required=True, help="Feed CSV file(s)")
+    ingest_parser.add_argument("--timestamp-column",
+                               help="Column holding each row's time (epoch seconds or ISO-8601); "
+                                    "without it every row gets the ingest time")
+    info_parser = commands.add_parser("info", help="Rows, symbols and time span of a store")
+    info_parser.add_argument("store")
+    query_parser = commands.add_parser("query", help="Select rows by symbol and/or time range")
+    query_parser.add_argument("store")
+    query_parser.add_argument("--symbols", nargs='+', help="Only these symbols")
+    query_parser.add_argument("--start", type=time_arg, help="From this time (epoch seconds or ISO-8601)")
+    query_parser.add_argument("--end", type=time_arg, help="Up to, not including, this time")
+    query_parser.add_argument("--csv", help="Write the selected rows to this feed CSV file")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        start = time.perf_counter()
+        try:
+            added = ingest(args.store, args.files, args.timestamp_column)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        print(f"Added {added:,} rows to {args.store} in {time.perf_counter() - start:.2f}s")
+    else:
+        try:
+            store = TickStore(args.store)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.command == "info":
+            print(f"{len(store):,} rows, {len(store.symbols):,} symbols")
+            if len(store):
+                ts = store.columns['ts']
+                print(f"From {ts.min():.6f} to {ts.max():.6f}" + ("" if store.ts_sorted else " (not in time order)"))
+        else:
+            start = time.perf_counter()
+            rows = store.select(args.symbols, args.start, args.end)
+            n = len(range(store.rows)[rows]) if isinstance(rows, slice) else len(rows)
+            print(f"{n:,} rows selected in {(time.perf_counter() - start) * 1000:.2f}ms")
+            if args.csv:
+                write_csv(store, rows, args.csv)
+                print(f"Wrote {args.csv}")
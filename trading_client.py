@@ -1,91 +1,93 @@
+import argparse
 import socket
-import json
-import csv
-from datetime import datetime
+import time
 from collections import defaultdict
 import numpy as np
+from rolling_state import SymbolState
+from feature_store import client_features
+from feed_reader import FeedReader
+from executions import ExecutionTracker
+from latency import Stats
+from checkpoint import DEFAULT_CHECKPOINT_INTERVAL, CheckpointError, Checkpointer, restore
+from subscriptions import add_subscription_arguments, subscription_from_args
+from tick_store import tick_recorder
+from journal import (CONSOLE_MODES, DEFAULT_FLUSH_INTERVAL, DEFAULT_FLUSH_ROWS, DEFAULT_SUMMARY_EVERY, JOURNAL_FORMATS,
+                     ConsoleSummary, Journal, journal_paths)
+from order_book import BookBuilder
+from order_gateway import OrderGateway
+from portfolio import PortfolioLedger
+from wire_protocol import PROTOCOLS, send_hello
 
 class FinanceClient:
-    def __init__(self, host, port, window_size=5, initial_capital=100000, order_host="127.0.0.1", order_port=9999):
+    def __init__(self, host, port, window_size=5, initial_capital=100000, order_host="127.0.0.1", order_port=9999, protocol="json",
+                 book_weight=0, output_file='trading_with_sentiment.csv', journal_format="csv", console="full",
+                 summary_every=DEFAULT_SUMMARY_EVERY, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 ledger=None, stats=None, stats_file=None, checkpoint=None, resume=False, record_ticks=None,
+                 subscription=None):
         self.host = host
         self.port = port
         self.window_size = window_size
-        self.price_history = defaultdict(list)
-        self.quantity_history = defaultdict(list)
+        # Bounded per-symbol price/volume windows (see rolling_state.py)
+        self.symbol_state = defaultdict(lambda: SymbolState(self.window_size))
+        # Sentiment and model inputs, computed per symbol only when their inputs change (see feature_store.py)
+        self.feature_graph = client_features(book_weight)
+        self.symbol_features = defaultdict(self.feature_graph.values)
         self.initial_capital = initial_capital
-        self.available_capital = initial_capital
-        self.portfolio = defaultdict(int)  # Track owned shares
-        
-        # Separate volume histories for Buy and Sell orders
-        self.buy_volume_history = defaultdict(list)
-        self.sell_volume_history = defaultdict(list)
+        # Simulated cash, positions and NAV, revalued per tick in O(1) (see portfolio.py)
+        self.ledger = ledger if ledger is not None else PortfolioLedger(initial_capital)
+        self.books = BookBuilder()  # L2 books rebuilt from the feed's order events (see order_book.py)
+        self.book_weight = book_weight  # Sentiment points for a fully one-sided book; 0 leaves sentiment as before
         
+        self.protocol = protocol  # Wire format for both the feed and the order channel
+        self.subscription = subscription  # Symbols to ask the server for (see subscriptions.py); None for all
         self.order_host = order_host
         self.order_port = order_port
-        self.order_socket = None  # Will hold our persistent connection
-        self.connect_order_socket()
-
-    def connect_order_socket(self):
+        self.executions = ExecutionTracker(verbose=console == "full")  # What the order server actually filled
+        # Ledger rows go to a background writer (see journal.py); the console prints a block per tick only in "full" mode
+        self.output_file = output_file
+        self.journal_format = journal_format
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.journal = None
+        # Received ticks are also appended to a columnar tick store, by another background journal (see tick_store.py)
+        self.record_ticks = record_ticks
+        self.tick_recorder = None
+        self.console = console
+        self.summary = ConsoleSummary(summary_every)
+        # Per-stage latency histograms (see latency.py); None leaves every method unwrapped
+        self.stats = stats
+        self.stats_file = stats_file
+        # Orders are queued and written by the gateway's own thread (see order_gateway.py)
+        self.gateway = OrderGateway(order_host, order_port, protocol,
+                                    latency=stats.histogram("tick_to_order") if stats is not None else None)
+        self.gateway.start()
+        # Periodic snapshots of the strategy state (see checkpoint.py); resume starts from the last one
+        self.checkpoint = checkpoint
+        self.resume = resume
+        if stats is not None:
+            self.instrument(stats)  # First, so restored symbols are timed too
+        if resume:
+            self.restore_checkpoint()
+
+    def restore_checkpoint(self):
+        path = self.checkpoint.path
         try:
-            self.order_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.order_socket.connect((self.order_host, self.order_port))
-            print(f"Connected to order server at {self.order_host}:{self.order_port}")
-        except Exception as e:
-            print("Error connecting to order server:", e)
-            self.order_socket = None
-
-    def calculate_moving_average(self, data_list):
-        if len(data_list) >= self.window_size:
-            ma = sum(data_list[-self.window_size:]) / self.window_size
-            return round(ma, 2)
-        return None
-    
-    def analyze_sentiment(self, symbol, price, price_ma, volume_signal, news, buy_volume_ma, sell_volume_ma):
-        """Calculate market sentiment on a scale from -100 to 100"""
-        if price_ma is None:
-            return 0  # Neutral when not enough data
-
-        # Price momentum (percent above/below MA)
-        price_momentum = ((price / price_ma) - 1) * 100
-
-        # Volume factor (-25 to 25)
-        volume_factor = 0
-        if volume_signal == "HIGH":
-            volume_factor = 25
-        elif volume_signal == "LOW":
-            volume_factor = -25
-
-        # Check recent price trend (last 3 periods if available)
-        trend_factor = 0
-        if len(self.price_history[symbol]) >= 3:
-            recent_prices = self.price_history[symbol][-3:]
-            if all(recent_prices[i] < recent_prices[i + 1] for i in range(len(recent_prices) - 1)):
-                trend_factor = 25  # Consistently rising
-            elif all(recent_prices[i] > recent_prices[i + 1] for i in range(len(recent_prices) - 1)):
-                trend_factor = -25  # Consistently falling
-
-        # Map the news value (0, 50, 100) to a news factor between -25 and +25.
-        try:
-            news_value = int(news)
-        except ValueError:
-            news_value = 50  # Default to neutral if conversion fails
-        
-        news_value = 0 if news_value == 100 else news_value
-        news_value = 100 if news_value == 0 else news_value
-
-        news_factor = (news_value - 50) / 2
-
-        # Incorporate separate buy/sell volume analysis
-        if buy_volume_ma is not None and sell_volume_ma is not None and sell_volume_ma != 0:
-            ratio = buy_volume_ma / sell_volume_ma
-            # Map the ratio such that a ratio > 1 adds a positive adjustment and < 1 adds a negative one.
-            volume_ratio_factor = (ratio - 1) * 25  # Scaling factor can be adjusted as needed
-        else:
-            volume_ratio_factor = 0
-
-        # Combine factors (ensure overall sentiment is within [-100, 100])
-        sentiment = min(100, max(-100, price_momentum + volume_factor + trend_factor + news_factor + volume_ratio_factor))
-        return round(sentiment, 2)
+            start = time.perf_counter()
+            symbols = restore(self, path)
+        except FileNotFoundError:
+            print(f"No checkpoint at {path}, starting fresh")
+            self.resume = False
+            return
+        except CheckpointError as e:
+            print(f"Can't resume from checkpoint {e}, starting fresh")
+            self.resume = False
+            return
+        print(f"Resumed {symbols:,} symbols from {path} in {(time.perf_counter() - start) * 1000:.1f}ms "
+              f"(cash ${self.ledger.cash:,.2f})")
+
+    def analyze_sentiment(self, features):
+        """Market sentiment on a scale from -100 to 100 (see feature_store.sentiment)"""
+        return features.get("sentiment")
 
     def calculate_trade_quantity(self, symbol, price, sentiment, trade_signal):
         """Calculate how many shares to buy or sell based on sentiment"""
@@ -99,7 +101,7 @@ class FinanceClient:
         max_capital_percent = min(0.5, 0.1 + (0.4 * sentiment_weight))  # 10% to 50% of capital
 
         # Calculate maximum quantity based on available capital
-        max_investment = self.available_capital * max_capital_percent
+        max_investment = self.ledger.cash * max_capital_percent
         max_quantity = int(max_investment / price)
 
         # Scale quantity based on sentiment strength
@@ -111,173 +113,263 @@ class FinanceClient:
 
         # For sell orders, can't sell more than we own
         if trade_signal == "SELL":
-            quantity = min(quantity, self.portfolio[symbol])
+            quantity = min(quantity, self.ledger.position(symbol))
         
-        if trade_signal == "BUY" and self.available_capital < price * quantity:
+        if trade_signal == "BUY" and self.ledger.cash < price * quantity:
             quantity = max(quantity, 10000)
 
         return quantity
 
-    def analyze_volume(self, quantity, avg_quantity):
-        if avg_quantity is None:
-            return "NORMAL"
-        if quantity > (avg_quantity * 1.5):
-            return "HIGH"
-        elif quantity < (avg_quantity * 0.5):
-            return "LOW"
-        return "NORMAL"
-
-    def send_order(self, order_msg):
-        """Send an order message using a persistent socket connection."""
-        if self.order_socket is None:
-            self.connect_order_socket()
-        try:
-            self.order_socket.send((json.dumps(order_msg) + "\n").encode("utf-8"))
-            print("Order sent:", order_msg)
-        except Exception as e:
-            print("Error sending order, attempting to reconnect:", e)
-            self.order_socket.close()
-            self.order_socket = None
-            self.connect_order_socket()
-
+    def send_order(self, order_msg, server_time=None):
+        """Hand the order to the gateway; never waits on the order connection."""
+        order_id = self.gateway.submit(order_msg, server_time)
+        if order_id is None:
+            print("Order queue full, order dropped:", order_msg)
+        elif self.console == "full":
+            print("Order sent:", dict(order_msg, OrderID=order_id))
+        self.executions.apply_all(self.gateway.reports())
+
+    def instrument(self, stats):
+        """Time each stage of the strategy into stats."""
+        stats.instrument(self, "process_message", "tick")
+        timed_state = stats.timed_subclass(SymbolState, "update", "history_update")  # This client's symbols only
+        self.symbol_state.default_factory = lambda: timed_state(self.window_size)
+        stats.instrument(self.books, "update", "book_update")
+        stats.instrument(self, "analyze_sentiment", "sentiment")
+        stats.instrument(self, "calculate_trade_quantity", "trade_quantity")
+        stats.instrument(self, "send_order", "send_order")
+        stats.instrument(self, "report_tick", "console")
+
+    def instrument_run(self, reader):
+        """Time the feed reads, feed parsing and journal writes of this run."""
+        stats = self.stats
+        stats.instrument(reader, "read_batch", "feed_read")  # Includes waiting for the next send
+        if reader.decoder is not None:
+            stats.instrument(reader.decoder, "decode", "feed_parse")
+        else:
+            stats.instrument(reader, "decode_lines", "feed_parse")
+        stats.instrument(self.journal, "record", "journal_record")
+
+    def report_stats(self):
+        """Print the latency histograms (and write them to stats_file) at shutdown."""
+        if self.stats is None:
+            return
+        print("Latency by stage (microseconds):")
+        print(self.stats.report())
+        if self.stats_file:
+            self.stats.dump(self.stats_file)
+            print(f"Stats saved to: {self.stats_file}")
+        self.stats.close()
+
+    def report_executions(self):
+        """Collect the last execution reports and summarize what was actually filled."""
+        self.gateway.close(timeout=5)
+        self.executions.apply_all(self.gateway.reports())
+        if self.console != "full":
+            print(self.summary_line())
+        print(f"Orders acknowledged: {self.executions.acked:,}, rejected: {self.executions.rejected:,}, "
+              f"fills: {self.executions.fills:,}")
+        ledger = self.ledger
+        total_portfolio_value = ledger.revalue()
+        print(f"Total Portfolio Value: ${total_portfolio_value:,.2f} (gross exposure ${ledger.gross_exposure:,.2f}, "
+              f"realized P/L ${ledger.realized:,.2f}, unrealized P/L ${ledger.unrealized():,.2f})")
+
+    def summary_line(self):
+        return self.summary.line(self.ledger.cash, self.ledger.nav(), self.ledger.profit_loss(),
+                                 self.executions.profit_loss())
+
+    def report_tick(self, symbol, price, price_ma, market_quantity, sentiment, trade_signal, trade_quantity):
+        """Console output for one tick, according to the console mode."""
+        if self.console != "full":
+            if self.summary.tick() and self.console == "summary":
+                print(self.summary_line())
+            return
+
+        # Total portfolio value and profit/loss are kept up to date by the ledger
+        ledger = self.ledger
+        total_portfolio_value = ledger.nav()
+        profit_loss = total_portfolio_value - self.initial_capital
+
+        # Print analysis along with portfolio performance
+        print("\n" + "=" * 70)
+        print(f"Stock: {symbol}")
+        print(f"Current Price: ${price:,.2f}")
+        print(f"Price MA ({self.window_size} periods): ${price_ma if price_ma is not None else 'Calculating...'}")
+        print(f"Market Volume: {market_quantity:,} shares")
+        print(f"Market Sentiment: {sentiment:+.2f}")
+        print(f"Trade Signal: {trade_signal}")
+        print(f"Trade Quantity: {trade_quantity:,} shares")
+        print(f"Portfolio for {symbol}: {ledger.position(symbol):,} shares")
+        print(f"Available Capital: ${ledger.cash:,.2f}")
+        print(f"Total Portfolio Value: ${total_portfolio_value:,.2f}")
+        print(f"Profit/Loss: ${profit_loss:,.2f}")
+        print(f"Executed Position for {symbol}: {self.executions.position(symbol):,} shares")
+        print(f"Executed Profit/Loss: ${self.executions.profit_loss():,.2f}")
+        print("=" * 70)
+
+    def process_message(self, message):
+        """Run the strategy on one feed message: update state, decide, record and send the trade."""
+        if self.tick_recorder is not None:
+            self.tick_recorder.record((time.time(), message))
+        symbol = message['Symbol']
+        price = float(message['Price'])
+        market_quantity = int(message['Quantity'])
+
+        # Update rolling price/volume windows (buy/sell volumes split by order side)
+        state = self.symbol_state[symbol]
+        state.update(price, market_quantity, message.get("Side", "B"))
+        self.books.update(message)
+
+        # Moving averages for price, overall quantity and buy/sell volumes feed the symbol's features
+        price_ma = state.prices.moving_average()
+        values = self.symbol_features[symbol]
+        values.update(price=price, quantity=market_quantity, price_ma=price_ma,
+                      quantity_ma=state.quantities.moving_average(), buy_volume_ma=state.buy_volumes.moving_average(),
+                      sell_volume_ma=state.sell_volumes.moving_average(), trend=state.trend(),
+                      news=message.get('News', '50'), book=self.books.features(symbol) if self.book_weight else None)
+
+        # Analyze market signals
+        volume_signal = values.get("volume_signal")
+
+        # Determine basic trading signal
+        trade_signal = 'WAIT'
+        if price_ma is not None:
+            if price > price_ma and volume_signal != 'LOW':
+                trade_signal = 'BUY'
+            elif price < price_ma and volume_signal != 'HIGH':
+                trade_signal = 'SELL'
+
+        # Calculate sentiment (from the buy and sell volume moving averages among the rest)
+        sentiment = self.analyze_sentiment(values)
+
+        # Calculate trade quantity
+        trade_quantity = self.calculate_trade_quantity(symbol, price, sentiment, trade_signal)
+
+        # Revalue this symbol's simulated and executed positions at the new price
+        ledger = self.ledger
+        ledger.mark(symbol, price)
+        self.executions.mark(symbol, price)
+
+        # Execute trade (simulate)
+        if trade_signal == "BUY" and trade_quantity > 0:
+            ledger.buy(symbol, trade_quantity, price)  # Only if the cash covers it
+        elif trade_signal == "SELL" and trade_quantity > 0:
+            ledger.sell(symbol, trade_quantity, price)
+
+        # Queue the ledger row; the journal thread writes it in a batch
+        self.journal.record((time.time(), symbol, price, price_ma, market_quantity, sentiment, trade_signal,
+                             trade_quantity, ledger.position(symbol), round(ledger.cash, 2)))
+
+        # Send order to order server if the signal is not WAIT
+        if trade_signal in ["BUY", "SELL"] and trade_quantity > 0:
+            order_msg = {
+                "Symbol": symbol,
+                "Exchange": "3",  # Adjust as necessary
+                "Quantity": str(trade_quantity),
+                "Side": "B" if trade_signal == "BUY" else "S",
+                "Price": str(price)
+            }
+            self.send_order(order_msg, message.get("ServerTime"))
+
+        self.report_tick(symbol, price, price_ma, market_quantity, sentiment, trade_signal, trade_quantity)
 
     def run(self):
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-        output_file = 'trading_with_sentiment.csv'
-        print(f"Data will be saved to: {output_file}")
-
-        with open(output_file, 'w', newline='') as csvfile:
-            fieldnames = ['Timestamp', 'Symbol', 'Price', 'PriceMA', 'Quantity',
-                          'Sentiment', 'TradeSignal', 'TradeQuantity', 'Portfolio', 'Capital']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
+        print(f"Data will be saved to: {', '.join(journal_paths(self.output_file, self.journal_format))}")
 
+        with Journal.open(self.output_file, self.journal_format, append=self.resume, flush_rows=self.flush_rows,
+                          flush_interval=self.flush_interval) as self.journal, \
+                tick_recorder(self.record_ticks, flush_rows=self.flush_rows,
+                              flush_interval=self.flush_interval) as self.tick_recorder:
             try:
                 sock.connect((self.host, self.port))
+                options = self.subscription.hello_options() if self.subscription is not None else {}
+                if self.stats is not None:
+                    options["Stamps"] = True  # Clock records for tick-to-order latency
+                send_hello(sock, self.protocol, **options)
                 print(f"Connected to {self.host}:{self.port}")
 
-                while True:
-                    data = sock.recv(1024).decode()
-                    if not data:
-                        print("Server closed the connection")
-                        break
-
+                # Newline-framed reader: every complete message in each read is processed
+                reader = FeedReader(sock, protocol=self.protocol, stamps=self.stats is not None)
+                if self.stats is not None:
+                    self.instrument_run(reader)
+                checkpoint = self.checkpoint
+                for message in reader:
                     try:
-                        message = json.loads(data)
-                        symbol = message['Symbol']
-                        price = float(message['Price'])
-                        market_quantity = int(message['Quantity'])
-                        
-                        # Update histories
-                        self.price_history[symbol].append(price)
-                        self.quantity_history[symbol].append(market_quantity)
-                        
-                        # Update separate volume histories based on order side
-                        side = message.get("Side", "B")
-                        if side == "B":
-                            self.buy_volume_history[symbol].append(market_quantity)
-                        elif side == "S":
-                            self.sell_volume_history[symbol].append(market_quantity)
-
-                        # Calculate Moving Average for price and overall quantity
-                        price_ma = self.calculate_moving_average(self.price_history[symbol])
-                        quantity_ma = self.calculate_moving_average(self.quantity_history[symbol])
-                        
-                        # Calculate Moving Averages for buy and sell volumes
-                        buy_volume_ma = self.calculate_moving_average(self.buy_volume_history[symbol])
-                        sell_volume_ma = self.calculate_moving_average(self.sell_volume_history[symbol])
-
-                        # Analyze market signals
-                        volume_signal = self.analyze_volume(market_quantity, quantity_ma)
-
-                        # Determine basic trading signal
-                        trade_signal = 'WAIT'
-                        if price_ma is not None:
-                            if price > price_ma and volume_signal != 'LOW':
-                                trade_signal = 'BUY'
-                            elif price < price_ma and volume_signal != 'HIGH':
-                                trade_signal = 'SELL'
-
-                        # Calculate sentiment (pass in the buy and sell volume moving averages)
-                        news = message.get('News', '50')
-                        sentiment = self.analyze_sentiment(symbol, price, price_ma, volume_signal, news, buy_volume_ma, sell_volume_ma)
-
-                        # Calculate trade quantity
-                        trade_quantity = self.calculate_trade_quantity(symbol, price, sentiment, trade_signal)
-
-                        # Execute trade (simulate)
-                        if trade_signal == "BUY" and trade_quantity > 0:
-                            cost = price * trade_quantity
-                            if cost <= self.available_capital:
-                                self.portfolio[symbol] += trade_quantity
-                                self.available_capital -= cost
-                        elif trade_signal == "SELL" and trade_quantity > 0:
-                            self.portfolio[symbol] -= trade_quantity
-                            self.available_capital += price * trade_quantity
-
-                        # Create row for CSV
-                        row = {
-                            'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            'Symbol': symbol,
-                            'Price': price,
-                            'PriceMA': price_ma if price_ma is not None else 'Calculating...',
-                            'Quantity': market_quantity,
-                            'Sentiment': sentiment,
-                            'TradeSignal': trade_signal,
-                            'TradeQuantity': trade_quantity,
-                            'Portfolio': self.portfolio[symbol],
-                            'Capital': round(self.available_capital, 2)
-                        }
-                        # Save to CSV
-                        writer.writerow(row)
-                        csvfile.flush()
-
-                        # Send order to order server if the signal is not WAIT
-                        if trade_signal in ["BUY", "SELL"] and trade_quantity > 0:
-                            order_msg = {
-                                "Symbol": symbol,
-                                "Exchange": "3",  # Adjust as necessary
-                                "Quantity": str(trade_quantity),
-                                "Side": "B" if trade_signal == "BUY" else "S",
-                                "Price": str(price)
-                            }
-                            self.send_order(order_msg)
-
-                        # Calculate total portfolio value and profit/loss
-                        total_portfolio_value = self.available_capital
-                        for sym, shares in self.portfolio.items():
-                            if self.price_history[sym]:
-                                total_portfolio_value += shares * self.price_history[sym][-1]
-                        profit_loss = total_portfolio_value - self.initial_capital
-
-                        # Print analysis along with portfolio performance
-                        print("\n" + "=" * 70)
-                        print(f"Stock: {symbol}")
-                        print(f"Current Price: ${price:,.2f}")
-                        print(f"Price MA ({self.window_size} periods): ${price_ma if price_ma is not None else 'Calculating...'}")
-                        print(f"Market Volume: {market_quantity:,} shares")
-                        print(f"Market Sentiment: {sentiment:+.2f}")
-                        print(f"Trade Signal: {trade_signal}")
-                        print(f"Trade Quantity: {trade_quantity:,} shares")
-                        print(f"Portfolio for {symbol}: {self.portfolio[symbol]:,} shares")
-                        print(f"Available Capital: ${self.available_capital:,.2f}")
-                        print(f"Total Portfolio Value: ${total_portfolio_value:,.2f}")
-                        print(f"Profit/Loss: ${profit_loss:,.2f}")
-                        print("=" * 70)
-
-                    except json.JSONDecodeError:
-                        print("Invalid JSON:", data)
+                        self.process_message(message)
                     except Exception as e:
                         print(f"Processing error: {e}")
+                    if checkpoint is not None and checkpoint.due():
+                        checkpoint.save(self)
+
+                print("Server closed the connection")
+                self.report_executions()
 
             except Exception as e:
                 print(f"Connection error: {e}")
             finally:
                 sock.close()
                 print("Connection closed")
+                self.close_checkpoint()
+                self.report_stats()
+
+    def close_checkpoint(self):
+        """Write a final snapshot and stop the checkpoint writer."""
+        if self.checkpoint is None:
+            return
+        self.checkpoint.close(self)
+        print(f"Checkpoint saved to {self.checkpoint.path} ({self.checkpoint.saved:,} snapshots, "
+              f"{self.checkpoint.skipped:,} skipped, last packed in {self.checkpoint.pack_seconds * 1000:.1f}ms)")
 
 
 if __name__ == "__main__":
-    client = FinanceClient("127.0.0.1", 9995, window_size=5, initial_capital=1000000)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1", help="Server host address")
+    parser.add_argument("--csv-port", type=int, default=9995, help="Port for CSV streaming")
+    parser.add_argument("--order-port", type=int, default=9999, help="Port for sending orders")
+    parser.add_argument("--protocol", choices=PROTOCOLS, default="json", help="Wire format for the feed and orders")
+    parser.add_argument("--book-weight", type=float, default=0,
+                        help="Sentiment points added for a fully bid-heavy order book (subtracted when ask-heavy)")
+    parser.add_argument("--output", default='trading_with_sentiment.csv', help="Ledger file")
+    parser.add_argument("--journal-format", choices=JOURNAL_FORMATS, default="csv",
+                        help="Write the ledger as CSV, as a compact columnar file (<output>.cols) or both")
+    parser.add_argument("--flush-rows", type=int, default=DEFAULT_FLUSH_ROWS,
+                        help="Write the ledger once this many rows are queued")
+    parser.add_argument("--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL,
+                        help="...or after this many seconds, whichever comes first")
+    parser.add_argument("--console", choices=CONSOLE_MODES, default="full",
+                        help="full: a block per tick; summary: one line every --summary-every ticks; quiet: final summary only")
+    parser.add_argument("--summary-every", type=int, default=DEFAULT_SUMMARY_EVERY)
+    parser.add_argument("--stats", action="store_true",
+                        help="Time each stage and the server-to-order latency; print the histograms at shutdown")
+    parser.add_argument("--stats-port", type=int, help="Serve live stats as JSON on this local port (implies --stats)")
+    parser.add_argument("--stats-file", help="Also write the final stats to this JSON file (implies --stats)")
+    parser.add_argument("--checkpoint", help="Snapshot the strategy state to this file periodically and at exit")
+    parser.add_argument("--checkpoint-interval", type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help="Seconds between snapshots")
+    parser.add_argument("--resume", action="store_true",
+                        help="Start from the --checkpoint file and append to the ledger instead of starting over")
+    parser.add_argument("--record-ticks", metavar="DIR",
+                        help="Append every received tick to this tick store directory (see tick_store.py)")
+    add_subscription_arguments(parser)
+    args = parser.parse_args()
+    subscription = subscription_from_args(parser, args)
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint")
+
+    checkpoint = Checkpointer(args.checkpoint, args.checkpoint_interval) if args.checkpoint else None
+    stats = None
+    if args.stats or args.stats_port or args.stats_file:
+        stats = Stats()
+        if args.stats_port:
+            stats.serve(args.stats_port)
+
+    client = FinanceClient(args.host, args.csv_port, window_size=5, initial_capital=1000000,
+                           order_host=args.host, order_port=args.order_port, protocol=args.protocol,
+                           book_weight=args.book_weight, output_file=args.output, journal_format=args.journal_format,
+                           console=args.console, summary_every=args.summary_every, flush_rows=args.flush_rows,
+                           flush_interval=args.flush_interval, stats=stats, stats_file=args.stats_file,
+                           checkpoint=checkpoint, resume=args.resume, record_ticks=args.record_ticks,
+                           subscription=subscription)
     client.run()
@@ -1,62 +1,188 @@
 # train.py
+"""
+Train the XGBoost model on historical feed CSVs.
+
+The features are exactly the vector trade_xgboost.FinanceClient scores
+live (price, price MA, volume signal, news, buy/sell volume MAs, plus the
+order book inputs with --book-features). They are computed with the
+backtester's vectorized per-symbol rolling windows (backtest.compute_indicators),
+so building them is a handful of NumPy passes rather than a replay.
+
+Each tick is labelled with its symbol's forward return: 1 if the price
+--horizon ticks later (same symbol) is more than --min-return above the
+current price, else 0. The last --horizon ticks of each symbol have no
+label and are left out.
+
+Training uses the hist tree method on all cores, holds out the most recent
+--valid-fraction of the ticks, and stops once the validation logloss hasn't
+improved for --early-stopping rounds. The saved model keeps only the trees
+up to the best round. It is pickled to --output and also exported to
+--export (xgb_model.json), which trade_xgboost.py scores with NumPy alone
+(see tree_model.py).
+
+--external-memory builds the training matrix one file at a time through an
+XGBoost DataIter and keeps it in an on-disk cache, so the history can be
+larger than RAM as long as each file fits. The last file is then the
+validation set, and each file is treated as its own session (rolling
+windows and labels don't carry across files).
+
+    python train_xgboost.py --files finance/finance.csv
+    python synthetic_feed.py --rows 5000000 --output synthetic.csv
+    python train_xgboost.py --files day1.csv day2.csv day3.csv --external-memory
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
 import numpy as np
 import xgboost as xgb
 import joblib
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
-
-
-# Train based on synthetic data
-
-N = 1000
-
-# Generate synthetic features:
-# Feature 1: price (random between 10 and 500)
-prices = np.random.uniform(10, 500, size=N)
-# Feature 2: price_ma (price moving average, here taken as price plus small noise)
-price_ma = prices + np.random.normal(0, 5, size=N)
-# Feature 3: volume_signal factor (-25 for LOW, 0 for NORMAL, 25 for HIGH)
-volume_signal = np.random.choice([-25, 0, 25], size=N)
-# Feature 4: news value (randomly chosen from 0, 50, or 100)
-news = np.random.choice([0, 50, 100], size=N)
-# Feature 5: buy_volume_ma (a random number between 100 and 1000)
-buy_volume_ma = np.random.uniform(100, 1000, size=N)
-# Feature 6: sell_volume_ma (a random number between 100 and 1000)
-sell_volume_ma = np.random.uniform(100, 1000, size=N)
-
-# Stack features into one matrix (each row is a sample)
-X = np.column_stack((prices, price_ma, volume_signal, news, buy_volume_ma, sell_volume_ma))
-
-# Generate a synthetic target:
-# For example, assume that when price > price_ma, the market is bullish (target 1), otherwise bearish (target 0)
-y = (prices > price_ma).astype(float)
-
-# Add some noise by flipping 10% of the targets randomly
-flip = np.random.rand(N) < 0.1
-y[flip] = 1 - y[flip]
-
-# Split the data into training and testing sets
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# Create DMatrix objects for XGBoost
-dtrain = xgb.DMatrix(X_train, label=y_train)
-dtest = xgb.DMatrix(X_test, label=y_test)
-
-# Set XGBoost parameters for binary classification
-params = {
-    'objective': 'binary:logistic',
-    'eval_metric': 'logloss',
-    'seed': 42
-}
-
-# Train the model for a fixed number of rounds
-num_boost_round = 50
-model = xgb.train(params, dtrain, num_boost_round=num_boost_round)
-
-y_pred_prob = model.predict(dtest)
-y_pred = (y_pred_prob > 0.5).astype(int)
-acc = accuracy_score(y_test, y_pred)
-print(f"Test Accuracy: {acc:.2f}")
-
-joblib.dump(model, "xgb_model.pkl")
-print("Model saved to xgb_model.pkl")
+from backtest import compute_indicators, load_feed, model_features
+from tree_model import export_model
+
+
+def forward_labels(feed, horizon=5, min_return=0.0):
+    """
+    Per tick: 1.0 if the same symbol's price `horizon` ticks later is more than
+    min_return above this tick's price, 0.0 if not, NaN when there is no such tick.
+    """
+    codes = feed['symbol']
+    price = feed['price']
+    n = len(codes)
+    order = np.argsort(codes, kind='stable')
+    s_codes = codes[order]
+    s_price = price[order]
+    labels = np.full(n, np.nan)
+    ahead = np.arange(n - horizon) if n > horizon else np.arange(0)
+    has_future = s_codes[ahead] == s_codes[ahead + horizon]
+    now = ahead[has_future]
+    forward_return = s_price[now + horizon] / s_price[now] - 1
+    s_labels = np.full(n, np.nan)
+    s_labels[now] = (forward_return > min_return).astype(np.float64)
+    labels[order] = s_labels
+    return labels
+
+
+def dataset(files, window_size=5, horizon=5, min_return=0.0, with_book=False):
+    """Feature matrix (float32, as the client scores it) and labels for the labelled ticks of the files."""
+    feed = load_feed(files)
+    indicators = compute_indicators(feed, window_size, with_book=with_book)
+    features = model_features(feed, indicators).astype(np.float32)
+    labels = forward_labels(feed, horizon, min_return)
+    labelled = ~np.isnan(labels)
+    return features[labelled], labels[labelled]
+
+
+class FileIterator(xgb.DataIter):
+    """Feeds XGBoost one file's features at a time, for an external-memory DMatrix."""
+
+    def __init__(self, files, cache_prefix, **dataset_options):
+        self.files = files
+        self.dataset_options = dataset_options
+        self._next = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._next == len(self.files):
+            return False
+        features, labels = dataset([self.files[self._next]], **self.dataset_options)
+        input_data(data=features, label=labels)
+        self._next += 1
+        return True
+
+    def reset(self):
+        self._next = 0
+
+
+def train(dtrain, dvalid, rounds=500, early_stopping=20, max_depth=6, learning_rate=0.1, max_bin=256, threads=0,
+          seed=42):
+    params = {
+        'objective': 'binary:logistic',
+        'eval_metric': 'logloss',
+        'tree_method': 'hist',
+        'max_depth': max_depth,
+        'learning_rate': learning_rate,
+        'max_bin': max_bin,
+        'nthread': threads or os.cpu_count() or 1,
+        'seed': seed,
+    }
+    model = xgb.train(params, dtrain, num_boost_round=rounds, evals=[(dtrain, 'train'), (dvalid, 'valid')],
+                      early_stopping_rounds=early_stopping, verbose_eval=50)
+    # Drop the rounds trained after the best one; the client scores with every tree in the model
+    return model[:model.best_iteration + 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the trading model on historical feed CSVs")
+    parser.add_argument("--files", nargs='+', default=["finance/finance.csv"], help="Feed CSV file(s) or tick store directories, oldest first")
+    parser.add_argument("--output", default="xgb_model.pkl", help="Where to save the model")
+    parser.add_argument("--export", default="xgb_model.json",
+                        help="Also save the model in XGBoost's JSON/UBJ format for tree_model.py ('' to skip)")
+    parser.add_argument("--window-size", type=int, default=5, help="Moving average window, as in the clients")
+    parser.add_argument("--horizon", type=int, default=5, help="Ticks of the same symbol to look ahead for the label")
+    parser.add_argument("--min-return", type=float, default=0.0, help="Forward return a tick needs to be labelled 1")
+    parser.add_argument("--book-features", action="store_true",
+                        help="Also train on the order book inputs (the client uses them when the model has them)")
+    parser.add_argument("--valid-fraction", type=float, default=0.2, help="Most recent share of ticks held out")
+    parser.add_argument("--rounds", type=int, default=500, help="Most boosting rounds")
+    parser.add_argument("--early-stopping", type=int, default=20, help="Rounds without validation improvement to stop")
+    parser.add_argument("--max-depth", type=int, default=6)
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--max-bin", type=int, default=256, help="Histogram bins per feature")
+    parser.add_argument("--threads", type=int, default=0, help="Training threads (0 for every core)")
+    parser.add_argument("--external-memory", action="store_true",
+                        help="Stream the training files through an on-disk cache; the last file validates")
+    parser.add_argument("--cache-dir", help="Directory for the external-memory cache (default: a temporary one)")
+    args = parser.parse_args()
+
+    options = dict(window_size=args.window_size, horizon=args.horizon, min_return=args.min_return,
+                   with_book=args.book_features)
+    start = time.perf_counter()
+    if args.external_memory:
+        if len(args.files) < 2:
+            parser.error("--external-memory holds out the last file for validation, so it needs at least two files")
+        cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="xgb-cache-")
+        os.makedirs(cache_dir, exist_ok=True)
+        iterator = FileIterator(args.files[:-1], os.path.join(cache_dir, "train"), **options)
+        if hasattr(xgb, "ExtMemQuantileDMatrix"):
+            dtrain = xgb.ExtMemQuantileDMatrix(iterator, max_bin=args.max_bin)
+        else:
+            dtrain = xgb.DMatrix(iterator)
+        X_valid, y_valid = dataset(args.files[-1:], **options)
+        dvalid = xgb.DMatrix(X_valid, label=y_valid)
+        n_train = dtrain.num_row()
+        print(f"External-memory cache in {cache_dir}")
+    else:
+        X, y = dataset(args.files, **options)
+        # Time-ordered split: validate on the most recent ticks, never on ones older than the training data
+        split = int(len(y) * (1 - args.valid_fraction))
+        if split == 0 or split == len(y):
+            parser.error(f"{len(y):,} labelled ticks can't be split with --valid-fraction {args.valid_fraction}")
+        dtrain = xgb.QuantileDMatrix(X[:split], label=y[:split], max_bin=args.max_bin)
+        dvalid = xgb.QuantileDMatrix(X[split:], label=y[split:], ref=dtrain)
+        y_valid = y[split:]
+        n_train = split
+    prepared = time.perf_counter()
+    print(f"Features for {n_train:,} training and {len(y_valid):,} validation ticks "
+          f"({dtrain.num_col()} features) in {prepared - start:.2f}s; {y_valid.mean():.1%} of validation labels are 1")
+
+    model = train(dtrain, dvalid, args.rounds, args.early_stopping, args.max_depth, args.learning_rate,
+                  args.max_bin, args.threads)
+    trained = time.perf_counter()
+
+    y_pred = (model.predict(dvalid) > 0.5).astype(int)
+    acc = (y_pred == y_valid).mean()
+    print(f"Trained {model.num_boosted_rounds()} rounds in {trained - prepared:.2f}s")
+    print(f"Validation Accuracy: {acc:.2f}")
+
+    if args.external_memory and not args.cache_dir:
+        del dtrain  # XGBoost removes its cache pages when the matrix is freed
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    joblib.dump(model, args.output)
+    print(f"Model saved to {args.output}")
+    if args.export:
+        # The clients load the exported model first (see tree_model.py)
+        export_model(model, args.export)
+        print(f"Model exported to {args.export}")
@@ -0,0 +1,390 @@
+"""
+XGBoost tree models scored with NumPy alone.
+
+The model is exported once to XGBoost's stable JSON or UBJSON format
+(Booster.save_model), which doesn't depend on the xgboost version the way
+the pickle does. TreeModel reads that file without importing xgboost and
+flattens every tree into contiguous node arrays (feature, threshold,
+left/right child, default direction, leaf value):
+
+- Batches walk all rows through all trees at once, one array step per tree
+  level.
+- Single rows go through a function generated from the same arrays, with
+  one nested if/else per tree, so a prediction is a few hundred float
+  comparisons and no array set-up.
+
+Predictions follow XGBoost's CPU predictor: features as float32, "x <
+threshold" goes left, a missing (NaN) value takes the default direction,
+leaves are added to the base margin one tree at a time in float32, and
+logistic objectives apply a float32 sigmoid. The probabilities match
+Booster.inplace_predict bit for bit (check with `python tree_model.py
+check`).
+
+    python tree_model.py export xgb_model.pkl --output xgb_model.json   # needs xgboost
+    python tree_model.py check xgb_model.json --against xgb_model.pkl
+"""
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import struct
+import time
+import numpy as np
+
+MODEL_SUFFIXES = (".json", ".ubj")
+LOGISTIC_OBJECTIVES = ("binary:logistic", "reg:logistic")
+MARGIN_OBJECTIVES = ("binary:logitraw", "reg:squarederror", "reg:linear")
+BATCH_ROWS = 65536  # Rows walked through the trees at once; bounds the (rows x trees) node arrays
+ROW_BY_ROW = 16  # Batches up to this size are cheaper through predict_row than through the array walk
+
+def _libm_expf():
+    try:
+        expf = ctypes.CDLL(ctypes.util.find_library("m")).expf
+    except (OSError, AttributeError, TypeError):
+        return None
+    expf.restype = ctypes.c_float
+    expf.argtypes = [ctypes.c_float]
+    return expf
+
+
+_expf = _libm_expf()  # The C library's expf, which XGBoost's sigmoid calls
+
+
+def expf(values):
+    """
+    float32 exp of a float32 array, rounded the way the C library's expf
+    rounds it. That is the correctly rounded result except, rarely, when exp
+    lies within a hair of halfway between two float32 values; those few are
+    recomputed with expf itself. Without a C math library (e.g. on Windows)
+    the correctly rounded value is used throughout.
+    """
+    exact = np.exp(values.astype(np.float64))
+    result = exact.astype(np.float32)
+    if _expf is not None:
+        with np.errstate(invalid="ignore"):
+            halfway = np.abs(np.abs(exact - result) / np.spacing(result) - 0.5) < 0.005
+        for i in np.nonzero(halfway)[0].tolist():
+            result[i] = _expf(float(values[i]))
+    return result
+
+
+_UBJ_SCALARS = {b"i": ">b", b"U": ">B", b"I": ">h", b"l": ">i", b"L": ">q", b"d": ">f", b"D": ">d"}
+
+
+def read_ubjson(data):
+    """Decode the UBJSON subset XGBoost writes. Typed numeric arrays come back as NumPy arrays."""
+    view = memoryview(data)
+
+    def marker(pos):
+        return bytes(view[pos:pos + 1]), pos + 1
+
+    def scalar(kind, pos):
+        fmt = _UBJ_SCALARS[kind]
+        size = struct.calcsize(fmt)
+        return struct.unpack_from(fmt, view, pos)[0], pos + size
+
+    def length(pos):
+        kind, pos = marker(pos)
+        return scalar(kind, pos)
+
+    def string(pos):
+        n, pos = length(pos)
+        return bytes(view[pos:pos + n]).decode("utf-8"), pos + n
+
+    def value(kind, pos):
+        if kind in _UBJ_SCALARS:
+            return scalar(kind, pos)
+        if kind == b"S":
+            return string(pos)
+        if kind == b"T":
+            return True, pos
+        if kind == b"F":
+            return False, pos
+        if kind == b"Z":
+            return None, pos
+        if kind == b"C":
+            return bytes(view[pos:pos + 1]).decode("ascii"), pos + 1
+        if kind == b"{":
+            obj = {}
+            while True:
+                if bytes(view[pos:pos + 1]) == b"}":
+                    return obj, pos + 1
+                key, pos = string(pos)
+                kind, pos = marker(pos)
+                obj[key], pos = value(kind, pos)
+        if kind == b"[":
+            item_kind = None
+            count = None
+            if bytes(view[pos:pos + 1]) == b"$":
+                item_kind, pos = marker(pos + 1)
+            if bytes(view[pos:pos + 1]) == b"#":
+                count, pos = length(pos + 1)
+            if item_kind in _UBJ_SCALARS and count is not None:
+                dtype = np.dtype(_UBJ_SCALARS[item_kind])
+                items = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+                return items.astype(dtype.newbyteorder("=")), pos + count * dtype.itemsize
+            items = []
+            while count is None or len(items) < count:
+                if count is None and bytes(view[pos:pos + 1]) == b"]":
+                    return items, pos + 1
+                kind = item_kind
+                if kind is None:
+                    kind, pos = marker(pos)
+                item, pos = value(kind, pos)
+                items.append(item)
+            return items, pos
+        raise ValueError(f"Unsupported UBJSON marker {kind!r} at byte {pos - 1}")
+
+    kind, pos = marker(0)
+    document, _ = value(kind, pos)
+    return document
+
+
+def _parse_float(text):
+    """XGBoost writes base_score as "5E-1" or, since 2.1, as a one-element list "[5E-1]"."""
+    if isinstance(text, str):
+        text = text.strip("[]").split(",")[0]
+    return float(text)
+
+
+class TreeModel:
+    def __init__(self, document):
+        learner = document["learner"]
+        booster = learner["gradient_booster"]
+        if booster.get("name") != "gbtree":
+            raise ValueError(f"Only gbtree models are supported, not {booster.get('name')}")
+        params = learner["learner_model_param"]
+        if int(params.get("num_class", 0)) > 1 or int(params.get("num_target", 1)) > 1:
+            raise ValueError("Only single-output models are supported")
+        self.objective = learner["objective"]["name"]
+        if self.objective not in LOGISTIC_OBJECTIVES + MARGIN_OBJECTIVES:
+            raise ValueError(f"Unsupported objective {self.objective}")
+        self.n_features = int(params["num_feature"])
+
+        one = np.float32(1)
+        base_score = np.float32(_parse_float(params["base_score"]))
+        if self.objective in LOGISTIC_OBJECTIVES:
+            self.base_margin = -np.log(one / base_score - one)  # XGBoost's ProbToMargin, in float32
+        else:
+            self.base_margin = base_score
+
+        trees = booster["model"]["trees"]
+        for tree in trees:
+            if len(tree.get("categories_nodes", [])):
+                raise ValueError("Categorical splits are not supported")
+        sizes = [len(tree["left_children"]) for tree in trees]
+        self.roots = np.cumsum([0] + sizes[:-1]).astype(np.int64)
+        self.feature = np.zeros(sum(sizes), dtype=np.int64)
+        self.threshold = np.zeros(sum(sizes), dtype=np.float32)
+        self.left = np.zeros(sum(sizes), dtype=np.int64)
+        self.right = np.zeros(sum(sizes), dtype=np.int64)
+        self.default_left = np.zeros(sum(sizes), dtype=bool)
+        self.value = np.zeros(sum(sizes), dtype=np.float32)
+        depth = 0
+        for root, size, tree in zip(self.roots.tolist(), sizes, trees):
+            nodes = slice(root, root + size)
+            left = np.asarray(tree["left_children"], dtype=np.int64)
+            right = np.asarray(tree["right_children"], dtype=np.int64)
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            leaf = left == -1
+            own = np.arange(root, root + size)
+            # A leaf points at itself, so extra traversal steps leave a finished row where it is
+            self.left[nodes] = np.where(leaf, own, left + root)
+            self.right[nodes] = np.where(leaf, own, right + root)
+            self.feature[nodes] = np.where(leaf, 0, np.asarray(tree["split_indices"], dtype=np.int64))
+            self.threshold[nodes] = np.where(leaf, 0, conditions)
+            self.value[nodes] = np.where(leaf, conditions, 0)  # A leaf's split_condition is its value
+            self.default_left[nodes] = np.asarray(tree["default_left"], dtype=bool)
+            depth = max(depth, _depth(left.tolist(), right.tolist()))
+        self.depth = depth
+        self.predict_row = self._compile()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        document = read_ubjson(data) if path.endswith(".ubj") else json.loads(data)
+        return cls(document)
+
+    def num_features(self):
+        return self.n_features
+
+    def num_trees(self):
+        return len(self.roots)
+
+    def _leaves(self, X):
+        """Leaf node of every (row, tree)."""
+        nodes = np.repeat(self.roots[None, :], len(X), axis=0)
+        rows = np.arange(len(X))[:, None]
+        has_missing = bool(np.isnan(X).any())
+        for _ in range(self.depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = x < self.threshold[nodes]
+            if has_missing:
+                go_left = np.where(np.isnan(x), self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_margin(self, X):
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        margins = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), BATCH_ROWS):
+            chunk = X[start:start + BATCH_ROWS]
+            terms = np.empty((len(chunk), self.num_trees() + 1), dtype=np.float32)
+            terms[:, 0] = self.base_margin
+            terms[:, 1:] = self.value[self._leaves(chunk)]
+            # cumsum adds left to right, tree by tree, like the predictor (sum() would add pairwise)
+            margins[start:start + len(chunk)] = np.cumsum(terms, axis=1, dtype=np.float32)[:, -1]
+        return margins
+
+    def transform(self, margins):
+        if self.objective in LOGISTIC_OBJECTIVES:
+            one = np.float32(1)
+            return one / (one + expf(-margins))
+        return margins
+
+    def transform_one(self, margin):
+        if self.objective in LOGISTIC_OBJECTIVES:
+            one = np.float32(1)
+            exp = np.float32(_expf(-margin)) if _expf is not None else expf(np.array([-margin], np.float32))[0]
+            return float(one / (one + exp))
+        return float(margin)
+
+    def predict(self, X):
+        return self.transform(self.predict_margin(X))
+
+    def inplace_predict(self, data, validate_features=False):
+        """Booster.inplace_predict's signature, so ModelScorer and the backtester can use either model."""
+        if len(data) <= ROW_BY_ROW:
+            rows = np.asarray(data, dtype=np.float32).tolist()
+            return np.array([self.predict_row(row) for row in rows], dtype=np.float32)
+        return self.predict(data)
+
+    def _compile(self):
+        """
+        Build predict_row(features): one nested if/else per tree, generated
+        from the node arrays. The features must already be float32 values
+        (e.g. row.tolist() of a float32 array), as XGBoost compares them.
+        """
+        feature = self.feature.tolist()
+        threshold = [float(t) for t in self.threshold.tolist()]
+        left, right = self.left.tolist(), self.right.tolist()
+        default_left = self.default_left.tolist()
+        value = self.value.tolist()
+        lines = ["def predict_row(features):",
+                 f"    {', '.join(f'x{i}' for i in range(self.n_features))}, = features"]
+
+        def emit(node, indent, target):
+            pad = "    " * indent
+            if left[node] == node:
+                lines.append(f"{pad}{target} = {value[node]!r}")
+                return
+            x, t = f"x{feature[node]}", repr(threshold[node])
+            # "not x >= t" is "x < t" that also sends NaN left
+            lines.append(f"{pad}if not {x} >= {t}:" if default_left[node] else f"{pad}if {x} < {t}:")
+            emit(left[node], indent + 1, target)
+            lines.append(f"{pad}else:")
+            emit(right[node], indent + 1, target)
+
+        for i, root in enumerate(self.roots.tolist()):
+            emit(root, 1, f"v{i}")
+        terms = ", ".join(["base"] + [f"v{i}" for i in range(self.num_trees())])
+        lines.append(f"    margin = cumsum(array(({terms},), float32))[-1]")
+        lines.append("    return transform(margin)")
+        namespace = {"cumsum": np.cumsum, "array": np.array, "float32": np.float32,
+                     "base": float(self.base_margin), "transform": self.transform_one}
+        exec(compile("\n".join(lines), f"<{self.num_trees()} trees>", "exec"), namespace)
+        return namespace["predict_row"]
+
+
+def _depth(left, right):
+    """Number of splits on the longest root-to-leaf path."""
+    depth = 0
+    stack = [(0, 0)]
+    while stack:
+        node, d = stack.pop()
+        if left[node] == -1:
+            depth = max(depth, d)
+        else:
+            stack.append((left[node], d + 1))
+            stack.append((right[node], d + 1))
+    return depth
+
+
+def load_model(path):
+    """A TreeModel for an exported .json/.ubj model, or the pickled xgboost Booster for anything else."""
+    if path.endswith(MODEL_SUFFIXES):
+        return TreeModel.load(path)
+    import joblib
+    return joblib.load(path)
+
+
+def default_model_path(directory="."):
+    """The exported model when there is one (no xgboost import), else the pickle."""
+    for name in ("xgb_model.json", "xgb_model.ubj"):
+        if os.path.exists(os.path.join(directory, name)):
+            return os.path.join(directory, name) if directory != "." else name
+    return os.path.join(directory, "xgb_model.pkl") if directory != "." else "xgb_model.pkl"
+
+
+def export_model(booster, path):
+    """Save a Booster in XGBoost's stable format; .json or .ubj picks the encoding."""
+    if not path.endswith(MODEL_SUFFIXES):
+        raise ValueError(f"Export to a {' or '.join(MODEL_SUFFIXES)} file")
+    booster.save_model(path)
+
+
+def check(path, against, rows=100000, seed=7):
+    """Compare TreeModel with xgboost's own predictions on random rows, and time both."""
+    booster = load_model(against)
+    model = TreeModel.load(path)
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(0, 1000, (rows, model.num_features())).astype(np.float32)
+    X[rng.random(X.shape) < 0.01] = np.nan  # Some missing values, to cover the default directions
+    X[:rows // 2, :2] = rng.uniform(10, 500, (rows // 2, 2))  # Prices in the range the client sees
+    expected = booster.inplace_predict(X, validate_features=False)
+    batch = model.predict(X)
+    single = np.array([model.predict_row(row) for row in X[:10000].tolist()], dtype=np.float32)
+    print(f"Batch: {np.count_nonzero(batch != expected):,} of {rows:,} probabilities differ from xgboost "
+          f"(max difference {np.max(np.abs(batch - expected)):.3g})")
+    print(f"Single row: {np.count_nonzero(single != expected[:len(single)]):,} of {len(single):,} differ")
+
+    clock = time.perf_counter
+    row = X[rows // 2 + 1]
+    row_list = row.tolist()
+    one = row[None, :]
+    for name, call, n in (("TreeModel.predict_row", lambda: model.predict_row(row_list), 20000),
+                          ("TreeModel.inplace_predict (1 row)", lambda: model.inplace_predict(one), 20000),
+                          ("Booster.inplace_predict (1 row)", lambda: booster.inplace_predict(one), 2000)):
+        start = clock()
+        for _ in range(n):
+            call()
+        print(f"{name}: {(clock() - start) / n * 1e6:.1f} us per row")
+    for name, call in (("TreeModel.predict", lambda: model.predict(X[:256])),
+                       ("Booster.inplace_predict", lambda: booster.inplace_predict(X[:256]))):
+        start = clock()
+        for _ in range(200):
+            call()
+        print(f"{name} (256 rows): {(clock() - start) / 200 / 256 * 1e6:.2f} us per row")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export an XGBoost model to JSON/UBJ, or check the NumPy evaluator")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Convert a pickled Booster to XGBoost's JSON or UBJ format")
+    export.add_argument("model", help="Pickled model, e.g. xgb_model.pkl")
+    export.add_argument("--output", default="xgb_model.json", help=".json or .ubj file to write")
+    checker = commands.add_parser("check", help="Compare the NumPy evaluator with xgboost and time both")
+    checker.add_argument("model", help="Exported .json or .ubj model")
+    checker.add_argument("--against", default="xgb_model.pkl", help="Model xgboost should load for the comparison")
+    checker.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_model(load_model(args.model), args.output)
+        model = TreeModel.load(args.output)
+        print(f"Exported {model.num_trees()} trees ({model.num_features()} features, depth {model.depth}) "
+              f"to {args.output}")
+    else:
+        check(args.model, args.against, args.rows)
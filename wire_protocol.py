@@ -0,0 +1,183 @@
+"""
+Optional fixed-layout binary records for the CSV stream and order ports.
+
+JSON lines stay the default. A client asks for binary by sending a hello line
+right after connecting:
+
+    {"Protocol": "binary"}\\n
+
+Every record is RECORD_SIZE bytes. Symbols are sent once as a SYMBOL record
+mapping a numeric id to the ticker, and every TICK/ORDER record after that
+refers to the symbol by id. Execution reports (ACK/FILL) use the same layout,
+with the order's status in place of the action.
+
+A client that sends "Stamps": true in its hello (either protocol) gets a
+clock record in front of every send: {"Clock": <ns>} as a JSON line, or a
+CLOCK record with the nanoseconds in the order id field. The time is the
+server's time.time_ns() just before the send. FeedReader strips them and
+tags the messages that follow with "ServerTime".
+"""
+import json
+import socket
+import struct
+import time
+
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_BINARY)
+
+# How long the server waits for a hello before assuming a plain JSON client
+HANDSHAKE_TIMEOUT = 0.2
+
+RECORD_SYMBOL = 1
+RECORD_TICK = 2
+RECORD_ORDER = 3
+RECORD_ACK = 4  # Execution reports sent back on the order port
+RECORD_FILL = 5
+RECORD_CLOCK = 6  # Server send time, for latency measurement
+REPORT_TYPES = {RECORD_ACK: "ACK", RECORD_FILL: "FILL"}
+
+# kind, symbol id, order id, quantity, price, side, action, exchange, news, timestamp
+RECORD = struct.Struct("<BIQIdccBBd")
+# kind, symbol id, symbol (NUL padded); same size as RECORD so framing is uniform
+SYMBOL = struct.Struct("<BI32s")
+SYMBOL_NAME_SIZE = 32  # UTF-8 bytes
+RECORD_SIZE = RECORD.size
+assert SYMBOL.size == RECORD_SIZE
+
+
+def send_hello(sock, protocol=PROTOCOL_JSON, **options):
+    """Announce the protocol (and any other connection options) to the server."""
+    hello = {"Protocol": protocol}
+    hello.update(options)
+    sock.sendall((json.dumps(hello) + "\n").encode("utf-8"))
+
+
+def read_hello(sock, timeout=HANDSHAKE_TIMEOUT):
+    """
+    Server side: wait up to `timeout` seconds for a hello line.
+    Returns the decoded hello dict, or None if the client sent nothing.
+    """
+    data = b""
+    sock.settimeout(timeout)
+    try:
+        while b"\n" not in data:
+            chunk = sock.recv(1)  # One byte at a time so nothing past the hello is consumed
+            if not chunk:
+                break
+            data += chunk
+    except socket.timeout:
+        pass
+    finally:
+        sock.settimeout(None)
+    return parse_hello(data)
+
+
+def parse_hello(data):
+    """Decode a hello line, or return None if it isn't one."""
+    try:
+        hello = json.loads(data.decode("utf-8"))
+    except ValueError:
+        return None
+    return hello if isinstance(hello, dict) and "Protocol" in hello else None
+
+
+def clock_record(protocol, ns=None):
+    """The clock record sent in front of a batch to clients that asked for stamps."""
+    if ns is None:
+        ns = time.time_ns()
+    if protocol == PROTOCOL_BINARY:
+        return RECORD.pack(RECORD_CLOCK, 0, ns, 0, 0.0, b"B", b"A", 0, 0, 0.0)
+    return b'{"Clock": %d}\n' % ns
+
+
+def _int_field(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class BinaryEncoder:
+    """Packs feed rows or orders into binary records, defining each symbol on first use."""
+
+    def __init__(self):
+        self.symbol_ids = {}
+
+    def define_symbol(self, symbol):
+        """Assign an id to a new symbol and return its SYMBOL record, or b"" if it is already defined."""
+        if symbol in self.symbol_ids:
+            return b""
+        name = symbol.encode("utf-8")
+        if len(name) > SYMBOL_NAME_SIZE:
+            # struct would silently cut it, and two long symbols could then decode to the same name
+            raise ValueError(f"Symbol {symbol!r} is longer than {SYMBOL_NAME_SIZE} bytes")
+        symbol_id = len(self.symbol_ids)
+        self.symbol_ids[symbol] = symbol_id
+        return SYMBOL.pack(RECORD_SYMBOL, symbol_id, name)
+
+    def encode(self, message, kind=RECORD_TICK, timestamp=None):
+        """Encode one feed row / order / report dict (string or typed values) into bytes."""
+        out = [self.define_symbol(message["Symbol"])]
+        symbol_id = self.symbol_ids[message["Symbol"]]
+        out.append(RECORD.pack(
+            kind,
+            symbol_id,
+            _int_field(message.get("OrderID")),
+            _int_field(message.get("Quantity")),
+            float(message["Price"]),
+            (message.get("Side") or "B").encode("ascii")[:1],
+            (message.get("Action") or message.get("Status") or "A").encode("ascii")[:1],
+            _int_field(message.get("Exchange")),
+            _int_field(message.get("News"), 50),
+            time.time() if timestamp is None else timestamp,
+        ))
+        return b"".join(out)
+
+
+class BinaryDecoder:
+    """Unpacks binary records back into message dicts with typed values."""
+
+    def __init__(self):
+        self.symbols = {}
+        self.server_time = None  # Nanoseconds from the last CLOCK record, once the server sends them
+
+    def decode(self, data):
+        """Decode a bytes-like object holding a whole number of records."""
+        messages = []
+        symbols = self.symbols
+        for offset, fields in zip(range(0, len(data), RECORD_SIZE), RECORD.iter_unpack(data)):
+            kind = fields[0]
+            if kind == RECORD_SYMBOL:
+                _, symbol_id, name = SYMBOL.unpack_from(data, offset)
+                symbols[symbol_id] = name.rstrip(b"\0").decode("utf-8")
+                continue
+            if kind == RECORD_CLOCK:
+                self.server_time = fields[2]
+                continue
+            if kind in REPORT_TYPES:
+                messages.append({
+                    "Type": REPORT_TYPES[kind],
+                    "Symbol": symbols.get(fields[1], str(fields[1])),
+                    "OrderID": fields[2],
+                    "Quantity": fields[3],
+                    "Price": fields[4],
+                    "Side": fields[5].decode("ascii"),
+                    "Status": fields[6].decode("ascii"),
+                    "Timestamp": fields[9],
+                })
+                continue
+            messages.append({
+                "Symbol": symbols.get(fields[1], str(fields[1])),
+                "OrderID": fields[2],
+                "Quantity": fields[3],
+                "Price": fields[4],
+                "Side": fields[5].decode("ascii"),
+                "Action": fields[6].decode("ascii"),
+                "Exchange": fields[7],
+                "News": fields[8],
+                "Timestamp": fields[9],
+            })
+            if self.server_time is not None:
+                messages[-1]["ServerTime"] = self.server_time
+        return messages